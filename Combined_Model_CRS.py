@@ -1,43 +1,62 @@
-from openai import OpenAI
-import faiss
 import ast
-from sklearn.feature_extraction.text import TfidfVectorizer
-import pandas as pd
-import numpy as np
-from tqdm import tqdm
-import os
-
-#Initialize the OpenAI client using Your OWN OpenAI API Key please
-client = OpenAI(api_key='Your OpenAI API Key')
-
-#Load metadata of 26k Laptops from Amazon Dataset
-metadata = pd.read_csv('metadata_cleaned.csv', sep=';')
-metadata = metadata.dropna(subset=['title', 'description', 'features'])
-#Combine title, description and features into one to create a combined text data for each laptop
-metadata['combined_text'] = (
-    metadata['title'].astype(str) + ' ' +
-    metadata['description'].astype(str) + ' ' +
-    metadata['features'].astype(str)
-)
-
-#Vectorize the metadata for RAG
-texts = metadata['combined_text'].tolist()
-print("Vectorizing data...")
-vectorizer = TfidfVectorizer()
-vectors = vectorizer.fit_transform(tqdm(texts)).toarray()
-
-#Build or use FAISS index for RAG (Build it for the first time, use the saved file to use it again so the process will be faster)
-if os.path.exists("faiss_index_new.bin"):
-    index = faiss.read_index("faiss_index_new.bin")
-else:
-    index = faiss.IndexFlatL2(vectors.shape[1]) #Create a new FAISS Index
-    index.add(np.array(vectors).astype(np.float32)) #Add the vectors to the index
-    faiss.write_index(index, "faiss_index_new.bin") #Save the index for future use
+import threading
+from llm_cache import LLMCache, CachedClient
+from instrumentation import InstrumentedClient, timed
+from llm_scheduler import ScheduledClient, shared_client
+from structured_turn import RESPONSE_FORMAT, turn_messages, parse_turn
+from retrieval_cache import RetrievalCache
+from context_packing import CONTEXT_TOKEN_BUDGET, pack_context, prompt_tokens
 
-#Function to extract laptop specifications using ChatGPT prompt engineering
-def extract_specs(user_input, existing_preferences=None):
-    #Initialize existing_preferences for a place to store the prefrences that have already been said, and also to add preferences that the user will say
-    existing_preferences = existing_preferences or {}
+#OpenAI client, created on first use (or by warmup) so importing this module does not import openai, set it to another client (e.g. the fake one) before the first request to use that one
+client = None
+#The Fine-Tuned GPT-4o Model that we have trained to recommend laptops
+FINE_TUNED_MODEL = "ft:gpt-4o-2024-08-06:personal::AW1N4XJq"
+#Ask for the merged preferences and the next question in one structured request per turn, instead of extract_specs followed by query_missing_specs
+STRUCTURED_TURNS = True
+
+#Retrieval backend, "sparse" keeps the TF-IDF matrix in CSR format, "faiss" is the dense FAISS IndexFlatL2 path
+RETRIEVAL_BACKEND = "sparse"
+#Number of indexes the catalog is split into (every search is fanned out to all of them), and of processes that vectorize the catalog when the index is built
+INDEX_SHARDS = 1
+BUILD_WORKERS = None
+
+#Retriever for RAG over the metadata of 26k Laptops from Amazon Dataset, loaded on first use (or by warmup)
+retriever = None
+#Top-k laptops of the preferences that were already searched, preferences that only differ in how they are written (aliases, units, budgets in the same band) share one entry
+retrieval_cache = None
+loading = threading.Lock()
+
+#Function to create the OpenAI client the first time it is needed
+def get_client():
+    global client
+    if client is None:
+        with loading:
+            if client is None:
+                #Identical requests (same model, messages and sampling settings) are answered from the LLM cache in memory or in llm_cache.sqlite instead of calling the API again
+                #The others wait for the process-wide scheduler, which keeps every pipeline within the rate limits of the account and retries throttled requests
+                client = CachedClient(ScheduledClient(InstrumentedClient(shared_client())), LLMCache('llm_cache.sqlite'))
+    return client
+
+#Function to load the retriever the first time it is needed, every later call gives back the same one
+#The fitted vocabulary, the index and the laptop texts are saved in retrieval_artifact/ and only rebuilt when metadata_cleaned.csv or the settings change
+def load_retriever():
+    global retriever, retrieval_cache
+    if retriever is None:
+        with loading:
+            if retriever is None:
+                #sklearn, scipy and faiss are only imported with the retriever
+                from retrieval import load_or_build_retriever
+                retrieval_cache = RetrievalCache(load_or_build_retriever('metadata_cleaned.csv', backend=RETRIEVAL_BACKEND, index_params={"shards": INDEX_SHARDS}, workers=BUILD_WORKERS))
+                retriever = retrieval_cache.retriever
+    return retriever
+
+#Function to create the client, load the retriever and run one search ahead of the first user, so the first recommendation does not pay for them
+def warmup():
+    get_client()
+    load_retriever().search_ids(["laptop"], 1)
+
+#Function to build the messages that extract the laptop specifications, shared with the asyncio conversation engine
+def extract_specs_messages(user_input, existing_preferences):
     #Prompt to send to the Fine-Tunend GPT-4o model to extract the specifications from the users input and also to keep track of the existing preferences
     prompt = f"""
     User has provided the following laptop specifications so far: {existing_preferences}.
@@ -47,48 +66,132 @@ def extract_specs(user_input, existing_preferences=None):
     Merge the extracted specifications with the existing specs, and return a valid Python dictionary with all keys lowercased.
     Do not include any extra text or explanations.
     """
-    #Send a request to Fine-Tuned GPT-4o model to run the prompt
-    response = client.chat.completions.create(
-        model="ft:gpt-4o-2024-08-06:personal::AW1N4XJq", #Use the Fine-Tuned GPT-4o Model that we have trained to recommend laptops
-        messages=[
-            {"role": "system", "content": "You are a knowledgeable assistant extracting laptop specifications from user input."},
-            {"role": "user", "content": prompt},
-        ],
-    )
-    #Parse the response into a Python dictionary, handle errors by returning the existing prefrences
+    return [
+        {"role": "system", "content": "You are a knowledgeable assistant extracting laptop specifications from user input."},
+        {"role": "user", "content": prompt},
+    ]
+
+#Function to parse the extracted specifications into a Python dictionary, handle errors by returning the existing prefrences
+@timed("parse_specs")
+def parse_specs(content, existing_preferences):
     try:
-        specs_dict = ast.literal_eval(response.choices[0].message.content.strip())
+        specs_dict = ast.literal_eval(content.strip())
         return specs_dict
     except Exception as e:
         print("Error parsing response:", e)
         return existing_preferences
-#Function to create a response from Fine-Tuned GPT-4o Model to seek missing specifications from the user
-def query_missing_specs(preferences, missing_specs):
+
+#Function to extract laptop specifications using ChatGPT prompt engineering
+@timed("extract_specs")
+def extract_specs(user_input, existing_preferences=None):
+    #Initialize existing_preferences for a place to store the prefrences that have already been said, and also to add preferences that the user will say
+    existing_preferences = existing_preferences or {}
+    #Send a request to Fine-Tuned GPT-4o model to run the prompt
+    response = get_client().chat.completions.create(
+        model=FINE_TUNED_MODEL, #Use the Fine-Tuned GPT-4o Model that we have trained to recommend laptops
+        messages=extract_specs_messages(user_input, existing_preferences),
+    )
+    return parse_specs(response.choices[0].message.content, existing_preferences)
+
+#Function to build the messages that seek missing specifications from the user
+def missing_specs_messages(preferences, missing_specs):
     #Prompt to guide the Fine-Tuned GPT-4o Model to generate a natural sounding response to seek missing specifications from the user
     prompt = f"""
     User's current preferences are: {preferences}.
     The assistant needs to ask the user about their {missing_specs}.
     Generate a natural-sounding query for this.
     """
+    return [
+        {"role": "system", "content": "You are an assistant designed to ask users for missing specifications in a natural tone."},
+        {"role": "user", "content": prompt},
+    ]
+
+#Function to create a response from Fine-Tuned GPT-4o Model to seek missing specifications from the user
+@timed("query_missing_specs")
+def query_missing_specs(preferences, missing_specs):
     #Send a request to Fine-Tuned GPT-4o model to run the prompt
-    response = client.chat.completions.create(
-        model="ft:gpt-4o-2024-08-06:personal::AW1N4XJq",
-        messages=[
-            {"role": "system", "content": "You are an assistant designed to ask users for missing specifications in a natural tone."},
-            {"role": "user", "content": prompt},
-        ],
-    )
+    response = get_client().chat.completions.create(model=FINE_TUNED_MODEL, messages=missing_specs_messages(preferences, missing_specs))
     #Extract the models response and return it as a string
     return response.choices[0].message.content.strip()
 
+#Function to get the laptops that meet the hard constraints of the user (budget, RAM, brand, ...), None (the whole catalog) if nothing meets all of them
+def candidate_ids(preferences):
+    allowed_ids = load_retriever().specs.candidate_ids(preferences)
+    return None if allowed_ids is not None and len(allowed_ids) == 0 else allowed_ids
+
 #Function to Retrieve context, aka the best laptops for recommendation depending on the context 
-def retrieve_context(query, k=5):
-    #Convert the overal query into a TF-IDF vector representation
-    query_vector = vectorizer.transform([query]).toarray().astype(np.float32)
-    #Perform index search in the FAISS index, distances show us the similarity score, while indices gives us the indexes of the closest laptop matches
-    distances, indices = index.search(query_vector, k)
-    #Retrieve the data from the indexes found during the FAISS index search, texts[i] provides us the text and distances[0][j] provide us the similarity score
-    return [(texts[i], distances[0][j]) for j, i in enumerate(indices[0])]
+@timed("retrieval")
+def retrieve_context(query, k=5, preferences=None):
+    #Search the closest laptop matches for the query, gives back (record, score) tuples where a lower score means a closer match
+    return load_retriever().retrieve_records(query, k, candidate_ids(preferences))
+
+#Function to Retrieve context for many queries at once (evaluation or bulk recommendation jobs), gives back one list of (record, score) tuples per query
+def retrieve_context_batch(queries, k=5):
+    return load_retriever().retrieve_records_batch(queries, k)
+
+#Function to extract the laptop specifications and generate the next question in one structured request, gives back the merged preferences, the question and the spec it asks about
+@timed("structured_turn")
+def extract_specs_and_question(user_input, existing_preferences=None, already_asked=()):
+    existing_preferences = existing_preferences or {}
+    #Send a request to Fine-Tuned GPT-4o model to run the prompt, the response has to follow the JSON schema of the turn
+    response = get_client().chat.completions.create(
+        model=FINE_TUNED_MODEL,
+        messages=turn_messages(user_input, existing_preferences, already_asked),
+        response_format=RESPONSE_FORMAT,
+    )
+    return parse_turn(response.choices[0].message.content, existing_preferences, already_asked)
+
+#Function to generate the overall query for RAG to search the laptop
+def preferences_query(preferences):
+    return " ".join([f"{key}: {value}" for key, value in preferences.items() if value])
+
+#Function to Retrieve context for the preferences of the user, repeated preferences are answered from the retrieval cache without vectorizing or searching
+@timed("retrieval")
+def retrieve_for_preferences(preferences, k=30):
+    load_retriever()
+    return retrieval_cache.retrieve(preferences, k, preferences_query, candidate_ids)
+
+#Function to Retrieve context for many preferences at once (bulk recommendation jobs), gives back one list of (record, score) tuples per preferences
+def retrieve_for_preferences_batch(preferences_list, k=30):
+    load_retriever()
+    return retrieval_cache.retrieve_batch(preferences_list, k, preferences_query, candidate_ids)
+
+#Function to build the messages that ask for the Top-N laptops with reasoning for each laptop out of the retrieved laptops
+def ranking_messages(preferences, rag_texts):
+    #We create a prompt to guide the Fine-Tuned GPT-4o Moel to generate the Top-N laptops with reasoning for each laptop based on the users preferences
+    prompt = f"""
+    Based on the following user preferences: {preferences},
+    and the retrieved results from the database:
+    {rag_texts}
+    Provide a ranked list of exactly 5 laptop recommendations.
+    For each recommendation, include:
+    - Laptop title
+    - Specifications (RAM, processor, storage, etc.)
+    - Reasoning: Why this laptop is suitable based on the user's preferences.
+    """
+    return [
+        {"role": "system", "content": "You are an expert laptop advisor providing recommendations based on retrieval results."},
+        {"role": "user", "content": prompt},
+    ]
+
+#Function to recommend the Top-N laptops: retrieve the best laptops for the preferences and let the Fine-Tuned GPT-4o model rank them with reasoning for each laptop
+@timed("recommend")
+def recommend_from_preferences(preferences, verbose=True):
+    #Retrieve the best laptops, prefereably more than needed so that the Fine-Tuned GPT-4o model can choose the best laptops that the RAG model offers
+    #The overall query for RAG is only generated and searched when the preferences are not in the retrieval cache
+    rag_results = retrieve_for_preferences(preferences, k=30)
+
+    #Pack the rag_results into one rag_texts: near-identical laptops are dropped and the descriptions are shortened until they fit CONTEXT_TOKEN_BUDGET
+    rag_texts, packing = pack_context(rag_results, CONTEXT_TOKEN_BUDGET)
+    messages = ranking_messages(preferences, rag_texts)
+    if verbose:
+        unpacked_tokens = prompt_tokens(ranking_messages(preferences, "\n".join([record.text() for record, _ in rag_results])))
+        print(f"(Context: {packing['laptops_kept']} of {packing['laptops_retrieved']} laptops, {packing['duplicates_dropped']} duplicates dropped, "
+              f"prompt tokens {unpacked_tokens} -> {prompt_tokens(messages)})")
+    #Use GPT-4o to take the Top-N Laptops with recommendation reasoning for each laptops, send a request to Fine-Tuned GPT-4o model to run the prompt
+    response = get_client().chat.completions.create(model=FINE_TUNED_MODEL, messages=messages)
+    #Extract the models response with the Top-N recommended Laptops for the user based on their specifications and needs
+    return response.choices[0].message.content.strip()
 
 #Function to format the recommendations so it looks cleaner at the end
 def format_recommendation(title, descriptions, specs):
@@ -115,7 +218,11 @@ def recommend_laptop_combined_model():
     i = 0 #i variable to keep the CRS from querying missing specs one more time than needed
     for _ in range(3): #3 interactions between user and LaptopGPT
         user_input = input("User: ") #Get the user input
-        preferences = extract_specs(user_input, preferences) #Extract user preferences from users input
+        #Extract user preferences from users input, in the structured mode the same request also writes the next question
+        if STRUCTURED_TURNS:
+            preferences, question, asked_spec = extract_specs_and_question(user_input, preferences, already_asked)
+        else:
+            preferences, question, asked_spec = extract_specs(user_input, preferences), None, None
         print(f"LaptopGPT: Your preferences so far:\n{preferences}") #Show the current preferences captured by the CRS
 
         missing_specs = [spec for spec in key_specs if spec not in preferences and spec not in already_asked] #Find any missing specifications that have not been collected
@@ -125,40 +232,21 @@ def recommend_laptop_combined_model():
         #If the CRS hasn't asked the user twice about their specifications (So in total it would be 3 inputs from the user), ask the user for more information 
         if i < 2:
             if missing_specs:
-                next_spec = missing_specs[0] #Search for the next missing specification
-                already_asked.add(next_spec)  #Mark this specification as it has been asked
-                query = query_missing_specs(preferences, next_spec) #Craete a response from the CRS model to seek missing specifications from the user
+                if question:
+                    #The structured turn already wrote the question, mark the specification it asks about
+                    already_asked.add(asked_spec)
+                    query = question
+                else:
+                    next_spec = missing_specs[0] #Search for the next missing specification
+                    already_asked.add(next_spec)  #Mark this specification as it has been asked
+                    query = query_missing_specs(preferences, next_spec) #Craete a response from the CRS model to seek missing specifications from the user
                 print(f"LaptopGPT: {query}") #Print out the response to show to the user
                 i += 1
 
-    #Generate the overall query for RAG to search the laptop
-    query = " ".join([f"{key}: {value}" for key, value in preferences.items() if value])
-    #Retrieve the best laptops, prefereably more than needed so that the Fine-Tuned GPT-4o model can choose the best laptops that the RAG model offers
-    rag_results = retrieve_context(query, k=30)
-    
-    #Use GPT-4o to take the Top-N Laptops with recommendation reasoning for each laptops, first we combine the rag_results into one rag_texts
-    rag_texts = "\n".join([text for text, _ in rag_results])
-    #Then we create a prompt to guide the Fine-Tuned GPT-4o Moel to generate the Top-N laptops with reasoning for each laptop based on the users preferences
-    prompt = f"""
-    Based on the following user preferences: {preferences},
-    and the retrieved results from the database:
-    {rag_texts}
-    Provide a ranked list of exactly 5 laptop recommendations.
-    For each recommendation, include:
-    - Laptop title
-    - Specifications (RAM, processor, storage, etc.)
-    - Reasoning: Why this laptop is suitable based on the user's preferences.
-    """
-    #Send a request to Fine-Tuned GPT-4o model to run the prompt
-    response = client.chat.completions.create(
-        model="ft:gpt-4o-2024-08-06:personal::AW1N4XJq",
-        messages=[
-            {"role": "system", "content": "You are an expert laptop advisor providing recommendations based on retrieval results."},
-            {"role": "user", "content": prompt},
-        ],
-    )
-    #Extract the models response and print it to show to the user the Top-N recommended Laptops for them based on their specifications and needs
+    recommendations = recommend_from_preferences(preferences)
     print("LaptopGPT: Here are my top recommendations for you:\n")
-    print(response.choices[0].message.content.strip())
+    print(recommendations)
 
-recommend_laptop_combined_model()
\ No newline at end of file
+if __name__ == "__main__":
+    warmup()
+    recommend_laptop_combined_model()
\ No newline at end of file
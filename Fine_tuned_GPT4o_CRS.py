@@ -1,13 +1,53 @@
-from openai import OpenAI
 import ast
+import re
+import threading
+from llm_cache import LLMCache, CachedClient
+from instrumentation import InstrumentedClient, timed
+from llm_scheduler import ScheduledClient, shared_client
+from structured_turn import RESPONSE_FORMAT, turn_messages, parse_turn
 
-#Initialize the OpenAI client using Your OWN OpenAI API Key please
-client = OpenAI(api_key='Your OpenAI API Key')
+#OpenAI client, created on first use (or by warmup) so importing this module does not import openai, set it to another client (e.g. the fake one) before the first request to use that one
+client = None
+#The Fine-Tuned GPT-4o Model that we have trained to recommend laptops
+FINE_TUNED_MODEL = "ft:gpt-4o-2024-08-06:personal::AW1N4XJq"
+#Ask for the merged preferences and the next question in one structured request per turn, instead of extract_specs followed by query_missing_specs
+STRUCTURED_TURNS = True
+#Local spec-match scorer over the laptops of laptops.csv, the Top-N recommendations are ranked with it, loaded on first use (or by warmup)
+scorer = None
+loading = threading.Lock()
+#Tokens the model may write per recommended laptop, enough for a one sentence explanation
+EXPLANATION_TOKENS = 60
+#Numbered lines of the explanations written by the model
+EXPLANATION_LINE = re.compile(r"^\s*\**\s*(\d+)[.)]\**\s*(.+)$")
 
-#Function to extract laptop specifications using ChatGPT prompt engineering
-def extract_specs(user_input, existing_preferences=None):
-    #Initialize existing_preferences for a place to store the prefrences that have already been said, and also to add preferences that the user will say
-    existing_preferences = existing_preferences or {}
+#Function to create the OpenAI client the first time it is needed
+def get_client():
+    global client
+    if client is None:
+        with loading:
+            if client is None:
+                #Identical requests (same model, messages and sampling settings) are answered from the LLM cache in memory or in llm_cache.sqlite instead of calling the API again
+                #The others wait for the process-wide scheduler, which keeps every pipeline within the rate limits of the account and retries throttled requests
+                client = CachedClient(ScheduledClient(InstrumentedClient(shared_client())), LLMCache('llm_cache.sqlite'))
+    return client
+
+#Function to read the laptops of laptops.csv into the scorer the first time it is needed, pandas is only imported then
+def load_scorer():
+    global scorer
+    if scorer is None:
+        with loading:
+            if scorer is None:
+                from spec_scorer import SpecScorer
+                scorer = SpecScorer.from_laptops_csv('laptops.csv')
+    return scorer
+
+#Function to create the client and load the scorer ahead of the first user, so the first recommendation does not pay for them
+def warmup():
+    get_client()
+    load_scorer()
+
+#Function to build the messages that extract the laptop specifications, shared with the asyncio conversation engine
+def extract_specs_messages(user_input, existing_preferences):
     #Prompt to send to the Fine-Tunend GPT-4o model to extract the specifications from the users input and also to keep track of the existing preferences
     prompt = f"""
     User has provided the following laptop specifications so far: {existing_preferences}.
@@ -15,41 +55,66 @@ def extract_specs(user_input, existing_preferences=None):
     Please extract specifications such as brand, budget, RAM, processor, storage, graphics card, and purpose from the latest input, and merge them with the existing specs.
     Provide the response as a Python dictionary.
     """
-    #Send a request to Fine-Tuned GPT-4o model to run the prompt
-    response = client.chat.completions.create(
-        model="ft:gpt-4o-2024-08-06:personal::AW1N4XJq", #Use the Fine-Tuned GPT-4o Model that we have trained to recommend laptops
-        messages=[
-            {"role": "system", "content": "You are a knowledgeable assistant extracting laptop specifications from user input."},
-            {"role": "user", "content": prompt},
-        ],
-    )
-    #Parse the response into a Python dictionary, handle errors by returning the existing prefrences
+    return [
+        {"role": "system", "content": "You are a knowledgeable assistant extracting laptop specifications from user input."},
+        {"role": "user", "content": prompt},
+    ]
+
+#Function to parse the extracted specifications into a Python dictionary, handle errors by returning the existing prefrences
+@timed("parse_specs")
+def parse_specs(content, existing_preferences):
     try:
-        specs_dict = ast.literal_eval(response.choices[0].message.content.strip())
+        specs_dict = ast.literal_eval(content.strip())
         return specs_dict
     except Exception as e:
         print("Error parsing response:", e)
         return existing_preferences
 
-#Function to create a response from Fine-Tuned GPT-4o Model to seek missing specifications from the user
-def query_missing_specs(preferences, missing_specs):
+#Function to extract laptop specifications using ChatGPT prompt engineering
+@timed("extract_specs")
+def extract_specs(user_input, existing_preferences=None):
+    #Initialize existing_preferences for a place to store the prefrences that have already been said, and also to add preferences that the user will say
+    existing_preferences = existing_preferences or {}
+    #Send a request to Fine-Tuned GPT-4o model to run the prompt
+    response = get_client().chat.completions.create(
+        model=FINE_TUNED_MODEL, #Use the Fine-Tuned GPT-4o Model that we have trained to recommend laptops
+        messages=extract_specs_messages(user_input, existing_preferences),
+    )
+    return parse_specs(response.choices[0].message.content, existing_preferences)
+
+#Function to build the messages that seek missing specifications from the user
+def missing_specs_messages(preferences, missing_specs):
     #Prompt to guide the Fine-Tuned GPT-4o Model to generate a natural sounding response to seek missing specifications from the user
     prompt = f"""
     User's current preferences are: {preferences}.
     The assistant needs to ask the user about their {missing_specs}.
     Generate a natural-sounding query for this.
     """
+    return [
+        {"role": "system", "content": "You are an assistant designed to ask users for missing specifications in a natural tone."},
+        {"role": "user", "content": prompt},
+    ]
+
+#Function to create a response from Fine-Tuned GPT-4o Model to seek missing specifications from the user
+@timed("query_missing_specs")
+def query_missing_specs(preferences, missing_specs):
     #Send a request to Fine-Tuned GPT-4o model to run the prompt
-    response = client.chat.completions.create(
-        model="ft:gpt-4o-2024-08-06:personal::AW1N4XJq",
-        messages=[
-            {"role": "system", "content": "You are an assistant designed to ask users for missing specifications in a natural tone."},
-            {"role": "user", "content": prompt},
-        ],
-    )
+    response = get_client().chat.completions.create(model=FINE_TUNED_MODEL, messages=missing_specs_messages(preferences, missing_specs))
     #Extract the models response and return it as a string
     return response.choices[0].message.content.strip()
 
+#Function to extract the laptop specifications and generate the next question in one structured request, gives back the merged preferences, the question and the spec it asks about
+@timed("structured_turn")
+def extract_specs_and_question(user_input, existing_preferences=None, already_asked=()):
+    existing_preferences = existing_preferences or {}
+    #Send a request to Fine-Tuned GPT-4o model to run the prompt, the response has to follow the JSON schema of the turn
+    response = get_client().chat.completions.create(
+        model=FINE_TUNED_MODEL,
+        messages=turn_messages(user_input, existing_preferences, already_asked),
+        response_format=RESPONSE_FORMAT,
+    )
+    return parse_turn(response.choices[0].message.content, existing_preferences, already_asked)
+
 #Function to format the user's prefrences into a numbered list for readability
 def format_preferences(preferences):
     #Clean up the preferences into a formatted string where each preference is displayed as "1. Key: Value" until the last preference so the user can see what preferences are captured by the model
@@ -57,25 +122,52 @@ def format_preferences(preferences):
     #Returns the final formatted preferences
     return f"Here are your preferences so far:\n{formatted}"
 
-#Function to recommend a ranked list of the Top-N laptops based on the users' prefereces
-def recommend_laptops_top_n(preferences, top_n=5):
-    #Prompt to guide the Fine-Tuned GPT-4o Model to generate a list of Top-N laptops based on the users preferencs
+#Function to rank the Top-N laptops of laptops.csv for the users preferences with the local spec-match scorer, gives back (title, specifications, score) tuples
+@timed("spec_score")
+def rank_laptops(preferences, top_n=5):
+    scorer = load_scorer()
+    return [(scorer.titles[row], scorer.describe(row), score) for row, score in scorer.top_n(preferences, top_n)]
+
+#Function to write the ranked laptops as a numbered list
+def ranked_list(ranked):
+    return "\n".join(f"{i + 1}. {title} ({specs})" for i, (title, specs, _) in enumerate(ranked))
+
+#Function to build the messages that ask for an explanation of every ranked laptop
+def top_n_messages(preferences, ranked):
+    #Prompt to guide the Fine-Tuned GPT-4o Model to explain the laptops that were already ranked, instead of coming up with a Top-N list itself
     prompt = f"""
     User's preferences: {preferences}.
-    Provide a ranked list of the top {top_n} laptop recommendations based on how closely they match the user's preferences.
-    Include the laptop details and explain why each one was chosen.
-    Allow partial matches and prioritize the closest options.
+    These laptops from our catalog were ranked for the user, best match first:
+{ranked_list(ranked)}
+    For each laptop, write one line that starts with its number and explains in one sentence why it fits the user's preferences.
+    Keep the order and do not add other laptops.
     """
-    #Send a request to Fine-Tuned GPT-4o model to run the prompt
-    response = client.chat.completions.create(
-        model="ft:gpt-4o-2024-08-06:personal::AW1N4XJq",
-        messages=[
-            {"role": "system", "content": "You are an expert laptop advisor providing personalized recommendations."},
-            {"role": "user", "content": prompt},
-        ],
+    return [
+        {"role": "system", "content": "You are an expert laptop advisor explaining ranked laptop recommendations."},
+        {"role": "user", "content": prompt},
+    ]
+
+#Function to put the ranked laptops and the explanations of the model together, a laptop the model did not explain gets its match score as the reason
+def format_recommendations(ranked, explanations):
+    reasons = {}
+    for line in explanations.splitlines():
+        match = EXPLANATION_LINE.match(line)
+        if match:
+            reasons.setdefault(int(match.group(1)), match.group(2).strip())
+    return "\n".join(
+        f"{i + 1}. {title}\nSpecifications: {specs}\nReasoning: {reasons.get(i + 1) or f'Matches {score:.0%} of your specifications.'}"
+        for i, (title, specs, score) in enumerate(ranked)
     )
-    #Extract the models response into a string to send back to the user
-    return response.choices[0].message.content.strip()
+
+#Function to recommend a ranked list of the Top-N laptops based on the users' prefereces
+#The laptops are ranked locally, so the same preferences always give the same laptops and every one of them is in the catalog, the model only explains them
+@timed("recommend")
+def recommend_laptops_top_n(preferences, top_n=5):
+    ranked = rank_laptops(preferences, top_n)
+    #Send a request to Fine-Tuned GPT-4o model to run the prompt, it only has to write one short line per laptop
+    response = get_client().chat.completions.create(model=FINE_TUNED_MODEL, messages=top_n_messages(preferences, ranked), max_tokens=EXPLANATION_TOKENS * top_n)
+    #Put the explanations of the model next to the ranked laptops to send back to the user
+    return format_recommendations(ranked, response.choices[0].message.content)
 
 #Function for the Fine-Tuned GPT-4o Model Only CRS
 def recommend_laptop_fine_tuned_gpt4o_only():
@@ -92,7 +184,11 @@ def recommend_laptop_fine_tuned_gpt4o_only():
     i = 0 #i variable to keep the CRS from querying missing specs one more time than needed
     for _ in range(3): #3 interactions between user and LaptopGPT
         user_input = input("User: ") #Get the user input
-        preferences = extract_specs(user_input, preferences) #Extract user preferences from users input
+        #Extract user preferences from users input, in the structured mode the same request also writes the next question
+        if STRUCTURED_TURNS:
+            preferences, question, _ = extract_specs_and_question(user_input, preferences)
+        else:
+            preferences, question = extract_specs(user_input, preferences), None
         formatted_preferences = format_preferences(preferences) #Format the preferences 
         print(f"LaptopGPT: {formatted_preferences}") #Show the current preferences captured by the Fine-Tuned GPT-4o Model to the user
         
@@ -100,7 +196,7 @@ def recommend_laptop_fine_tuned_gpt4o_only():
         if not missing_specs or len(preferences) >= 5: #If enough specifications are collected (5 or more, this can be adjusted based on how specific we want the laptops recommended to the user be), break from the loop and give out the recommendation
             break
         if i < 2: #If the CRS hasn't asked the user twice about their specifications (So in total it would be 3 inputs from the user), ask the user for more information 
-            query = query_missing_specs(preferences, missing_specs[0])  #Craete a response from the CRS model to seek missing specifications from the user
+            query = question or query_missing_specs(preferences, missing_specs[0])  #Craete a response from the CRS model to seek missing specifications from the user
             print(f"LaptopGPT: {query}") #Print out the response to show to the user
             i += 1
     top_n = 5 #Amount of laptops being recommended
@@ -109,4 +205,6 @@ def recommend_laptop_fine_tuned_gpt4o_only():
     print(f"LaptopGPT: Here are my top-{top_n} recommendations for you:\n")
     print(recommendations_text)
 
-recommend_laptop_fine_tuned_gpt4o_only()
\ No newline at end of file
+if __name__ == "__main__":
+    warmup()
+    recommend_laptop_fine_tuned_gpt4o_only()
\ No newline at end of file
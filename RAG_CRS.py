@@ -1,138 +1,70 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-import faiss
 import random
-import pandas as pd
+import threading
 import numpy as np
-from tqdm import tqdm
-from sklearn.feature_extraction.text import TfidfVectorizer
-import numpy as np
-import os
+from retrieval_cache import RetrievalCache
+from preference_extractor import extract_preferences
+from instrumentation import timed
+
+#Retrieval backend, "sparse" keeps the TF-IDF matrix in CSR format, "faiss" is the dense FAISS IndexFlatL2 path
+RETRIEVAL_BACKEND = "sparse"
+#Number of indexes the catalog is split into (every search is fanned out to all of them), and of processes that vectorize the catalog when the index is built
+INDEX_SHARDS = 1
+BUILD_WORKERS = None
+
+#Retriever for RAG over the metadata of 26k Laptops from Amazon Dataset, loaded on first use (or by warmup) so importing this module stays fast
+retriever = None
+#Top-k laptops of the preferences that were already searched, preferences that only differ in how they are written (aliases, units, budgets in the same band) share one entry
+retrieval_cache = None
+loading = threading.Lock()
 
-#Load metadata of 26k Laptops from Amazon Dataset
-metadata = pd.read_csv('metadata_cleaned.csv', sep=';')
-metadata = metadata.dropna(subset=['title', 'description', 'features'])
-#Combine title, description and features into one to create a combined text data for each laptop
-metadata['combined_text'] = (
-    metadata['title'].astype(str) + ' ' +
-    metadata['description'].astype(str) + ' ' +
-    metadata['features'].astype(str)
-)
+#Function to load the retriever the first time it is needed, every later call gives back the same one
+#The fitted vocabulary, the index and the laptop texts are saved in retrieval_artifact/ and only rebuilt when metadata_cleaned.csv or the settings change
+def load_retriever():
+    global retriever, retrieval_cache
+    if retriever is None:
+        with loading:
+            if retriever is None:
+                #sklearn, scipy and faiss are only imported with the retriever
+                from retrieval import load_or_build_retriever
+                retrieval_cache = RetrievalCache(load_or_build_retriever('metadata_cleaned.csv', backend=RETRIEVAL_BACKEND, index_params={"shards": INDEX_SHARDS}, workers=BUILD_WORKERS))
+                retriever = retrieval_cache.retriever
+    return retriever
 
-#Vectorize the metadata for RAG
-texts = metadata['combined_text'].tolist()
-print("Vectorizing data...")
-vectorizer = TfidfVectorizer()
-vectors = vectorizer.fit_transform(tqdm(texts)).toarray()
+#Function to load the retriever and run one search ahead of the first user, so the first recommendation does not pay for loading the artifact and paging in the index
+def warmup():
+    load_retriever().search_ids(["laptop"], 1, complete_ids())
 
-#Build or use FAISS index for RAG (Build it for the first time, use the saved file to use it again so the process will be faster)
-if os.path.exists("faiss_index_new.bin"):
-    index = faiss.read_index("faiss_index_new.bin")
-else:
-    index = faiss.IndexFlatL2(vectors.shape[1]) #Create a new FAISS Index
-    index.add(np.array(vectors).astype(np.float32)) #Add the vectors to the index
-    faiss.write_index(index, "faiss_index_new.bin") #Save the index for future use
+#The RAG CRS only recommends laptops that have both a description and a feature list, so the others are left out of the search up front
+#The record store keeps the ids until laptops are added by a catalog update
+def complete_ids():
+    return load_retriever().records.complete_ids()
+
+#Function to get the laptops the search is restricted to: the complete ones that meet the hard constraints of the user (budget, RAM, brand, ...), if nothing meets all of them the complete ones of the whole catalog
+def candidate_ids(preferences):
+    allowed_ids = load_retriever().specs.candidate_ids(preferences)
+    allowed_ids = complete_ids() if allowed_ids is None else np.intersect1d(allowed_ids, complete_ids())
+    return complete_ids() if len(allowed_ids) == 0 else allowed_ids
 
 #Function to Retrieve context, aka the best laptops for recommendation depending on the context 
-def retrieve_context(query, k=5):
-    #Convert the overal query into a TF-IDF vector representation
-    query_vector = vectorizer.transform([query]).toarray().astype(np.float32)
-    #Perform index search in the FAISS index, distances show us the similarity score, while indices gives us the indexes of the closest laptop matches
-    distances, indices = index.search(query_vector, k)
-    #Retrieve the data from the indexes found during the FAISS index search, texts[i] provides us the text and distances[0][j] provide us the similarity score
-    return [(texts[i], distances[0][j]) for j, i in enumerate(indices[0])]
+@timed("retrieval")
+def retrieve_context(query, k=5, preferences=None):
+    #Search the closest laptop matches for the query, gives back (record, score) tuples where a lower score means a closer match
+    return load_retriever().retrieve_records(query, k, candidate_ids(preferences))
 
-#Function to extract the prefernces from the user input
-def extract_preferences(user_input, preferences):
-    user_input = user_input.lower() #Make the user input lowercase
-    
-    #Getting the important specifications of laptop that the user would want from their input
-    #Checking if there is a specific brand of laptop the user wants for the laptop
-    if "brand" in user_input or any(brand in user_input for brand in ["dell", "lenovo", "hp", "asus", "acer", "apple", "microsoft", "samsung", "msi", "lg", "razer", "huawei"]):
-        preferences["brand"] = next((word.capitalize() for word in user_input.split() if word in [
-            "dell", "lenovo", "hp", "asus", "acer", "apple", "microsoft", "samsung", "msi", "lg", "razer", "huawei"
-        ]), preferences.get("brand"))
-    #Checking if there is a specific RAM the user wants for the laptop
-    if "ram" in user_input:
-        preferences["ram"] = next((word for word in user_input.split() if "gb" in word), preferences.get("ram"))
-    #Checking if there is a specific Processor the user wants for the laptop
-    if "processor" in user_input or "cpu" in user_input:
-        preferences["processor"] = next((word.capitalize() for word in user_input.split() if word in [
-            "i3", "i5", "i7", "i9", "ryzen", "amd", "intel", "m1", "m2"
-        ]), preferences.get("processor"))
-    #Checking if there is a specific type of GPU the user wants for the laptop
-    if "gpu" in user_input or "graphics" in user_input:
-        preferences["gpu_brand"] = next((word.capitalize() for word in user_input.split() if word in [
-            "nvidia", "amd", "intel", "rtx", "gtx", "vega"
-        ]), preferences.get("gpu_brand"))
-    #Checking if there is a specific storage capacity the user wants for the laptop
-    if "storage" in user_input or "hard drive" in user_input:
-        preferences["storage_capacity"] = next((word for word in user_input.split() if "gb" in word or "tb" in word), preferences.get("storage_capacity"))
-    #Checking if there is a specific ssd that the user has in mind for the laptop
-    if "ssd" in user_input or "hdd" in user_input:
-        preferences["storage_type"] = "SSD" if "ssd" in user_input else "HDD"
-    #Checking if there is a specific budget the user has for the laptop
-    if "budget" in user_input or "price" in user_input:
-        preferences["price"] = next((word for word in user_input.split() if "$" in word or word.isdigit()), preferences.get("price"))
-    #Checking if there is a specific screen size the user wants for the laptop
-    if "screen size" in user_input or "display" in user_input:
-        words = user_input.split()
-        for i, word in enumerate(words):
-            if "inch" in word or '"' in word:
-                preferences["screen_size"] = word.strip('"').replace("inch", "").strip()
-            elif word.isdigit() or word.replace('.', '', 1).isdigit():  
-                if i + 1 < len(words) and ("inch" in words[i + 1] or "inches" in words[i + 1]):
-                    preferences["screen_size"] = word
-    #Checking if there is a specific batterly length the user wants for the laptop
-    if "battery" in user_input or "battery life" in user_input:
-        if "long" in user_input or "good" in user_input:
-            preferences["battery_life"] = "long-lasting"
-        else:
-            preferences["battery_life"] = next((word for word in user_input.split() if "hour" in word or "hrs" in word), preferences.get("battery_life"))
-    #Checking if there is a specific type of GPU the user wants for the laptop
-    if "weight" in user_input or "light" in user_input:
-        preferences["weight"] = "lightweight" if "light" in user_input else preferences.get("weight")
-    #Checking if there is a specific OS the user wants for the laptop
-    if "os" in user_input or "operating system" in user_input:
-        preferences["os"] = next((word.capitalize() for word in user_input.split() if word in [
-            "windows", "macos", "linux", "ubuntu", "chromeos"
-        ]), preferences.get("os"))
-    #Checking if there is a specific audio quality the user wants for the laptop
-    if "audio" in user_input or "sound" in user_input:
-        preferences["audio"] = "high-quality audio" if "high-quality" in user_input else preferences.get("audio")
-    #Checking if there is a specific type of keyboard the user wants for the laptop
-    if "keyboard" in user_input:
-        preferences["keyboard_features"] = next((word for word in user_input.split() if word in ["backlit", "rgb"]), preferences.get("keyboard_features"))
-    #Checking if there is a specific material the user wants for the laptop
-    if "material" in user_input:
-        preferences["material"] = next((word.capitalize() for word in user_input.split() if word in [
-            "aluminum", "plastic", "carbon"
-        ]), preferences.get("material"))
-    #Checking if there is a need for a webcam in the laptop, and the quality of webcam
-    if "webcam" in user_input or "camera" in user_input:
-        if "hd" in user_input or "full hd" in user_input:
-            preferences["webcam_quality"] = "HD or Full HD"
-        else:
-            preferences["webcam_quality"] = preferences.get("webcam_quality")
-    #Checking if there is a specific type of connectivity the user needs for the laptop the user wants
-    if "connectivity" in user_input or "wifi" in user_input or "bluetooth" in user_input:
-        if "wifi 6" in user_input:
-            preferences["connectivity"] = "Wi-Fi 6"
-        elif "bluetooth" in user_input:
-            preferences["connectivity"] = "Bluetooth"
-        else:
-            preferences["connectivity"] = preferences.get("connectivity")
-    #Checking if there is a specific overall purpose for the laptop the user wants
-    if "purpose" in user_input or "use" in user_input:
-        if "gaming" in user_input:
-            preferences["purpose"] = "Gaming"
-        elif "work" in user_input:
-            preferences["purpose"] = "Work"
-        elif "general use" in user_input or "everyday" in user_input:
-            preferences["purpose"] = "General Use"
-        else:
-            preferences["purpose"] = preferences.get("purpose")
-    
-    return preferences
+#Function to Retrieve context for the preferences of the user, repeated preferences are answered from the retrieval cache without vectorizing or searching
+@timed("retrieval")
+def retrieve_for_preferences(preferences, k=5):
+    load_retriever()
+    return retrieval_cache.retrieve(preferences, k, generate_query, candidate_ids)
+
+#Function to Retrieve context for many preferences at once (bulk recommendation jobs), gives back one list of (record, score) tuples per preferences
+def retrieve_for_preferences_batch(preferences_list, k=5):
+    load_retriever()
+    return retrieval_cache.retrieve_batch(preferences_list, k, generate_query, candidate_ids)
+
+#Function to Retrieve context for many queries at once (evaluation or bulk recommendation jobs), gives back one list of (record, score) tuples per query
+def retrieve_context_batch(queries, k=5):
+    return load_retriever().retrieve_records_batch(queries, k, complete_ids())
 
 #Format functions to help give a more human-like response from the system since it doesnt use ChatGPT's LLM for now
 def format_preferences(preferences):
@@ -190,6 +122,87 @@ def generate_query(preferences):
         query_parts.append(f"for {preferences['purpose']}")
     return " ".join(query_parts)
 
+#Flexible prompts for missing specs, so the question asked to the user is not too rigid
+SPEC_PROMPTS = {
+    "brand": [
+        "Do you have a particular brand in mind for your laptop? Feel free to mention other specs if you'd like.",
+        "Are you leaning towards a specific brand, or do you have other preferences to share?"
+    ],
+    "ram": [
+        "What kind of performance are you looking for? Maybe tell me about RAM or anything else important to you.",
+        "Do you have a preference for RAM size or other specifications that matter to you?"
+    ],
+    "processor": [
+        "What type of tasks will you be performing on the laptop? This might help determine the right processor and other specs.",
+        "Tell me about the performance you need. Any thoughts on the processor or related features?"
+    ],
+    "gpu_brand": [
+        "Are you planning to use the laptop for gaming, video editing, or something else? Let me know if a specific GPU or other features matter.",
+        "What graphics capabilities do you need? Feel free to share any other important specs too."
+    ],
+    "storage_capacity": [
+        "How much storage would be enough for your files and apps? Or let me know if other specs are on your mind.",
+        "What are your thoughts on storage size? Anything else you'd like your laptop to have?"
+    ],
+    "storage_type": [
+        "Do you prefer a faster SSD or a larger HDD? Or are there other features you're prioritizing?",
+        "What type of storage do you think fits your needs? Feel free to include other specs if you'd like."
+    ],
+    "price": [
+        "What budget range are you thinking about? If there are other key specs you'd like, let me know.",
+        "How much are you planning to spend? You can also share other preferences if you'd like."
+    ],
+    "screen_size": [
+        "Do you have a preferred screen size or any other display features you're considering?",
+        "What screen size works for you? Or is there something else you'd like your laptop to have?"
+    ],
+    "battery_life": [
+        "Will you need long battery life for travel or work? Let me know if other specs are important too.",
+        "How important is battery life to you? Feel free to mention other features you'd like."
+    ],
+    "weight": [
+        "Are you looking for a lightweight option for portability? Any other specs you have in mind?",
+        "Do you prefer a lighter laptop? Let me know if there are other features you're considering."
+    ],
+    "os": [
+        "What operating system do you prefer? Or let me know about other features you're prioritizing.",
+        "Would you like a specific OS, like Windows or macOS? Any other key specs you'd like?"
+    ],
+    "audio": [
+        "Do you care about high-quality audio for music or video calls? Or are there other features on your mind?",
+        "How important is audio quality to you? Let me know if there are other things you're considering."
+    ],
+    "keyboard_features": [
+        "Do you need a backlit keyboard or anything special? Feel free to mention other specs too.",
+        "What are your thoughts on keyboard features? You can also tell me about other priorities you have."
+    ],
+    "material": [
+        "Would you prefer a premium build like aluminum or something else? Or are there other specs you'd like?",
+        "What kind of build material do you prefer? Feel free to mention any other features too."
+    ],
+    "webcam_quality": [
+        "Will you be using the webcam often? Let me know if there's a quality level or other spec you need.",
+        "Do you care about webcam quality? Or is there something else you'd like your laptop to have?"
+    ],
+    "connectivity": [
+        "Do you need any specific connectivity options, like Wi-Fi 6 or Bluetooth? Let me know if there’s more on your mind.",
+        "What connectivity features are important to you? Feel free to mention other key specs too."
+    ],
+    "purpose": [
+        "What will you primarily use the laptop for? Feel free to include other preferences as well.",
+        "Is this laptop for work, gaming, or general use? Let me know if there are other features you’re considering."
+    ]
+}
+
+#Function to recommend the Top-N laptops for the preferences, gives back (formatted recommendation, score) tuples
+@timed("recommend")
+def recommend_from_preferences(preferences, top_n=5):
+    #Build query and retrieve context using FAISS, the query is only built and searched when the preferences are not in the retrieval cache
+    #The records come back parsed and the laptops with insufficient information are not in the search, so no extra results are needed
+    filtered_results = retrieve_for_preferences(preferences, k=top_n)
+    #Clean the recommendations into a descriptive format so it is clearer for the user to see
+    return [(format_recommendation(record.title, record.descriptions, record.features), score) for record, score in filtered_results]
+
 #Function for the RAG only CRS
 def recommend_laptop_rag_only(top_n=5):
     preferences = {} #Track the prefrences of the user
@@ -200,77 +213,6 @@ def recommend_laptop_rag_only(top_n=5):
         "price", "screen_size", "battery_life", "weight", "os", "audio",
         "keyboard_features", "material", "webcam_quality", "connectivity", "purpose"
     ]
-    #Flexible prompts for missing specs, so the question asked to the user is not too rigid
-    spec_prompts = {
-        "brand": [
-            "Do you have a particular brand in mind for your laptop? Feel free to mention other specs if you'd like.",
-            "Are you leaning towards a specific brand, or do you have other preferences to share?"
-        ],
-        "ram": [
-            "What kind of performance are you looking for? Maybe tell me about RAM or anything else important to you.",
-            "Do you have a preference for RAM size or other specifications that matter to you?"
-        ],
-        "processor": [
-            "What type of tasks will you be performing on the laptop? This might help determine the right processor and other specs.",
-            "Tell me about the performance you need. Any thoughts on the processor or related features?"
-        ],
-        "gpu_brand": [
-            "Are you planning to use the laptop for gaming, video editing, or something else? Let me know if a specific GPU or other features matter.",
-            "What graphics capabilities do you need? Feel free to share any other important specs too."
-        ],
-        "storage_capacity": [
-            "How much storage would be enough for your files and apps? Or let me know if other specs are on your mind.",
-            "What are your thoughts on storage size? Anything else you'd like your laptop to have?"
-        ],
-        "storage_type": [
-            "Do you prefer a faster SSD or a larger HDD? Or are there other features you're prioritizing?",
-            "What type of storage do you think fits your needs? Feel free to include other specs if you'd like."
-        ],
-        "price": [
-            "What budget range are you thinking about? If there are other key specs you'd like, let me know.",
-            "How much are you planning to spend? You can also share other preferences if you'd like."
-        ],
-        "screen_size": [
-            "Do you have a preferred screen size or any other display features you're considering?",
-            "What screen size works for you? Or is there something else you'd like your laptop to have?"
-        ],
-        "battery_life": [
-            "Will you need long battery life for travel or work? Let me know if other specs are important too.",
-            "How important is battery life to you? Feel free to mention other features you'd like."
-        ],
-        "weight": [
-            "Are you looking for a lightweight option for portability? Any other specs you have in mind?",
-            "Do you prefer a lighter laptop? Let me know if there are other features you're considering."
-        ],
-        "os": [
-            "What operating system do you prefer? Or let me know about other features you're prioritizing.",
-            "Would you like a specific OS, like Windows or macOS? Any other key specs you'd like?"
-        ],
-        "audio": [
-            "Do you care about high-quality audio for music or video calls? Or are there other features on your mind?",
-            "How important is audio quality to you? Let me know if there are other things you're considering."
-        ],
-        "keyboard_features": [
-            "Do you need a backlit keyboard or anything special? Feel free to mention other specs too.",
-            "What are your thoughts on keyboard features? You can also tell me about other priorities you have."
-        ],
-        "material": [
-            "Would you prefer a premium build like aluminum or something else? Or are there other specs you'd like?",
-            "What kind of build material do you prefer? Feel free to mention any other features too."
-        ],
-        "webcam_quality": [
-            "Will you be using the webcam often? Let me know if there's a quality level or other spec you need.",
-            "Do you care about webcam quality? Or is there something else you'd like your laptop to have?"
-        ],
-        "connectivity": [
-            "Do you need any specific connectivity options, like Wi-Fi 6 or Bluetooth? Let me know if there’s more on your mind.",
-            "What connectivity features are important to you? Feel free to mention other key specs too."
-        ],
-        "purpose": [
-            "What will you primarily use the laptop for? Feel free to include other preferences as well.",
-            "Is this laptop for work, gaming, or general use? Let me know if there are other features you’re considering."
-        ]
-    }
     #Start the conversation
     print("LaptopGPT: Hello! I'm your laptop advisor.")
     print("LaptopGPT: Tell me what you're looking for in a laptop, like brand, budget, RAM, or purpose.")
@@ -292,7 +234,7 @@ def recommend_laptop_rag_only(top_n=5):
         if missing_specs:
             random_spec = random.choice(missing_specs)
             asked_specs.add(random_spec)  #Mark this spec as asked
-            random_prompt = random.choice(spec_prompts.get(random_spec, ["Could you provide more details about this?"]))
+            random_prompt = random.choice(SPEC_PROMPTS.get(random_spec, ["Could you provide more details about this?"]))
             print(f"LaptopGPT: {random_prompt}")
         else:
             print("LaptopGPT: Let me find recommendations based on your current preferences.")
@@ -303,26 +245,9 @@ def recommend_laptop_rag_only(top_n=5):
             print("LaptopGPT: I have enough details to make a recommendation!")
             break
 
-    #Build query and retrieve context using FAISS
-    query = generate_query(preferences) #Build a query
-    results = retrieve_context(query, k=top_n * 2)  #Retrieve more results to account for invalid ones
-    #Filter out entries that have insufficient information
-    filtered_results = [
-        (text, score) for text, score in results 
-        if text.strip() and text != "0 [] []" and "[]" not in text
-    ][:top_n]
-    #Clean the recommendations into a descriptive format so it is clearer for the user to see
-    recommendations = []
-    for result, score in filtered_results:
-        try:
-            title, descriptions, specs = result.split("['", 2)
-            descriptions = descriptions.rstrip("']").split("', '") if descriptions else []
-            specs = specs.rstrip("']").split("', '") if specs else []
-        except ValueError:
-            title, descriptions, specs = result, [], []
-        recommendations.append((format_recommendation(title.strip(), descriptions, specs), score))
+    recommendations = recommend_from_preferences(preferences, top_n)
     #Check if fewer results were found than requested, if so explain to the user that there were less laptops found than usual
-    if len(filtered_results) < top_n:
+    if len(recommendations) < top_n:
         print("LaptopGPT: Sorry, I couldn't find enough matches. Here's what I found so far:")
     #Generate reasoning for recommendations using the users preferences
     if preferences:
@@ -339,4 +264,6 @@ def recommend_laptop_rag_only(top_n=5):
     else:
         print("LaptopGPT: Sorry, I couldn't find any matches. Try providing more details or adjusting your preferences.")
 
-recommend_laptop_rag_only()
\ No newline at end of file
+if __name__ == "__main__":
+    warmup()
+    recommend_laptop_rag_only()
\ No newline at end of file
@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import time
+from itertools import islice
+import laptop_crs
+
+#Bulk offline recommendations for saved preference profiles (campaigns, catalog refreshes) through the OpenAI Batch API instead of one chat completion at a time
+#  prepare  -> retrieves (Combined Model) or ranks (Fine-Tuned GPT-4o) the laptops of every profile in batches and writes one Batch request per profile
+#  local    -> answers the requests file offline with the local fake client, in the format of a Batch output file
+#  submit   -> uploads the requests file and creates the batch job, download -> saves its output file once it is done
+#  join     -> joins the responses back to the profiles and writes the recommendations
+#The RAG CRS needs no GPT-4o request, so prepare writes its recommendations right away
+#Every profile is a JSON line {"id": ..., "preferences": {...}}, a profile without an id is named after its line number
+
+#Profiles read, retrieved and written at a time
+PROFILE_CHUNK = 500
+#Most requests one Batch input file may hold
+MAX_BATCH_REQUESTS = 50000
+ENDPOINT = "/v1/chat/completions"
+
+#Function to read the profiles in chunks, with the id every request is tagged with
+def read_profiles(path, chunk=PROFILE_CHUNK):
+    with open(path, encoding='utf-8') as file:
+        profiles = ({"id": str(profile.get("id", f"profile-{i + 1}")), "preferences": profile.get("preferences") or {}}
+                    for i, profile in ((i, json.loads(line)) for i, line in enumerate(file) if line.strip()))
+        while batch := list(islice(profiles, chunk)):
+            yield batch
+
+#Function to build the Batch request and the context of every profile of a chunk, the context is what join needs to finish the recommendation
+def chunk_requests(strategy, profiles):
+    module = laptop_crs.pipeline(strategy)
+    if strategy == "combined":
+        #One batched retrieval for the whole chunk, profiles with the same canonical preferences are only searched once
+        results = module.retrieve_for_preferences_batch([profile["preferences"] for profile in profiles])
+        for profile, rag_results in zip(profiles, results):
+            rag_texts, _ = module.pack_context(rag_results, module.CONTEXT_TOKEN_BUDGET)
+            yield {"model": module.FINE_TUNED_MODEL, "messages": module.ranking_messages(profile["preferences"], rag_texts)}, {}
+    else:
+        for profile in profiles:
+            ranked = module.rank_laptops(profile["preferences"])
+            yield ({"model": module.FINE_TUNED_MODEL, "messages": module.top_n_messages(profile["preferences"], ranked), "max_tokens": module.EXPLANATION_TOKENS * len(ranked)},
+                   {"ranked": ranked})
+
+#Function to write the Batch requests file of the profiles, and next to it the profiles with their context
+#For the RAG CRS the recommendations file is written right away instead
+def prepare(profiles_path, strategy, requests_path, recommendations_path):
+    start = time.perf_counter()
+    laptop_crs.warmup(strategy)
+    count = 0
+    if strategy == "rag":
+        module = laptop_crs.pipeline(strategy)
+        with open(recommendations_path, 'w', encoding='utf-8') as output:
+            for profiles in read_profiles(profiles_path):
+                results = module.retrieve_for_preferences_batch([profile["preferences"] for profile in profiles])
+                for profile, rag_results in zip(profiles, results):
+                    recommendations = [module.format_recommendation(record.title, record.descriptions, record.features) for record, _ in rag_results]
+                    output.write(json.dumps({**profile, "recommendations": "\n".join(f"{i + 1}. {text}" for i, text in enumerate(recommendations)), "error": None}) + "\n")
+                    count += 1
+        print(f"Wrote the recommendations of {count} profiles to {recommendations_path} in {time.perf_counter() - start:.2f}s")
+        return
+    #The results are joined back by the id of the profile, so every id has to be unique
+    ids = set()
+    with open(requests_path, 'w', encoding='utf-8') as requests, open(context_path(requests_path), 'w', encoding='utf-8') as contexts:
+        for profiles in read_profiles(profiles_path):
+            for profile, (body, context) in zip(profiles, chunk_requests(strategy, profiles)):
+                count += 1
+                if count > MAX_BATCH_REQUESTS:
+                    raise ValueError(f"More than {MAX_BATCH_REQUESTS} profiles, split {profiles_path} into several batches")
+                if profile["id"] in ids:
+                    raise ValueError(f"Profile id '{profile['id']}' is used more than once in {profiles_path}")
+                ids.add(profile["id"])
+                requests.write(json.dumps({"custom_id": profile["id"], "method": "POST", "url": ENDPOINT, "body": body}) + "\n")
+                contexts.write(json.dumps({**profile, "strategy": strategy, **context}) + "\n")
+    print(f"Wrote {count} batch requests to {requests_path} in {time.perf_counter() - start:.2f}s")
+
+#Function to get the path of the profiles and context file written next to a requests file
+def context_path(requests_path):
+    return os.path.splitext(requests_path)[0] + ".profiles.jsonl"
+
+#Function to answer a requests file offline with the local fake client, writing the output file the Batch API would give back
+def run_local(requests_path, results_path):
+    from fake_llm import fake_completion
+    count = 0
+    with open(requests_path, encoding='utf-8') as requests, open(results_path, 'w', encoding='utf-8') as results:
+        for line in requests:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            count += 1
+            completion = fake_completion(count, request["body"]["model"], request["body"]["messages"])
+            results.write(json.dumps({
+                "id": f"batch_req_{count}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": f"local-{count}", "body": completion.model_dump()},
+                "error": None,
+            }) + "\n")
+    print(f"Answered {count} requests locally into {results_path}")
+
+#Function to upload the requests file and create the batch job, gives back its id
+def submit(requests_path, client):
+    with open(requests_path, "rb") as file:
+        batch_file = client.files.create(file=file, purpose="batch")
+    batch = client.batches.create(input_file_id=batch_file.id, endpoint=ENDPOINT, completion_window="24h")
+    print(f"Created batch {batch.id} ({batch.status}), download its results with: python batch_recommend.py download {batch.id}")
+    return batch.id
+
+#Function to save the output file of a finished batch job, gives back False while it is still running
+def download(batch_id, results_path, client):
+    batch = client.batches.retrieve(batch_id)
+    if batch.status != "completed":
+        print(f"Batch {batch_id} is {batch.status} ({batch.request_counts.completed}/{batch.request_counts.total} requests done)")
+        return False
+    with open(results_path, 'wb') as file:
+        if batch.output_file_id:
+            file.write(client.files.content(batch.output_file_id).read())
+        if batch.error_file_id:
+            #Failed requests are in a separate file, they are joined like the others and marked with their error
+            file.write(client.files.content(batch.error_file_id).read())
+    print(f"Saved the results of batch {batch_id} to {results_path}")
+    return True
+
+#Function to join the responses of the results file back to the profiles, the results can come back in any order
+def join(requests_path, results_path, recommendations_path):
+    responses = {}
+    with open(results_path, encoding='utf-8') as results:
+        for line in results:
+            if line.strip():
+                result = json.loads(line)
+                responses[result["custom_id"]] = result
+    joined = missing = 0
+    with open(context_path(requests_path), encoding='utf-8') as contexts, open(recommendations_path, 'w', encoding='utf-8') as output:
+        for line in contexts:
+            profile = json.loads(line)
+            result = responses.get(profile["id"])
+            recommendations, error = None, None
+            if result is None:
+                error = "No result for this profile"
+            elif result.get("error") or result["response"]["status_code"] != 200:
+                error = json.dumps(result.get("error") or result["response"]["body"])
+            else:
+                content = result["response"]["body"]["choices"][0]["message"]["content"]
+                if profile["strategy"] == "fine-tuned":
+                    #The laptops were ranked locally when the request was prepared, the response only holds their explanations
+                    recommendations = laptop_crs.pipeline("fine-tuned").format_recommendations([tuple(laptop) for laptop in profile["ranked"]], content)
+                else:
+                    recommendations = content.strip()
+            joined += error is None
+            missing += error is not None
+            output.write(json.dumps({"id": profile["id"], "preferences": profile["preferences"], "recommendations": recommendations, "error": error}) + "\n")
+    print(f"Joined {joined} recommendations to their profiles in {recommendations_path}, {missing} profiles without one")
+
+#Function to create the OpenAI client of the batch job
+def openai_client():
+    from openai import OpenAI
+    #Initialize the OpenAI client using Your OWN OpenAI API Key please
+    return OpenAI(api_key='Your OpenAI API Key')
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute recommendations for a JSONL of preference profiles through the OpenAI Batch API (or its local stand-in).")
+    parser.add_argument("--requests", default="batch_requests.jsonl", help="Batch requests file, the profiles and their context are written next to it")
+    parser.add_argument("--results", default="batch_results.jsonl", help="Batch output file")
+    parser.add_argument("--output", default="batch_recommendations.jsonl", help="Recommendations joined to the profiles")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prepare_parser = commands.add_parser("prepare", help="Retrieve or rank the laptops of every profile and write the batch requests")
+    prepare_parser.add_argument("profiles")
+    prepare_parser.add_argument("--strategy", choices=list(laptop_crs.MODULES), default="combined")
+    commands.add_parser("local", help="Answer the batch requests offline with the local fake client")
+    commands.add_parser("submit", help="Upload the batch requests and create the batch job")
+    download_parser = commands.add_parser("download", help="Save the results of a finished batch job")
+    download_parser.add_argument("batch_id")
+    commands.add_parser("join", help="Join the batch results back to the profiles")
+    run_parser = commands.add_parser("run", help="prepare, local and join in one go, without the network")
+    run_parser.add_argument("profiles")
+    run_parser.add_argument("--strategy", choices=list(laptop_crs.MODULES), default="combined")
+    args = parser.parse_args()
+
+    if args.command in ("prepare", "run"):
+        prepare(args.profiles, args.strategy, args.requests, args.output)
+        if args.command == "prepare" or args.strategy == "rag":
+            return
+    if args.command in ("local", "run"):
+        run_local(args.requests, args.results)
+    if args.command == "submit":
+        submit(args.requests, openai_client())
+    if args.command == "download":
+        download(args.batch_id, args.results, openai_client())
+    if args.command in ("join", "run"):
+        join(args.requests, args.results, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+from sklearn.feature_extraction.text import TfidfVectorizer
+import numpy as np
+import argparse
+import json
+import time
+from retrieval import load_metadata_texts, RETRIEVERS, SparseRetriever
+from benchmark_retrieval import make_queries
+
+#Index modes compared by default, the parameters can be overridden with --params
+DEFAULT_MODES = {
+    "lsa": {"n_components": 256},
+    "hnsw": {"n_components": 256, "hnsw_m": 32, "ef_construction": 200, "ef_search": 64},
+    "ivfpq": {"n_components": 256, "nlist": 256, "pq_m": 32, "pq_nbits": 8, "nprobe": 16},
+}
+
+#Function to read the resident memory of this process in bytes (Linux), falling back to the peak resident memory elsewhere
+def resident_memory():
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+#Function to search all queries one by one, returns the found indices and the latency of every query in milliseconds
+def run_queries(retriever, query_vectors, k):
+    indices, latencies = [], []
+    for i in range(query_vectors.shape[0]):
+        start = time.perf_counter()
+        _, found = retriever.search(query_vectors[i], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        indices.append(found[0])
+    return indices, np.array(latencies)
+
+#Recall@k, the share of the exact top-k laptops that the approximate search found as well
+def recall_at_k(exact, approximate):
+    return float(np.mean([len(set(e.tolist()) & set(a.tolist())) / len(e) for e, a in zip(exact, approximate)]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recall@k, latency and memory of the approximate index modes against the exact search.")
+    parser.add_argument("--csv", default="metadata_cleaned.csv")
+    parser.add_argument("--modes", nargs="+", default=list(DEFAULT_MODES), choices=[mode for mode in RETRIEVERS if mode != "sparse"])
+    parser.add_argument("--params", default="{}", help='JSON overrides per mode, e.g. \'{"hnsw": {"ef_search": 128}}\'')
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--output", help="Write the report to this JSON file as well")
+    args = parser.parse_args()
+    overrides = json.loads(args.params)
+
+    texts = load_metadata_texts(args.csv)
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(texts)
+    query_vectors = vectorizer.transform(make_queries(texts, args.queries))
+    print(f"Catalog: {len(texts)} laptops, vocabulary: {matrix.shape[1]} terms, queries: {args.queries}, k: {args.k}")
+
+    #The sparse search is exact and ranks exactly like the flat FAISS search on the full vocabulary, so it is the ground truth
+    exact_retriever = SparseRetriever(vectorizer, matrix, texts)
+    exact, exact_latencies = run_queries(exact_retriever, query_vectors, args.k)
+    report = [{
+        "mode": "exact", "params": {}, "recall_at_k": 1.0, "build_seconds": None,
+        "p50_ms": float(np.percentile(exact_latencies, 50)), "p99_ms": float(np.percentile(exact_latencies, 99)),
+        "index_mib": exact_retriever.memory_bytes() / 2**20, "rss_increase_mib": None,
+    }]
+    for mode in args.modes:
+        params = {**DEFAULT_MODES.get(mode, {}), **overrides.get(mode, {})}
+        rss_before = resident_memory()
+        start = time.perf_counter()
+        retriever = RETRIEVERS[mode](vectorizer, matrix, texts, **params)
+        build_seconds = time.perf_counter() - start
+        rss_increase = resident_memory() - rss_before
+        found, latencies = run_queries(retriever, query_vectors, args.k)
+        report.append({
+            "mode": mode, "params": params, "recall_at_k": recall_at_k(exact, found), "build_seconds": build_seconds,
+            "p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99)),
+            "index_mib": retriever.memory_bytes() / 2**20, "rss_increase_mib": rss_increase / 2**20,
+        })
+        del retriever
+
+    print(f"{'mode':>6} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p99 ms':>8} {'index MiB':>10} {'RSS +MiB':>9} {'build s':>8}")
+    for row in report:
+        build = f"{row['build_seconds']:.2f}" if row["build_seconds"] is not None else "-"
+        rss = f"{row['rss_increase_mib']:.1f}" if row["rss_increase_mib"] is not None else "-"
+        print(f"{row['mode']:>6} {row['recall_at_k']:>10.3f} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['index_mib']:>10.1f} {rss:>9} {build:>8}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+
+if __name__ == "__main__":
+    main()
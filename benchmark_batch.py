@@ -0,0 +1,33 @@
+import numpy as np
+import argparse
+import time
+from retrieval import load_or_build_retriever
+from benchmark_retrieval import make_queries
+
+#Function to time a function call, returns the wall time in seconds
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare retrieve_batch against looping retrieve over the same queries.")
+    parser.add_argument("--csv", default="metadata_cleaned.csv")
+    parser.add_argument("--backend", default="sparse")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    retriever = load_or_build_retriever(args.csv, backend=args.backend)
+    texts = list(retriever.texts)
+    print(f"{'queries':>8} {'looped s':>10} {'batched s':>10} {'speedup':>8} {'batched q/s':>12}")
+    for size in args.sizes:
+        queries = make_queries(texts, size)
+        looped_seconds, looped = timed(lambda: [retriever.retrieve(query, args.k) for query in queries])
+        batched_seconds, batched = timed(retriever.retrieve_batch, queries, args.k)
+        #Both paths have to give back the same scores for every query (laptops with tied scores may swap places)
+        same = all(np.allclose([score for _, score in a], [score for _, score in b], atol=1e-4) for a, b in zip(looped, batched))
+        print(f"{size:>8} {looped_seconds:>10.3f} {batched_seconds:>10.3f} {looped_seconds / batched_seconds:>7.1f}x {size / batched_seconds:>12.0f}" + ("" if same else "  (results differ!)"))
+
+if __name__ == "__main__":
+    main()
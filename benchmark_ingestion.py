@@ -0,0 +1,62 @@
+from sklearn.feature_extraction.text import TfidfVectorizer
+import multiprocessing
+import argparse
+import resource
+import time
+import os
+import pandas as pd
+from record_store import RecordStore, split_list, is_valid_record
+from ingestion import ingest_metadata, cache_path, CSV_CHUNK_ROWS
+
+#Function to load the catalog the way it was loaded before the chunked ingestion: the whole CSV in one DataFrame and a list of Python strings per column
+def legacy_load(csv_path):
+    metadata = pd.read_csv(csv_path, sep=';', usecols=['title', 'description', 'features'])
+    metadata = metadata.dropna(subset=['title', 'description', 'features'])
+    titles = metadata['title'].astype(str).str.strip().tolist()
+    descriptions = [split_list(value) for value in metadata['description']]
+    features = [split_list(value) for value in metadata['features']]
+    keep = [i for i in range(len(titles)) if is_valid_record(titles[i], descriptions[i], features[i])]
+    combined_text = (metadata['title'].astype(str) + ' ' + metadata['description'].astype(str) + ' ' + metadata['features'].astype(str)).tolist()
+    texts = [combined_text[i] for i in keep]
+    records = RecordStore.from_lists([titles[i] for i in keep], [descriptions[i] for i in keep], [features[i] for i in keep])
+    return texts, records
+
+#Function to run one ingestion mode, it runs in its own process so the peak RSS belongs to that mode alone
+def run_mode(mode, csv_path, chunk_rows, vectorize, results):
+    #ru_maxrss is in KiB on Linux, the peak after the imports is the baseline every mode starts from
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    start = time.perf_counter()
+    if mode == "legacy":
+        texts, records = legacy_load(csv_path)
+    else:
+        texts, records, _ = ingest_metadata(csv_path, chunk_rows=chunk_rows, use_cache=(mode == "cached"), with_specs=False)
+    load_seconds = time.perf_counter() - start
+    if vectorize:
+        TfidfVectorizer().fit_transform(texts)
+    results[mode] = (len(records), load_seconds, time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, baseline)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare wall time and peak memory of the chunked CSV ingestion and its Parquet cache with loading the whole CSV at once.")
+    parser.add_argument("--csv", default="metadata_cleaned.csv")
+    parser.add_argument("--chunk-rows", type=int, default=CSV_CHUNK_ROWS)
+    parser.add_argument("--vectorize", action="store_true", help="Also fit the TF-IDF vectorizer on the texts, like a build of the retrieval artifact")
+    args = parser.parse_args()
+
+    #The cached mode reads the cache the chunked mode writes, without pyarrow it reads the CSV again
+    if os.path.exists(cache_path(args.csv)):
+        os.remove(cache_path(args.csv))
+    context = multiprocessing.get_context("spawn")
+    results = context.Manager().dict()
+    for mode in ["legacy", "chunked", "cached"]:
+        process = context.Process(target=run_mode, args=(mode, args.csv, args.chunk_rows, args.vectorize, results))
+        process.start()
+        process.join()
+    if not os.path.exists(cache_path(args.csv)):
+        print("pyarrow is not installed, no Parquet cache was written (the cached mode read the CSV)")
+    for mode in ["legacy", "chunked", "cached"]:
+        n_records, load_seconds, total_seconds, peak_mib, baseline_mib = results[mode]
+        print(f"{mode:>8}: {n_records} laptops, load {load_seconds:.2f}s" + (f", with vectorizing {total_seconds:.2f}s" if args.vectorize else "") +
+              f", peak RSS {peak_mib:.1f} MiB ({peak_mib - baseline_mib:.1f} MiB over the {baseline_mib:.1f} MiB after the imports)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import os
+import tempfile
+import time
+from benchmark_preferences import load_user_turns
+from fake_llm import FakeOpenAIClient
+from llm_cache import LLMCache, CachedClient
+
+MODEL = "ft:gpt-4o-2024-08-06:personal::AW1N4XJq"
+
+#Function to build the extract_specs request of the CRS for an opening user turn
+def extraction_request(user_input):
+    prompt = f"""
+    User has provided the following laptop specifications so far: {{}}.
+    The latest input is: "{user_input}".
+    Please extract specifications such as brand, budget, RAM, processor, storage, graphics card, and purpose from the latest input, and merge them with the existing specs.
+    Provide the response as a Python dictionary.
+    """
+    return {"model": MODEL, "messages": [
+        {"role": "system", "content": "You are a knowledgeable assistant extracting laptop specifications from user input."},
+        {"role": "user", "content": prompt},
+    ]}
+
+#Function to build the query_missing_specs request of the CRS
+def missing_spec_request(preferences, missing_spec):
+    prompt = f"""
+    User's current preferences are: {preferences}.
+    The assistant needs to ask the user about their {missing_spec}.
+    Generate a natural-sounding query for this.
+    """
+    return {"model": MODEL, "messages": [
+        {"role": "system", "content": "You are an assistant designed to ask users for missing specifications in a natural tone."},
+        {"role": "user", "content": prompt},
+    ]}
+
+#Function to send every request through the client, gives back the total time in seconds
+def replay(client, requests):
+    start = time.perf_counter()
+    for request in requests:
+        client.chat.completions.create(**request)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay CRS requests through the LLM cache against the local fake client.")
+    parser.add_argument("--data", default="laptop_chat_validation.jsonl")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the fake client takes per request")
+    parser.add_argument("--max-requests", type=int, default=200)
+    args = parser.parse_args()
+
+    #The extraction of every user turn and the follow-up question for the empty preference dict every conversation starts with
+    turns = load_user_turns(args.data)
+    requests = [extraction_request(turn) for turn in turns] + [missing_spec_request({}, "brand") for _ in turns]
+    requests = requests[:args.max_requests]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "llm_cache.sqlite")
+        fake = FakeOpenAIClient(latency=args.latency)
+        client = CachedClient(fake, LLMCache(path))
+        first = replay(client, requests)
+        print(f"First pass:  {len(requests)} requests in {first:.2f}s, {fake.chat.completions.calls} sent to the client, {client.cache.stats()}")
+        second = replay(client, requests)
+        print(f"Second pass: {len(requests)} requests in {second:.2f}s (memory tier), {client.cache.stats()}")
+        #A new cache on the same file starts with an empty memory tier, like the next run of the CRS
+        client = CachedClient(fake, LLMCache(path))
+        third = replay(client, requests)
+        print(f"New process: {len(requests)} requests in {third:.2f}s (disk tier), {client.cache.stats()}")
+        print(f"Requests sent to the client in total: {fake.chat.completions.calls}")
+
+if __name__ == "__main__":
+    main()
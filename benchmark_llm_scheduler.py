@@ -0,0 +1,137 @@
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import threading
+import time
+import Fine_tuned_GPT4o_CRS as fine_tuned
+from fake_llm import fake_completion
+from llm_scheduler import BATCH, INTERACTIVE, PRIORITY_NAMES, LLMScheduler, ScheduledClient, TokenBucket, priority
+
+#Load test of the LLM scheduler against a local mock of the chat completions endpoint that throttles like the OpenAI API:
+#past its requests per minute it answers 429 with Retry-After, and a share of the requests fail with 503
+#Batch workers send requests back to back while interactive users send one now and then, through
+#  plain      -> the OpenAI client without retries
+#  sdk        -> the OpenAI client with its own retries (how the CRS modules sent requests before the scheduler)
+#  scheduler  -> the OpenAI client behind the scheduler, budgeted to the limit of the mock
+
+#Mock of the chat completions endpoint, the limits are set on the class by serve()
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.lock:
+            now = time.monotonic()
+            self.counters["requests"] += 1
+            delay = self.bucket.delay(1, now)
+            if delay <= 0:
+                self.bucket.take(1, now)
+            else:
+                self.counters["throttled"] += 1
+        if delay > 0:
+            self.send_error_json(429, "rate_limit_exceeded", {"retry-after-ms": str(int(delay * 1000) + 1)})
+            return
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            with self.lock:
+                self.counters["errors"] += 1
+            self.send_error_json(503, "server_error")
+            return
+        with self.lock:
+            self.counters["answered"] += 1
+            call = self.counters["answered"]
+        self.send_json(200, fake_completion(call, body["model"], body["messages"]).model_dump_json().encode('utf-8'))
+
+    def send_error_json(self, status, code, headers=None):
+        self.send_json(status, json.dumps({"error": {"message": code, "type": code, "code": code}}).encode('utf-8'), headers)
+
+    def send_json(self, status, data, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+#Function to start the mock in a background thread, gives back the server and its counters
+def serve(requests_per_minute, burst_seconds, latency, error_rate):
+    counters = {"requests": 0, "throttled": 0, "errors": 0, "answered": 0}
+    handler = type("Handler", (MockOpenAIHandler,), {"lock": threading.Lock(), "bucket": TokenBucket(requests_per_minute, time.monotonic(), burst_seconds),
+                                                     "counters": counters, "latency": latency, "error_rate": error_rate})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, counters
+
+#Function to run the batch workers and the interactive users against one client, gives back the latencies and failures of every priority
+def run_load(client, batch_workers, batch_requests, users, user_requests, think_time):
+    messages = fine_tuned.extract_specs_messages("I need a Dell gaming laptop with 16gb of ram and an nvidia card", {})
+    latencies = {INTERACTIVE: [], BATCH: []}
+    failures = {INTERACTIVE: 0, BATCH: 0}
+    lock = threading.Lock()
+
+    def worker(level, count, pause):
+        with priority(level):
+            for _ in range(count):
+                start = time.perf_counter()
+                try:
+                    client.chat.completions.create(model=fine_tuned.FINE_TUNED_MODEL, messages=messages)
+                    with lock:
+                        latencies[level].append(time.perf_counter() - start)
+                except Exception:
+                    with lock:
+                        failures[level] += 1
+                time.sleep(pause)
+
+    threads = [threading.Thread(target=worker, args=(BATCH, batch_requests, 0.0)) for _ in range(batch_workers)]
+    threads += [threading.Thread(target=worker, args=(INTERACTIVE, user_requests, think_time)) for _ in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the LLM scheduler against a local mock OpenAI endpoint that throttles requests.")
+    parser.add_argument("--server-rpm", type=int, default=1200, help="Requests per minute the mock answers before it throttles")
+    parser.add_argument("--server-burst", type=float, default=1.0, help="Seconds of requests the mock lets through in one burst")
+    parser.add_argument("--burst-seconds", type=float, default=1.0, help="Seconds of budget the scheduler sends in one burst")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the mock takes per request")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="Share of the requests the mock fails with 503")
+    parser.add_argument("--batch-workers", type=int, default=12)
+    parser.add_argument("--batch-requests", type=int, default=20, help="Requests every batch worker sends back to back")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--user-requests", type=int, default=5)
+    parser.add_argument("--think-time", type=float, default=0.5, help="Seconds between the requests of an interactive user")
+    parser.add_argument("--modes", nargs="+", default=["plain", "sdk", "scheduler"], choices=["plain", "sdk", "scheduler"])
+    args = parser.parse_args()
+
+    from openai import OpenAI
+    for mode in args.modes:
+        server, counters = serve(args.server_rpm, args.server_burst, args.latency, args.error_rate)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        scheduler = None
+        if mode == "scheduler":
+            scheduler = LLMScheduler(requests_per_minute=args.server_rpm, tokens_per_minute=10 ** 9, burst_seconds=args.burst_seconds)
+            client = ScheduledClient(OpenAI(api_key="mock", base_url=base_url, max_retries=0), scheduler)
+        else:
+            client = OpenAI(api_key="mock", base_url=base_url, max_retries=0 if mode == "plain" else 2)
+        latencies, failures, seconds = run_load(client, args.batch_workers, args.batch_requests, args.users, args.user_requests, args.think_time)
+        server.shutdown()
+        print(f"{mode:>9}: {sum(len(values) for values in latencies.values())} answered, {sum(failures.values())} failed in {seconds:.2f}s, "
+              f"mock saw {counters['requests']} requests ({counters['throttled']} throttled, {counters['errors']} 503s)")
+        for level, values in latencies.items():
+            if values:
+                print(f"{'':>11}{PRIORITY_NAMES[level]:>11}: p50 {np.percentile(values, 50) * 1000:.0f}ms p95 {np.percentile(values, 95) * 1000:.0f}ms, {failures[level]} failed")
+        if scheduler is not None:
+            print(f"{'':>11}scheduler: {scheduler.stats()}")
+
+if __name__ == "__main__":
+    main()
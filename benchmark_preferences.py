@@ -0,0 +1,157 @@
+import argparse
+import json
+import time
+from collections import Counter
+from preference_extractor import extract_preferences
+
+#The original extract_preferences of RAG_CRS.py, kept as the reference for the accuracy diff
+def legacy_extract_preferences(user_input, preferences):
+    user_input = user_input.lower() #Make the user input lowercase
+    
+    #Getting the important specifications of laptop that the user would want from their input
+    #Checking if there is a specific brand of laptop the user wants for the laptop
+    if "brand" in user_input or any(brand in user_input for brand in ["dell", "lenovo", "hp", "asus", "acer", "apple", "microsoft", "samsung", "msi", "lg", "razer", "huawei"]):
+        preferences["brand"] = next((word.capitalize() for word in user_input.split() if word in [
+            "dell", "lenovo", "hp", "asus", "acer", "apple", "microsoft", "samsung", "msi", "lg", "razer", "huawei"
+        ]), preferences.get("brand"))
+    #Checking if there is a specific RAM the user wants for the laptop
+    if "ram" in user_input:
+        preferences["ram"] = next((word for word in user_input.split() if "gb" in word), preferences.get("ram"))
+    #Checking if there is a specific Processor the user wants for the laptop
+    if "processor" in user_input or "cpu" in user_input:
+        preferences["processor"] = next((word.capitalize() for word in user_input.split() if word in [
+            "i3", "i5", "i7", "i9", "ryzen", "amd", "intel", "m1", "m2"
+        ]), preferences.get("processor"))
+    #Checking if there is a specific type of GPU the user wants for the laptop
+    if "gpu" in user_input or "graphics" in user_input:
+        preferences["gpu_brand"] = next((word.capitalize() for word in user_input.split() if word in [
+            "nvidia", "amd", "intel", "rtx", "gtx", "vega"
+        ]), preferences.get("gpu_brand"))
+    #Checking if there is a specific storage capacity the user wants for the laptop
+    if "storage" in user_input or "hard drive" in user_input:
+        preferences["storage_capacity"] = next((word for word in user_input.split() if "gb" in word or "tb" in word), preferences.get("storage_capacity"))
+    #Checking if there is a specific ssd that the user has in mind for the laptop
+    if "ssd" in user_input or "hdd" in user_input:
+        preferences["storage_type"] = "SSD" if "ssd" in user_input else "HDD"
+    #Checking if there is a specific budget the user has for the laptop
+    if "budget" in user_input or "price" in user_input:
+        preferences["price"] = next((word for word in user_input.split() if "$" in word or word.isdigit()), preferences.get("price"))
+    #Checking if there is a specific screen size the user wants for the laptop
+    if "screen size" in user_input or "display" in user_input:
+        words = user_input.split()
+        for i, word in enumerate(words):
+            if "inch" in word or '"' in word:
+                preferences["screen_size"] = word.strip('"').replace("inch", "").strip()
+            elif word.isdigit() or word.replace('.', '', 1).isdigit():  
+                if i + 1 < len(words) and ("inch" in words[i + 1] or "inches" in words[i + 1]):
+                    preferences["screen_size"] = word
+    #Checking if there is a specific batterly length the user wants for the laptop
+    if "battery" in user_input or "battery life" in user_input:
+        if "long" in user_input or "good" in user_input:
+            preferences["battery_life"] = "long-lasting"
+        else:
+            preferences["battery_life"] = next((word for word in user_input.split() if "hour" in word or "hrs" in word), preferences.get("battery_life"))
+    #Checking if there is a specific type of GPU the user wants for the laptop
+    if "weight" in user_input or "light" in user_input:
+        preferences["weight"] = "lightweight" if "light" in user_input else preferences.get("weight")
+    #Checking if there is a specific OS the user wants for the laptop
+    if "os" in user_input or "operating system" in user_input:
+        preferences["os"] = next((word.capitalize() for word in user_input.split() if word in [
+            "windows", "macos", "linux", "ubuntu", "chromeos"
+        ]), preferences.get("os"))
+    #Checking if there is a specific audio quality the user wants for the laptop
+    if "audio" in user_input or "sound" in user_input:
+        preferences["audio"] = "high-quality audio" if "high-quality" in user_input else preferences.get("audio")
+    #Checking if there is a specific type of keyboard the user wants for the laptop
+    if "keyboard" in user_input:
+        preferences["keyboard_features"] = next((word for word in user_input.split() if word in ["backlit", "rgb"]), preferences.get("keyboard_features"))
+    #Checking if there is a specific material the user wants for the laptop
+    if "material" in user_input:
+        preferences["material"] = next((word.capitalize() for word in user_input.split() if word in [
+            "aluminum", "plastic", "carbon"
+        ]), preferences.get("material"))
+    #Checking if there is a need for a webcam in the laptop, and the quality of webcam
+    if "webcam" in user_input or "camera" in user_input:
+        if "hd" in user_input or "full hd" in user_input:
+            preferences["webcam_quality"] = "HD or Full HD"
+        else:
+            preferences["webcam_quality"] = preferences.get("webcam_quality")
+    #Checking if there is a specific type of connectivity the user needs for the laptop the user wants
+    if "connectivity" in user_input or "wifi" in user_input or "bluetooth" in user_input:
+        if "wifi 6" in user_input:
+            preferences["connectivity"] = "Wi-Fi 6"
+        elif "bluetooth" in user_input:
+            preferences["connectivity"] = "Bluetooth"
+        else:
+            preferences["connectivity"] = preferences.get("connectivity")
+    #Checking if there is a specific overall purpose for the laptop the user wants
+    if "purpose" in user_input or "use" in user_input:
+        if "gaming" in user_input:
+            preferences["purpose"] = "Gaming"
+        elif "work" in user_input:
+            preferences["purpose"] = "Work"
+        elif "general use" in user_input or "everyday" in user_input:
+            preferences["purpose"] = "General Use"
+        else:
+            preferences["purpose"] = preferences.get("purpose")
+    
+    return preferences
+
+#Function to read every user turn of the fine-tuning conversations
+def load_user_turns(path):
+    turns = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            for message in json.loads(line)["messages"]:
+                if message["role"] == "user":
+                    turns.append(message["content"])
+    return turns
+
+#Function to time an extractor over all turns, gives back turns per second
+def throughput(extractor, turns, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for turn in turns:
+            extractor(turn, {})
+    return len(turns) * repeat / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the compiled preference extractor with the original one on every user turn of the fine-tuning data.")
+    parser.add_argument("--data", default="laptop_chat_finetuning_new.jsonl")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--show", type=int, default=10, help="Number of differing turns to print")
+    args = parser.parse_args()
+
+    turns = load_user_turns(args.data)
+    legacy_rate = throughput(legacy_extract_preferences, turns, args.repeat)
+    compiled_rate = throughput(extract_preferences, turns, args.repeat)
+    print(f"User turns: {len(turns)}")
+    print(f"Original: {legacy_rate:,.0f} turns/s, compiled: {compiled_rate:,.0f} turns/s ({compiled_rate / legacy_rate:.1f}x)")
+
+    #Accuracy diff, which slots the two extractors fill differently
+    differing, slot_changes, examples = 0, Counter(), []
+    for turn in turns:
+        old, new = legacy_extract_preferences(turn, {}), extract_preferences(turn, {})
+        if old != new:
+            differing += 1
+            changed = {key for key in set(old) | set(new) if (key in old) != (key in new) or old.get(key) != new.get(key)}
+            for key in changed:
+                if old.get(key) is None and new.get(key) is None:
+                    kind = "empty slot " + ("dropped" if key in old else "added") #The slot was triggered without a value, e.g. "os" inside "videos"
+                elif old.get(key) is None:
+                    kind = "added"
+                elif new.get(key) is None:
+                    kind = "removed"
+                else:
+                    kind = "changed"
+                slot_changes[(key, kind)] += 1
+            if len(examples) < args.show:
+                examples.append((turn, {key: (old.get(key), new.get(key)) for key in sorted(changed)}))
+    print(f"Turns with a different result: {differing} of {len(turns)}")
+    for (key, kind), count in sorted(slot_changes.items()):
+        print(f"  {key:<18} {kind:<20} {count}")
+    for turn, changes in examples:
+        print(f"- {turn}\n  original -> compiled: {changes}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from sklearn.feature_extraction.text import TfidfVectorizer
+import numpy as np
+import argparse
+import random
+import time
+import tracemalloc
+from retrieval import load_metadata_texts, SparseRetriever, DenseFaissRetriever
+
+#Example queries in the same shape generate_query builds from the users preferences
+SAMPLE_QUERIES = [
+    "Dell laptop 16gb RAM I7 processor Nvidia GPU 512gb SSD for Gaming",
+    "Apple laptop 8gb RAM M1 processor 256gb SSD lightweight weight Macos operating system",
+    "Lenovo laptop within $800 budget 15.6 screen size long-lasting battery life for Work",
+    "HP laptop 1tb storage backlit keyboard HD or Full HD webcam Wi-Fi 6 connectivity",
+    "Asus laptop Ryzen processor Amd GPU for General Use",
+    "Acer laptop i5 processor 14 screen size Windows operating system Aluminum material",
+]
+
+#Function to mix the example queries with the start of random catalog texts, seeded so every run uses the same queries
+def make_queries(texts, n, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(SAMPLE_QUERIES) if i % 2 else rng.choice(texts)[:200] for i in range(n)]
+
+#Function to time a retriever over the queries, returns the latency of every query in milliseconds
+def time_queries(retriever, queries, k):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        retriever.retrieve(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+#Function to build a retriever while tracking the peak memory allocated by the build
+def measure_build(retriever_class, vectorizer, texts):
+    tracemalloc.start()
+    start = time.perf_counter()
+    matrix = vectorizer.transform(texts)
+    retriever = retriever_class(vectorizer, matrix, texts)
+    build_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retriever, build_seconds, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory and latency of the sparse and dense FAISS retrieval backends.")
+    parser.add_argument("--csv", default="metadata_cleaned.csv")
+    parser.add_argument("--max-docs", type=int, default=None, help="Only use the first N laptops, the dense path needs n_docs * vocabulary * 12 bytes")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--skip-dense", action="store_true")
+    args = parser.parse_args()
+
+    texts = load_metadata_texts(args.csv)[:args.max_docs]
+    vectorizer = TfidfVectorizer().fit(texts)
+    queries = make_queries(texts, args.queries)
+    print(f"Catalog: {len(texts)} laptops, vocabulary: {len(vectorizer.vocabulary_)} terms, queries: {len(queries)}, k: {args.k}")
+
+    backends = [("sparse", SparseRetriever)] + ([] if args.skip_dense else [("faiss", DenseFaissRetriever)])
+    results = {}
+    for name, retriever_class in backends:
+        retriever, build_seconds, peak = measure_build(retriever_class, vectorizer, texts)
+        latencies = time_queries(retriever, queries, args.k)
+        results[name] = retriever
+        print(f"{name:>7}: build {build_seconds:.2f}s, peak build memory {peak / 2**20:.1f} MiB, index memory {retriever.memory_bytes() / 2**20:.1f} MiB, "
+              f"latency p50 {np.percentile(latencies, 50):.2f}ms p99 {np.percentile(latencies, 99):.2f}ms")
+
+    #Both backends give back squared L2 distances, so the top-k laptops should be the same
+    if "faiss" in results:
+        overlap = []
+        for query in queries:
+            sparse_ids = {text for text, _ in results["sparse"].retrieve(query, args.k)}
+            dense_ids = {text for text, _ in results["faiss"].retrieve(query, args.k)}
+            overlap.append(len(sparse_ids & dense_ids) / max(len(dense_ids), 1))
+        print(f"Top-{args.k} agreement between sparse and dense results: {np.mean(overlap):.3f}")
+
+if __name__ == "__main__":
+    main()
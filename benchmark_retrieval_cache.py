@@ -0,0 +1,64 @@
+import numpy as np
+import argparse
+import json
+import random
+import time
+from preference_extractor import extract_preferences
+from retrieval import load_or_build_retriever
+from retrieval_cache import RetrievalCache, canonical_preferences
+
+#Function to read the final preferences of every conversation of the dataset, extracted from its user turns
+def load_conversation_preferences(path):
+    preferences = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            conversation = {}
+            for message in json.loads(line)["messages"]:
+                if message["role"] == "user":
+                    extract_preferences(message["content"], conversation)
+            preferences.append(conversation)
+    return preferences
+
+#Function to build the query of the preferences, in the shape preferences_query of the Combined Model builds it
+def make_query(preferences):
+    return " ".join(f"{key} {value}" for key, value in preferences.items())
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the preferences of the fine-tuning conversations through the retrieval cache and compare it with searching every time.")
+    parser.add_argument("--csv", default="metadata_cleaned.csv")
+    parser.add_argument("--conversations", default="laptop_chat_finetuning_new.jsonl")
+    parser.add_argument("--backend", default="sparse")
+    parser.add_argument("--sessions", type=int, default=10000, help="Sessions replayed, each one picks the preferences of a random conversation")
+    parser.add_argument("-k", type=int, default=30)
+    parser.add_argument("--max-entries", type=int, default=2048)
+    args = parser.parse_args()
+
+    retriever = load_or_build_retriever(args.csv, backend=args.backend)
+    conversations = load_conversation_preferences(args.conversations)
+    rng = random.Random(0)
+    sessions = [rng.choice(conversations) for _ in range(args.sessions)]
+    print(f"{len(conversations)} conversations, {len({tuple(canonical_preferences(p).items()) for p in conversations})} distinct canonical preference sets, {len(sessions)} sessions")
+
+    def candidate_ids(preferences):
+        return retriever.specs.candidate_ids(preferences)
+
+    #Searching every session, with the same canonical preferences the cache searches with
+    def uncached(preferences):
+        preferences = canonical_preferences(preferences)
+        return retriever.retrieve_records(make_query(preferences), args.k, candidate_ids(preferences))
+
+    cache = RetrievalCache(retriever, args.max_entries)
+    def cached(preferences):
+        return cache.retrieve(preferences, args.k, make_query, candidate_ids)
+
+    for name, retrieve in (("uncached", uncached), ("cached", cached)):
+        latencies = []
+        for preferences in sessions:
+            start = time.perf_counter()
+            retrieve(preferences)
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"{name:>8}: p50 {np.percentile(latencies, 50):.3f}ms p99 {np.percentile(latencies, 99):.3f}ms, {len(sessions) / sum(latencies) * 1000:.0f} retrievals/s")
+    print(f"Retrieval cache: {cache.stats()}")
+
+if __name__ == "__main__":
+    main()
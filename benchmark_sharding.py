@@ -0,0 +1,49 @@
+import numpy as np
+import argparse
+import os
+import time
+from retrieval import load_metadata_texts, RETRIEVERS, ShardedRetriever
+from parallel_vectorizer import vectorize_parallel
+from benchmark_retrieval import make_queries, time_queries
+
+#Function to build the index of the backend over the matrix, split into one shard per worker when there is more than one worker
+def build_index(backend, vectorizer, matrix, texts, workers):
+    if workers == 1:
+        return RETRIEVERS[backend](vectorizer, matrix, texts)
+    return ShardedRetriever(RETRIEVERS[backend], vectorizer, matrix, texts, workers, workers)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how the parallel vectorization, the sharded index build and the fanned-out search scale with the number of workers.")
+    parser.add_argument("--csv", default="metadata_cleaned.csv")
+    parser.add_argument("--backend", default="sparse")
+    parser.add_argument("--workers", default="1,2,4,8", help="Comma separated worker counts, every count also builds that many shards")
+    parser.add_argument("--replicate", type=int, default=1, help="Repeat the catalog N times to simulate a larger one")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    texts = load_metadata_texts(args.csv)
+    texts = [f"{text} listing {i}" for i in range(args.replicate) for text in texts] if args.replicate > 1 else texts
+    queries = make_queries(texts, args.queries)
+    print(f"Catalog: {len(texts)} laptops, backend: {args.backend}, CPUs: {os.cpu_count()}, queries: {len(queries)}, k: {args.k}")
+
+    baseline = None
+    for workers in [int(value) for value in args.workers.split(",")]:
+        start = time.perf_counter()
+        vectorizer, matrix = vectorize_parallel(texts, workers=workers)
+        vectorize_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        retriever = build_index(args.backend, vectorizer, matrix, texts, workers)
+        build_seconds = time.perf_counter() - start
+        latencies = time_queries(retriever, queries, args.k)
+        results = [[score for _, score in row] for row in retriever.search_ids(queries, args.k)]
+        #The single worker build is the reference the top-k of the sharded builds are compared with
+        #Laptops with the same distance can come back in any order, so a result counts when it is as close as the k-th reference result
+        if baseline is None:
+            baseline = (vectorize_seconds + build_seconds, results)
+        overlap = np.mean([np.sum(np.array(result) <= reference[-1] + 1e-5) / len(reference) if reference else 1.0 for result, reference in zip(results, baseline[1])])
+        print(f"{workers} workers: vectorize {vectorize_seconds:.2f}s, index build {build_seconds:.2f}s, speedup {baseline[0] / (vectorize_seconds + build_seconds):.2f}x, "
+              f"search p50 {np.percentile(latencies, 50):.2f}ms p99 {np.percentile(latencies, 99):.2f}ms, top-{args.k} overlap with 1 worker {overlap:.3f}")
+
+if __name__ == "__main__":
+    main()
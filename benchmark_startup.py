@@ -0,0 +1,67 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+#Budget of the cold import of a CRS module, and of the first recommendation after warmup() (GPT-4o requests answered by the fake client)
+IMPORT_BUDGET_MS = 150
+FIRST_QUERY_BUDGET_MS = 250
+
+PREFERENCES = {"brand": "dell", "ram": "16gb", "gpu_brand": "nvidia", "price": "$1200", "purpose": "gaming"}
+
+#Function to time one fresh process: the import of the pipeline, warmup() (unless skipped) and the first two recommendations
+def child(strategy, warm, fake):
+    start = time.perf_counter()
+    import laptop_crs
+    module = laptop_crs.pipeline(strategy)
+    timings = {"import_ms": (time.perf_counter() - start) * 1000}
+    if fake and hasattr(module, "client"):
+        from fake_llm import FakeOpenAIClient
+        module.client = FakeOpenAIClient()
+    if warm:
+        start = time.perf_counter()
+        laptop_crs.warmup(strategy)
+        timings["warmup_ms"] = (time.perf_counter() - start) * 1000
+    for name in ("first_query_ms", "second_query_ms"):
+        start = time.perf_counter()
+        laptop_crs.recommend(PREFERENCES, strategy)
+        timings[name] = (time.perf_counter() - start) * 1000
+    print(json.dumps(timings))
+
+#Function to run the child in a new interpreter, so nothing is imported or loaded yet
+def measure(strategy, warm, fake):
+    command = [sys.executable, __file__, "--child", strategy] + ([] if warm else ["--cold"]) + ([] if fake else ["--openai"])
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold import and first-query latency of the CRS pipelines against their budget.")
+    parser.add_argument("--strategies", nargs="+", default=["rag", "fine-tuned", "combined"])
+    parser.add_argument("--openai", action="store_true", help="Send the GPT-4o requests to the OpenAI API instead of the local fake client")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--first-query-budget-ms", type=float, default=FIRST_QUERY_BUDGET_MS)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--cold", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, not args.cold, not args.openai)
+        return
+    over_budget = []
+    for strategy in args.strategies:
+        warm = measure(strategy, True, not args.openai)
+        cold = measure(strategy, False, not args.openai)
+        print(f"{strategy:>10}: import {warm['import_ms']:.0f}ms, warmup {warm['warmup_ms']:.0f}ms, first query {warm['first_query_ms']:.1f}ms after warmup "
+              f"({cold['first_query_ms']:.0f}ms without it), second query {warm['second_query_ms']:.1f}ms")
+        if warm["import_ms"] > args.import_budget_ms:
+            over_budget.append(f"{strategy} import {warm['import_ms']:.0f}ms > {args.import_budget_ms:.0f}ms")
+        if warm["first_query_ms"] > args.first_query_budget_ms:
+            over_budget.append(f"{strategy} first query {warm['first_query_ms']:.0f}ms > {args.first_query_budget_ms:.0f}ms")
+    for line in over_budget:
+        print(f"Over budget: {line}")
+    if over_budget:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import numpy as np
+import hashlib
+import json
+import os
+from record_store import Record, is_valid_record
+
+#Incremental updates of the retrieval catalog: laptops are added, changed and removed in the loaded index without refitting the vectorizer or rebuilding the index
+#Every laptop has a stable product id (a hash of its title), mapped to the row of the index that holds it, like a FAISS IndexIDMap
+#Rows are only ever appended: a changed laptop gets a new row and its old row is marked removed, removed rows are left out of every search
+#The vocabulary and the IDF weights stay frozen, the drift of the IDF weights of the live catalog is tracked to decide when a full refit is needed
+#Updates are written to updates.jsonl in the artifact directory and replayed when the artifact is loaded, until the artifact is saved again
+
+#Largest IDF drift (or share of the words of the catalog missing from the frozen vocabulary) the vectorizer is kept for, past it the catalog is refitted
+REFIT_DRIFT_THRESHOLD = 0.05
+#Number of updates in the journal after which the artifact is saved again with the updates merged in
+COMPACT_AFTER_UPDATES = 1000
+JOURNAL_NAME = "updates.jsonl"
+
+#Function to hash a string into a positive 63-bit integer, the type FAISS uses for ids
+def hash_id(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little') >> 1
+
+#Function to get the stable product id of a laptop from its title
+def product_id(title):
+    return hash_id(str(title).strip())
+
+#Function to give every row of a catalog its product id, listings with the same title are numbered in the order they appear
+def assign_product_ids(titles):
+    seen = {}
+    ids = []
+    for title in titles:
+        title = str(title).strip()
+        seen[title] = seen.get(title, 0) + 1
+        ids.append(product_id(title) if seen[title] == 1 else product_id(f"{title}#{seen[title]}"))
+    return ids
+
+#Function to hash the text of a laptop, to find the laptops whose content changed
+def content_hash(text):
+    return hash_id(text)
+
+#Function to count the distinct words of a laptop text and the ones the frozen vocabulary does not know
+def word_counts(vectorizer, text):
+    words = set(vectorizer.build_analyzer()(text))
+    return sum(word not in vectorizer.vocabulary_ for word in words), len(words)
+
+#Document frequencies of the vocabulary over the live catalog, compared with the IDF weights the vectorizer was fitted with
+#The distinct words of every laptop are counted as well, to see how much of the catalog the frozen vocabulary misses
+class DriftTracker:
+    def __init__(self, fitted_idf, document_frequencies, n_docs, smooth_idf=True, oov_words=0, words=0):
+        self.fitted_idf = np.asarray(fitted_idf, dtype=np.float64)
+        self.document_frequencies = np.array(document_frequencies, dtype=np.int64)
+        self.n_docs = n_docs
+        self.smooth_idf = smooth_idf
+        self.oov_words = oov_words
+        self.words = words
+
+    #Function to start tracking from the TF-IDF matrix the vectorizer was fitted on, every word of it is in the vocabulary
+    @classmethod
+    def from_matrix(cls, matrix, vectorizer):
+        matrix = matrix.tocsr()
+        return cls(vectorizer.idf_, np.bincount(matrix.indices, minlength=matrix.shape[1]), matrix.shape[0], vectorizer.smooth_idf, 0, matrix.nnz)
+
+    def add(self, vector, oov_words, words):
+        self.document_frequencies[vector.indices] += 1
+        self.n_docs += 1
+        self.oov_words += oov_words
+        self.words += words
+
+    def remove(self, vector, oov_words, words):
+        self.document_frequencies[vector.indices] -= 1
+        self.n_docs -= 1
+        self.oov_words -= oov_words
+        self.words -= words
+
+    #IDF weights of the live catalog, with the same formula as TfidfVectorizer
+    def current_idf(self):
+        smooth = int(self.smooth_idf)
+        return np.log((self.n_docs + smooth) / (self.document_frequencies + smooth)) + 1
+
+    #Function to measure the drift: the change of the IDF weights weighted by how many laptops use each word, and the share of new words the frozen vocabulary ignores
+    def drift(self):
+        weights = self.document_frequencies
+        fitted = np.sum(weights * self.fitted_idf)
+        idf_drift = float(np.sum(weights * np.abs(self.current_idf() - self.fitted_idf)) / fitted) if fitted else 0.0
+        return {"idf_drift": idf_drift, "oov_share": self.oov_words / self.words if self.words else 0.0}
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "document_frequencies.npy"), self.document_frequencies)
+        with open(os.path.join(directory, "drift.json"), 'w') as file:
+            json.dump({"n_docs": self.n_docs, "smooth_idf": self.smooth_idf, "oov_words": self.oov_words, "words": self.words}, file)
+
+    @classmethod
+    def load(cls, directory, fitted_idf):
+        with open(os.path.join(directory, "drift.json")) as file:
+            state = json.load(file)
+        return cls(fitted_idf, np.load(os.path.join(directory, "document_frequencies.npy")), **state)
+
+#Product ids, content hashes and live flags of the rows of the index, with the drift of the catalog
+class Catalog:
+    def __init__(self, product_ids, content_hashes, live, drift):
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.content_hashes = np.asarray(content_hashes, dtype=np.int64)
+        self.live = np.array(live, dtype=bool)
+        self.drift = drift
+        self.rows = {int(self.product_ids[row]): row for row in np.flatnonzero(self.live)}
+        self.live_ids = None
+        self.journal_path = None
+        self.journal_length = 0
+        #Raised by every added or removed row, caches of search results are only valid for one version
+        self.version = 0
+
+    @classmethod
+    def build(cls, titles, texts, drift):
+        return cls(assign_product_ids(titles), [content_hash(text) for text in texts], np.ones(len(texts), dtype=bool), drift)
+
+    #Function to restrict the allowed ids of a search to the live rows, nothing changes while no laptop has been removed
+    def restrict(self, allowed_ids):
+        if len(self.rows) == len(self.live):
+            return allowed_ids
+        if allowed_ids is None:
+            if self.live_ids is None:
+                self.live_ids = np.flatnonzero(self.live)
+            return self.live_ids
+        allowed_ids = np.asarray(allowed_ids)
+        return allowed_ids[self.live[allowed_ids]]
+
+    def add_row(self, product_id, text_hash):
+        row = len(self.live)
+        self.product_ids = np.append(self.product_ids, product_id)
+        self.content_hashes = np.append(self.content_hashes, text_hash)
+        self.live = np.append(self.live, True)
+        self.rows[product_id] = row
+        self.live_ids = None
+        self.version += 1
+        return row
+
+    def remove_row(self, row):
+        self.live[row] = False
+        del self.rows[int(self.product_ids[row])]
+        self.live_ids = None
+        self.version += 1
+
+    #Function to write an update to the journal of the artifact the catalog was loaded from
+    def log(self, update):
+        if self.journal_path is None:
+            return
+        with open(self.journal_path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(update) + "\n")
+        self.journal_length += 1
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "product_ids.npy"), self.product_ids)
+        np.save(os.path.join(directory, "content_hashes.npy"), self.content_hashes)
+        np.save(os.path.join(directory, "live.npy"), self.live)
+        self.drift.save(directory)
+
+    @classmethod
+    def load(cls, directory, fitted_idf):
+        return cls(
+            np.load(os.path.join(directory, "product_ids.npy")),
+            np.load(os.path.join(directory, "content_hashes.npy")),
+            np.load(os.path.join(directory, "live.npy")),
+            DriftTracker.load(directory, fitted_idf),
+        )
+
+#Function to mark the row of a laptop removed and take it out of the document frequencies
+def remove_row(retriever, row):
+    text = retriever.texts[row]
+    retriever.catalog.remove_row(row)
+    retriever.catalog.drift.remove(retriever.vectorizer.transform([text]), *word_counts(retriever.vectorizer, text))
+
+#Function to add a laptop to the index, or replace the laptop with the same product id, gives back its product id
+#text is the combined text the laptop is searched by, it is built from the record when not given
+def upsert_laptop(retriever, title, descriptions, features, text=None, laptop_id=None):
+    catalog = retriever.catalog
+    record = Record(str(title).strip(), list(descriptions), list(features))
+    text = record.text() if text is None else text
+    laptop_id = product_id(record.title) if laptop_id is None else laptop_id
+    row = catalog.rows.get(laptop_id)
+    text_hash = content_hash(text)
+    if row is not None and catalog.content_hashes[row] == text_hash:
+        return laptop_id
+    #Placeholder records are never in the index, so upserting one removes the laptop
+    if not is_valid_record(*record):
+        if row is not None:
+            remove_laptop(retriever, laptop_id)
+        return laptop_id
+    if row is not None:
+        remove_row(retriever, row)
+    vector = retriever.vectorizer.transform([text])
+    retriever.add_vectors(vector)
+    retriever.texts.append(text)
+    retriever.records.append(record)
+    retriever.specs.extend([text])
+    catalog.add_row(laptop_id, text_hash)
+    catalog.drift.add(vector, *word_counts(retriever.vectorizer, text))
+    catalog.log({"op": "upsert", "id": laptop_id, "title": record.title, "descriptions": record.descriptions, "features": record.features, "text": text})
+    return laptop_id
+
+#Function to remove a laptop from the index by its product id, gives back False when it is not in the catalog
+def remove_laptop(retriever, laptop_id):
+    row = retriever.catalog.rows.get(laptop_id)
+    if row is None:
+        return False
+    remove_row(retriever, row)
+    retriever.catalog.log({"op": "remove", "id": laptop_id})
+    return True
+
+#Function to apply the updates of the journal of an artifact to the retriever loaded from it, later updates are written to the same journal
+def replay_journal(retriever, directory):
+    catalog = retriever.catalog
+    path = os.path.join(directory, JOURNAL_NAME)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as file:
+            updates = [json.loads(line) for line in file if line.strip()]
+        for update in updates:
+            if update["op"] == "upsert":
+                upsert_laptop(retriever, update["title"], update["descriptions"], update["features"], update["text"], update["id"])
+            else:
+                remove_laptop(retriever, update["id"])
+        catalog.journal_length = len(updates)
+    catalog.journal_path = path
+
+#Function to bring the index in line with a new version of the catalog, only the added, changed and removed laptops are touched
+#Gives back the number of laptops of each kind and the drift of the catalog after the changes
+def sync_catalog(retriever, texts, records):
+    catalog = retriever.catalog
+    wanted = dict(zip(assign_product_ids(records.titles), range(len(texts))))
+    removed = [laptop_id for laptop_id in catalog.rows if laptop_id not in wanted]
+    for laptop_id in removed:
+        remove_laptop(retriever, laptop_id)
+    added = changed = 0
+    for laptop_id, i in wanted.items():
+        row = catalog.rows.get(laptop_id)
+        if row is not None and catalog.content_hashes[row] == content_hash(texts[i]):
+            continue
+        if row is None:
+            added += 1
+        else:
+            changed += 1
+        upsert_laptop(retriever, *records[i], text=texts[i], laptop_id=laptop_id)
+    return {"added": added, "changed": changed, "removed": len(removed), **catalog.drift.drift()}
+
+#Function to check if the drift of the catalog is past the refit threshold
+def needs_refit(catalog, threshold=REFIT_DRIFT_THRESHOLD):
+    return max(catalog.drift.drift().values()) > threshold
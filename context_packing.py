@@ -0,0 +1,77 @@
+import re
+from instrumentation import timed
+
+#Context packing between retrieve_context and the ranking prompt of the Combined Model
+#Near-identical laptops are dropped, only the title, a short description and the specification list are kept, and laptops are added in score order until the token budget is full
+
+#Token budget of the retrieved laptops in the ranking prompt
+CONTEXT_TOKEN_BUDGET = 1500
+#Longest description kept for a laptop (in characters), the specification list is always kept whole
+MAX_DESCRIPTION_CHARS = 160
+#Share of title words two laptops need to have in common to count as the same product
+DUPLICATE_TITLE_SIMILARITY = 0.8
+
+#Pieces the token estimator counts: words (long words count once per 4 characters like BPE splits them), numbers and punctuation marks
+TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+#Version suffixes ("v1", "v2") and model codes ("IN3520KTMFJS01ORS1", "E1504FA-LK545WS") that tell apart listings of the same laptop
+TITLE_NOISE = re.compile(r"\bv\d+\b|\b(?=[a-z0-9-]*\d)(?=[a-z0-9-]*[a-z])[a-z0-9-]{8,}\b")
+TITLE_WORD = re.compile(r"[a-z0-9]+")
+
+#Function to estimate the number of tokens of a text offline, close enough to the GPT-4o tokenizer to fill a budget
+def estimate_tokens(text):
+    return sum((len(piece) + 3) // 4 if piece.isalpha() else 1 for piece in TOKEN_PATTERN.findall(text))
+
+#Function to estimate the number of tokens of the messages of a request, with the few tokens every message adds
+def prompt_tokens(messages):
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages)
+
+#Function to get the words of a title that identify the product, without the listing version and model codes
+def title_words(title):
+    return set(TITLE_WORD.findall(TITLE_NOISE.sub(" ", title.lower())))
+
+#Function to check if two titles describe the same product
+def same_product(words, other_words, similarity=DUPLICATE_TITLE_SIMILARITY):
+    if not words or not other_words:
+        return False
+    return len(words & other_words) / len(words | other_words) >= similarity
+
+#Function to write the compact text of one laptop: the title, the start of its description and its specification list
+def pack_record(title, descriptions, specs, max_description_chars=MAX_DESCRIPTION_CHARS):
+    description = " ".join(descriptions)
+    if len(description) > max_description_chars:
+        description = description[:max_description_chars].rsplit(" ", 1)[0] + "..."
+    parts = [title]
+    if description:
+        parts.append(description)
+    if specs:
+        parts.append("Specifications: " + ", ".join(specs))
+    return " | ".join(parts)
+
+#Function to pack the retrieved (record, score) results into the context of the ranking prompt
+#Gives back the packed text and a report with the number of laptops and the estimated tokens before and after packing
+@timed("pack_context")
+def pack_context(results, token_budget=CONTEXT_TOKEN_BUDGET, max_description_chars=MAX_DESCRIPTION_CHARS, similarity=DUPLICATE_TITLE_SIMILARITY):
+    packed, kept_words, duplicates, tokens = [], [], 0, 0
+    #The results are sorted from the closest match, so the best listing of every product is the one kept
+    for (title, descriptions, specs), _ in results:
+        words = title_words(title)
+        if any(same_product(words, other, similarity) for other in kept_words):
+            duplicates += 1
+            continue
+        record = pack_record(title, descriptions, specs, max_description_chars)
+        record_tokens = estimate_tokens(record) + 1
+        if tokens + record_tokens > token_budget:
+            #Always keep the closest match, even if it does not fit the budget alone
+            if packed:
+                break
+        packed.append(record)
+        kept_words.append(words)
+        tokens += record_tokens
+    report = {
+        "laptops_retrieved": len(results),
+        "laptops_kept": len(packed),
+        "duplicates_dropped": duplicates,
+        "context_tokens_before": estimate_tokens("\n".join(record.text() for record, _ in results)),
+        "context_tokens_after": tokens,
+    }
+    return "\n".join(packed), report
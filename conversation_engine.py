@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import Fine_tuned_GPT4o_CRS as fine_tuned
+from structured_turn import KEY_SPECS, RESPONSE_FORMAT, turn_messages, parse_turn
+from retrieval_cache import canonical_preferences
+from instrumentation import AsyncInstrumentedClient
+
+#Asyncio conversation engine for the Fine-Tuned GPT-4o CRS and the Combined Model CRS
+#The final recommendation is streamed to the user as its tokens arrive, and the work before it (the retrieval and the packed context of the Combined Model, the local ranking of the Fine-Tuned GPT-4o CRS) runs speculatively in a thread after every turn, while the follow-up question is generated and while the user types the next answer
+
+#Function to read the next user input without blocking the event loop
+async def console_input(prompt):
+    return await asyncio.to_thread(input, prompt)
+
+#Function to write text to the console as soon as it is available
+def console_write(text):
+    print(text, end="", flush=True)
+
+#Background worker that prepares the final recommendation step for the preferences known so far, while the conversation goes on
+#Only the job of the latest preferences matters: a job that has not started yet is cancelled when newer preferences arrive, and the result is reused when the final preferences have the same key
+class Speculation:
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.key = None
+        self.future = None
+        self.counters = {"started": 0, "cancelled": 0, "reused": 0, "missed": 0}
+
+    #Function to start the job for the preferences of key, unless the job of the same key is already there
+    def start(self, key, function, *args):
+        if key == self.key:
+            return
+        if self.future is not None and self.future.cancel():
+            self.counters["cancelled"] += 1
+        self.key, self.future = key, self.executor.submit(function, *args)
+        self.counters["started"] += 1
+
+    #Function to get the result for the final preferences, from the speculative job when its key matches (waiting for it if it is still running), otherwise computed now
+    async def result(self, key, function, *args):
+        if key == self.key and not self.future.cancelled():
+            self.counters["reused"] += 1
+            return await asyncio.wrap_future(self.future)
+        self.counters["missed"] += 1
+        return await asyncio.to_thread(function, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+#Function to send a request to the Fine-Tuned GPT-4o model and wait for the whole response
+async def complete(client, messages, **kwargs):
+    response = await client.chat.completions.create(model=fine_tuned.FINE_TUNED_MODEL, messages=messages, **kwargs)
+    return response.choices[0].message.content.strip()
+
+#Function to extract the preferences of a turn, in the structured mode of the CRS module the same request also writes the next question and tells the spec it asks about
+async def extract_turn(client, module, user_input, preferences, already_asked=()):
+    if module.STRUCTURED_TURNS:
+        return parse_turn(await complete(client, turn_messages(user_input, preferences, already_asked), response_format=RESPONSE_FORMAT), preferences, already_asked)
+    return module.parse_specs(await complete(client, module.extract_specs_messages(user_input, preferences)), preferences), None, None
+
+#Function to send a request to the Fine-Tuned GPT-4o model and write the tokens of the response as they arrive, gives back the whole response and the time to the first token in seconds
+#A stream without any content (an empty completion) counts its whole duration as the time to the first token
+async def stream_completion(client, messages, write, **kwargs):
+    start = time.perf_counter()
+    first_token = None
+    parts = []
+    stream = await client.chat.completions.create(model=fine_tuned.FINE_TUNED_MODEL, messages=messages, stream=True, **kwargs)
+    async for chunk in stream:
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        parts.append(chunk.choices[0].delta.content)
+        write(chunk.choices[0].delta.content)
+    write("\n")
+    if first_token is None:
+        first_token = time.perf_counter() - start
+    return "".join(parts).strip(), first_token
+
+#Function to turn preferences into the key of a speculative job
+def preferences_key(preferences):
+    return json.dumps(preferences, sort_keys=True, default=str)
+
+#Asyncio version of recommend_laptop_fine_tuned_gpt4o_only, gives back the preferences, the recommendations and the time to the first recommendation token
+async def fine_tuned_conversation(client, read_input=console_input, write=console_write, top_n=5):
+    preferences = {} #Track the prefrences of the user
+    speculation = Speculation() #Ranking running in the background for the latest preferences
+    write("LaptopGPT: Hello! I'm your laptop advisor.\n")
+    write("LaptopGPT: Tell me what you're looking for in a laptop, like brand, budget, RAM, or purpose.\n")
+    i = 0 #i variable to keep the CRS from querying missing specs one more time than needed
+    for _ in range(3): #3 interactions between user and LaptopGPT
+        user_input = await read_input("User: ")
+        preferences, question, _ = await extract_turn(client, fine_tuned, user_input, preferences)
+        write(f"LaptopGPT: {fine_tuned.format_preferences(preferences)}\n")
+        #Rank the laptops for these preferences right away, the ranking reads the exact values so they are the key
+        speculation.start(preferences_key(preferences), fine_tuned.rank_laptops, dict(preferences), top_n)
+        missing_specs = [spec for spec in KEY_SPECS if spec not in preferences]
+        if not missing_specs or len(preferences) >= 5:
+            break
+        if i < 2:
+            write(f"LaptopGPT: {question or await complete(client, fine_tuned.missing_specs_messages(preferences, missing_specs[0]))}\n")
+            i += 1
+    #The laptops were ranked after the last turn and are shown right away, the explanations of the model are streamed after them
+    start = time.perf_counter()
+    ranked = await speculation.result(preferences_key(preferences), fine_tuned.rank_laptops, dict(preferences), top_n)
+    speculation.close()
+    write(f"LaptopGPT: Here are my top-{top_n} recommendations for you:\n\n{fine_tuned.ranked_list(ranked)}\n\nLaptopGPT: Why they fit you:\n")
+    wait = time.perf_counter() - start
+    explanations, first_token = await stream_completion(client, fine_tuned.top_n_messages(preferences, ranked), write, max_tokens=fine_tuned.EXPLANATION_TOKENS * top_n)
+    return {"preferences": preferences, "recommendations": fine_tuned.format_recommendations(ranked, explanations), "time_to_first_token": first_token,
+            "answer_wait": wait + first_token, "speculation": speculation.counters}
+
+#Function to retrieve the laptops for the preferences and pack them into the context of the ranking prompt
+def packed_context(combined, preferences, k):
+    rag_texts, _ = combined.pack_context(combined.retrieve_for_preferences(preferences, k), combined.CONTEXT_TOKEN_BUDGET)
+    return rag_texts
+
+#Asyncio version of recommend_laptop_combined_model, gives back the preferences, the recommendations and the time to the first recommendation token
+async def combined_conversation(client, read_input=console_input, write=console_write, k=30):
+    #Imported here so the Fine-Tuned GPT-4o conversation does not load the retriever
+    import Combined_Model_CRS as combined
+    preferences = {} #Track the prefrences of the user
+    already_asked = set() #Specs that have already been asked or already have been said by the user
+    speculation = Speculation() #Retrieval and context packing running in the background for the latest preferences
+    write("LaptopGPT: Hello! I'm your laptop advisor.\n")
+    write("LaptopGPT: Tell me what you're looking for in a laptop, like brand, budget, RAM, or purpose.\n")
+    i = 0 #i variable to keep the CRS from querying missing specs one more time than needed
+    for _ in range(3): #3 interactions between user and LaptopGPT
+        user_input = await read_input("User: ")
+        preferences, question, asked_spec = await extract_turn(client, combined, user_input, preferences, already_asked)
+        write(f"LaptopGPT: Your preferences so far:\n{preferences}\n")
+        #Start the retrieval and the packing of the context for these preferences right away, it runs while the follow-up question is generated and the user answers it
+        #Preferences that only changed in how they are written give the same results, so only a new canonical form starts a new job
+        speculation.start(preferences_key(canonical_preferences(preferences)), packed_context, combined, dict(preferences), k)
+        missing_specs = [spec for spec in KEY_SPECS if spec not in preferences and spec not in already_asked]
+        if not missing_specs or len(preferences) >= 5:
+            break
+        if i < 2:
+            #The question of the structured turn asks about its own spec, the fallback question about the first missing one
+            next_spec = asked_spec if question else missing_specs[0]
+            already_asked.add(next_spec)
+            write(f"LaptopGPT: {question or await complete(client, combined.missing_specs_messages(preferences, next_spec))}\n")
+            i += 1
+    #The job started after the last turn already matches the final preferences, so only the generation is left
+    start = time.perf_counter()
+    rag_texts = await speculation.result(preferences_key(canonical_preferences(preferences)), packed_context, combined, dict(preferences), k)
+    speculation.close()
+    write("LaptopGPT: Here are my top recommendations for you:\n\n")
+    wait = time.perf_counter() - start
+    recommendations, first_token = await stream_completion(client, combined.ranking_messages(preferences, rag_texts), write)
+    return {"preferences": preferences, "recommendations": recommendations, "time_to_first_token": first_token,
+            "answer_wait": wait + first_token, "speculation": speculation.counters}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the GPT-4o CRS conversation with streamed recommendations.")
+    parser.add_argument("--model", choices=["combined", "fine-tuned"], default="combined")
+    parser.add_argument("--fake", action="store_true", help="Use the local fake client instead of the OpenAI API")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="Seconds between the token chunks of the fake client")
+    args = parser.parse_args()
+
+    #The requests go through the scheduler of the process like those of the CRS modules, so they share its budgets, and the real ones its client
+    from llm_scheduler import AsyncScheduledClient
+    if args.fake:
+        from fake_llm import FakeAsyncOpenAIClient
+        client = AsyncScheduledClient(AsyncInstrumentedClient(FakeAsyncOpenAIClient(latency=0.3, chunk_delay=args.chunk_delay)))
+    else:
+        from llm_cache import LLMCache, AsyncCachedClient
+        from llm_scheduler import shared_async_client
+        client = AsyncCachedClient(AsyncScheduledClient(AsyncInstrumentedClient(shared_async_client())), LLMCache('llm_cache.sqlite'))
+    conversation = combined_conversation if args.model == "combined" else fine_tuned_conversation
+    result = asyncio.run(conversation(client))
+    print(f"\n(Time to first recommendation token: {result['time_to_first_token']:.2f}s, {result['answer_wait']:.2f}s after the last answer, speculative jobs: {result['speculation']})")
+
+if __name__ == "__main__":
+    main()
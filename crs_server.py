@@ -0,0 +1,294 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from structured_turn import KEY_SPECS
+from instrumentation import metrics, timed
+
+#Long-running HTTP server for the three CRS pipelines
+#The catalog and the index are loaded once and shared by every conversation, the preferences of every conversation live in the session store
+#  POST   /sessions                 {"strategy": "rag" | "fine-tuned" | "combined"} -> {"session_id", "reply"}
+#  POST   /sessions/<id>/messages   {"message": "..."} -> {"reply", "preferences", "done"}
+#  GET    /sessions/<id>            -> the state of the conversation
+#  DELETE /sessions/<id>
+#  GET    /health                   -> number of open sessions, loaded indexes, the retrieval cache stats and the LLM scheduler stats
+#  GET    /metrics                  -> stage timings, LLM requests, token usage and cache hits in the Prometheus text format (with --metrics)
+
+GREETING = "Hello! I'm your laptop advisor. Tell me what you're looking for in a laptop, like brand, budget, RAM, or purpose."
+#Number of user inputs before the CRS gives out its recommendation, like the 3 interactions of the console loops
+MAX_TURNS = 3
+
+#State of one conversation
+class Session:
+    def __init__(self, strategy):
+        self.id = uuid.uuid4().hex
+        self.strategy = strategy
+        self.preferences = {}
+        self.asked = set()
+        self.turns = 0
+        self.questions = 0
+        self.done = False
+        self.recommendations = None
+        self.last_active = time.time()
+        #Turns of one session are handled one at a time, different sessions run concurrently
+        self.lock = threading.Lock()
+
+    def state(self):
+        return {"session_id": self.id, "strategy": self.strategy, "preferences": self.preferences, "turns": self.turns, "done": self.done, "recommendations": self.recommendations}
+
+#In-process session store, sessions idle for longer than ttl_seconds are dropped
+class SessionStore:
+    def __init__(self, ttl_seconds=1800, max_sessions=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create(self, strategy):
+        session = Session(strategy)
+        with self.lock:
+            self.expire()
+            if len(self.sessions) >= self.max_sessions:
+                raise OverflowError("Too many open sessions, try again later.")
+            self.sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session:
+            session.last_active = time.time()
+        return session
+
+    def delete(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        for session_id in [session_id for session_id, session in self.sessions.items() if session.last_active < cutoff]:
+            del self.sessions[session_id]
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
+
+#Turn of the RAG only CRS: rule-based preference extraction, a canned question for a random missing spec, retrieval at the end
+def rag_turn(session, user_input):
+    import RAG_CRS as rag
+    rag.extract_preferences(user_input, session.preferences)
+    reply = [f"Got it! Your preferences so far:\n{rag.format_preferences(session.preferences)}"]
+    missing_specs = [spec for spec in KEY_SPECS if session.preferences.get(spec) is None and spec not in session.asked]
+    #session.turns counts the turns before this one
+    if missing_specs and len(session.preferences) < 5 and session.turns + 1 < MAX_TURNS:
+        spec = rag.random.choice(missing_specs)
+        session.asked.add(spec)
+        reply.append(rag.random.choice(rag.SPEC_PROMPTS.get(spec, ["Could you provide more details about this?"])))
+        return "\n".join(reply)
+    recommendations = rag.recommend_from_preferences(session.preferences)
+    session.recommendations = [text for text, _ in recommendations]
+    session.done = True
+    if not recommendations:
+        reply.append("Sorry, I couldn't find any matches. Try providing more details or adjusting your preferences.")
+    else:
+        reply.append(f"Here are the Top-{len(recommendations)} laptops for you:\n" + "\n".join(f"{i + 1}. {text}" for i, text in enumerate(session.recommendations)))
+    return "\n".join(reply)
+
+#Turn of the GPT-4o CRS (fine-tuned only or combined): the structured turn request extracts the preferences and writes the next question
+#Gives back the spec to ask about (the one of the structured question, otherwise the first missing one) and the question, or None when the conversation is done
+def gpt_turn(module, session, user_input, already_asked):
+    if module.STRUCTURED_TURNS:
+        session.preferences, question, asked_spec = module.extract_specs_and_question(user_input, session.preferences, already_asked)
+    else:
+        session.preferences, question, asked_spec = module.extract_specs(user_input, session.preferences), None, None
+    missing_specs = [spec for spec in KEY_SPECS if spec not in session.preferences and spec not in already_asked]
+    if missing_specs and len(session.preferences) < 5 and session.turns + 1 < MAX_TURNS and session.questions < 2:
+        session.questions += 1
+        return (asked_spec if question else missing_specs[0]), question
+    return None, None
+
+def fine_tuned_turn(session, user_input):
+    import Fine_tuned_GPT4o_CRS as fine_tuned
+    spec, question = gpt_turn(fine_tuned, session, user_input, ())
+    reply = [fine_tuned.format_preferences(session.preferences)]
+    if spec:
+        reply.append(question or fine_tuned.query_missing_specs(session.preferences, spec))
+        return "\n".join(reply)
+    session.recommendations = fine_tuned.recommend_laptops_top_n(session.preferences, 5)
+    session.done = True
+    reply.append(f"Here are my top-5 recommendations for you:\n\n{session.recommendations}")
+    return "\n".join(reply)
+
+def combined_turn(session, user_input):
+    import Combined_Model_CRS as combined
+    spec, question = gpt_turn(combined, session, user_input, session.asked)
+    reply = [f"Your preferences so far:\n{session.preferences}"]
+    if spec:
+        session.asked.add(spec)
+        reply.append(question or combined.query_missing_specs(session.preferences, spec))
+        return "\n".join(reply)
+    session.recommendations = combined.recommend_from_preferences(session.preferences, verbose=False)
+    session.done = True
+    reply.append(f"Here are my top recommendations for you:\n\n{session.recommendations}")
+    return "\n".join(reply)
+
+STRATEGIES = {"rag": rag_turn, "fine-tuned": fine_tuned_turn, "combined": combined_turn}
+
+#Function to handle one user message of a session, gives back the reply of the CRS
+@timed("turn")
+def handle_message(session, user_input):
+    with session.lock:
+        if session.done:
+            return "I've already given my recommendations, start a new session to look for another laptop."
+        reply = STRATEGIES[session.strategy](session, user_input)
+        #A turn that failed is not counted, so the user can send it again
+        session.turns += 1
+        return reply
+
+class CRSRequestHandler(BaseHTTPRequestHandler):
+    store = None
+    #Scheduler of the GPT-4o requests of the served pipelines, the one of the process when it is None
+    scheduler = None
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return None
+        return body if isinstance(body, dict) else None
+
+    #Function to split the path into ("sessions", id, "messages") parts
+    def route(self):
+        return [part for part in self.path.split("?", 1)[0].split("/") if part]
+
+    def do_GET(self):
+        parts = self.route()
+        if parts == ["health"]:
+            import retrieval
+            #Hit rate of the retrieval caches of the loaded pipelines, a pipeline that has not been warmed up yet has no cache
+            caches = {}
+            for strategy, name in (("rag", "RAG_CRS"), ("combined", "Combined_Model_CRS")):
+                cache = getattr(sys.modules.get(name), "retrieval_cache", None)
+                if cache is not None:
+                    caches[strategy] = cache.stats()
+            health = {"sessions": len(self.store), "indexes_loaded": len(retrieval.loaded_retrievers), "retrieval_cache": caches}
+            scheduler = self.scheduler or getattr(sys.modules.get("llm_scheduler"), "scheduler", None)
+            if scheduler is not None:
+                #Queue depth, waits and retries of the GPT-4o requests
+                health["llm_scheduler"] = scheduler.stats()
+            self.send_json(200, health)
+        elif parts == ["metrics"]:
+            data = metrics.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif len(parts) == 2 and parts[0] == "sessions" and self.store.get(parts[1]):
+            self.send_json(200, self.store.get(parts[1]).state())
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        parts = self.route()
+        body = self.read_json()
+        if body is None:
+            self.send_json(400, {"error": "The request body must be a JSON object"})
+        elif parts == ["sessions"]:
+            strategy = body.get("strategy", "combined")
+            if strategy not in STRATEGIES:
+                self.send_json(400, {"error": f"Unknown strategy '{strategy}', choose one of {list(STRATEGIES)}"})
+                return
+            try:
+                session = self.store.create(strategy)
+            except OverflowError as e:
+                self.send_json(503, {"error": str(e)})
+                return
+            self.send_json(201, {"session_id": session.id, "strategy": strategy, "reply": GREETING})
+        elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "messages":
+            session = self.store.get(parts[1])
+            if not session:
+                self.send_json(404, {"error": "Unknown session"})
+            elif not isinstance(body.get("message"), str):
+                self.send_json(400, {"error": "The request body needs a 'message' string"})
+            else:
+                try:
+                    reply = handle_message(session, body["message"])
+                except Exception as e:
+                    self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+                    return
+                self.send_json(200, {"reply": reply, "preferences": session.preferences, "done": session.done})
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_DELETE(self):
+        parts = self.route()
+        if len(parts) == 2 and parts[0] == "sessions" and self.store.delete(parts[1]):
+            self.send_json(200, {"deleted": parts[1]})
+        else:
+            self.send_json(404, {"error": "Unknown session"})
+
+    def log_message(self, format, *args):
+        pass
+
+class CRSServer(ThreadingHTTPServer):
+    daemon_threads = True
+    #Room for many clients connecting at once, the default backlog of 5 resets connections under load
+    request_queue_size = 256
+
+#Function to load the pipelines once and create the server, strategies that are not served are not imported
+def create_server(host="127.0.0.1", port=8000, strategies=("rag", "fine-tuned", "combined"), fake_llm_latency=None, session_ttl=1800):
+    import laptop_crs
+    scheduler = None
+    for strategy in strategies:
+        module = laptop_crs.pipeline(strategy)
+        if fake_llm_latency is not None and hasattr(module, "client"):
+            #Answer the GPT-4o requests with the local fake client, every session shares it and one scheduler like they share the real client
+            from fake_llm import FakeOpenAIClient
+            from llm_cache import LLMCache, CachedClient
+            from llm_scheduler import LLMScheduler, ScheduledClient
+            from instrumentation import InstrumentedClient
+            if scheduler is None:
+                #Budgets the fake client never runs out of, so a load test measures the server and not the rate limits of the OpenAI account
+                scheduler = LLMScheduler(requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12)
+            module.client = CachedClient(ScheduledClient(InstrumentedClient(FakeOpenAIClient(latency=fake_llm_latency)), scheduler), LLMCache(None))
+        #The index, the scorer and the client are loaded before the first conversation, not by it
+        module.warmup()
+    handler = type("Handler", (CRSRequestHandler,), {"store": SessionStore(ttl_seconds=session_ttl), "scheduler": scheduler})
+    return CRSServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the CRS pipelines to many concurrent conversations over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--strategies", nargs="+", default=["rag", "fine-tuned", "combined"], choices=list(STRATEGIES))
+    parser.add_argument("--fake-llm", type=float, default=None, metavar="LATENCY", help="Use the local fake client with this latency in seconds instead of the OpenAI API")
+    parser.add_argument("--metrics", action="store_true", help="Record the stage timings, LLM requests and cache hits and serve them on /metrics")
+    parser.add_argument("--metrics-log", default=None, help="Also write every recorded event as a JSON line to this file")
+    args = parser.parse_args()
+
+    if args.metrics or args.metrics_log:
+        metrics.enable(args.metrics_log)
+
+    server = create_server(args.host, args.port, args.strategies, args.fake_llm)
+    print(f"Serving {', '.join(args.strategies)} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import numpy as np
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from preference_extractor import extract_preferences
+from spec_index import INR_PER_USD, PRICE_CATALOG, title_key
+import laptop_crs
+from llm_scheduler import BATCH, priority
+
+#Offline evaluation of the three CRS pipelines: every conversation of the validation set is replayed through extraction -> retrieval -> ranking
+#The GPT-4o requests go to the deterministic local fake client unless --openai is given, so runs are comparable between changes
+#The fake client is no stand-in for the extraction of the fine-tuned model, so it answers the extraction requests of the labelled conversations with their labels:
+#with it the metrics of the GPT-4o pipelines measure the retrieval and the ranking for the right preferences, not the extraction
+#A recommendation is relevant when the laptops.csv row of the model it names meets every hand-labelled hard constraint of the user (budget, RAM, processor, ...),
+#and it gains one more point when it names the laptop of the reference answer
+#The hard constraints come from LABELS and are checked by meets_label, not by the SpecIndex rules the pre-filter and the ranker pick the laptops with,
+#so only the labelled conversations are scored, the others are still replayed for the latencies
+
+#Names the reference answers use for the recommended laptop, e.g. "I recommend the Acer Aspire 5 A515-58M, featuring ..."
+REFERENCE_PATTERN = re.compile(r"recommend(?:ing)?\s+(?:the\s+)?(.+?)(?:,|\s+with\b|\s+featuring\b|\s+which\b|\.\s)", re.IGNORECASE)
+#Numbered items of a ranked list written by the model
+RANKED_ITEM = re.compile(r"^\s*\**\s*(\d+)[.)]\s*(.+)$")
+NAME_WORD = re.compile(r"[a-z0-9]+")
+#Slowdowns smaller than this (in milliseconds) are timer noise, not regressions
+MIN_SLOWDOWN_MS = 0.5
+#Hand-labelled hard constraints of the validation chats, one {"turns": [...], "preferences": {...}} per line
+LABELS = 'laptop_chat_validation_labels.jsonl'
+#How far the display size of a laptop may be from the labelled screen size (in inches)
+LABEL_SCREEN_TOLERANCE = 0.5
+
+#Function to load the conversations of a chat dataset as (user turns, reference answer) pairs
+def load_conversations(path):
+    conversations = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            messages = json.loads(line)["messages"]
+            turns = [message["content"] for message in messages if message["role"] == "user"]
+            answers = [message["content"] for message in messages if message["role"] == "assistant"]
+            conversations.append((turns, answers[-1] if answers else ""))
+    return conversations
+
+#Function to load the hand-labelled preferences by the user turns of their conversation, gives back {} when there is no label file
+def load_labels(path):
+    labels = {}
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                label = json.loads(line)
+                labels[tuple(label["turns"])] = label["preferences"]
+    return labels
+
+#Rows of laptops.csv as read from the file, looked up by the model title a recommendation starts with
+class Catalog:
+    def __init__(self, csv_path=PRICE_CATALOG):
+        with open(csv_path, newline='', encoding='utf-8') as file:
+            self.rows = {title_key(row["Model"]): row for row in csv.DictReader(file)}
+
+    #Function to get the catalog row of every recommendation, None when it names no laptop of the catalog
+    def lookup(self, recommendations):
+        return [self.rows.get(title_key(text.replace("*", ""))) for text in recommendations]
+
+#Function to check a laptops.csv row against one hand-labelled constraint, the labels only use these forms:
+#price "$750" (the most the user pays), ram "16GB" (the least RAM), screen_size "15.6 inch", processor "Core i5" or "Ryzen 7" (the processor tier) and gpu_brand "nvidia"
+def meets_label(row, spec, value):
+    if spec == "price":
+        return float(row["Price"]) / INR_PER_USD <= float(value.lstrip("$"))
+    if spec == "ram":
+        return float(row["ram_memory"]) >= float(value.upper().removesuffix("GB"))
+    if spec == "screen_size":
+        return abs(float(row["display_size"]) - float(value.split()[0])) <= LABEL_SCREEN_TOLERANCE
+    if spec == "processor":
+        return row["processor_tier"].lower() == value.lower()
+    if spec == "gpu_brand":
+        return row["gpu_brand"].lower() == value.lower()
+    raise ValueError(f"No matcher for the labelled spec {spec}")
+
+#Function to read the name of the recommended laptop out of a reference answer
+def reference_name(answer):
+    match = REFERENCE_PATTERN.search(answer)
+    return match.group(1) if match else ""
+
+#Function to split the ranked list written by the model into one text per recommended laptop
+def split_ranked_list(text):
+    items = []
+    for line in text.splitlines():
+        match = RANKED_ITEM.match(line)
+        if match:
+            items.append(match.group(2))
+        elif items and line.strip():
+            items[-1] += " " + line.strip()
+    return items
+
+#Function to give every recommendation its gain: 1 if it is relevant to the labelled hard constraints, plus 1 if it names the reference laptop
+#A recommendation that names no laptop of the catalog cannot be checked, so it is not relevant
+def judge(recommendations, preferences, reference, catalog):
+    if not recommendations:
+        return np.zeros(0)
+    relevant = np.array([row is not None and all(meets_label(row, spec, value) for spec, value in preferences.items()) for row in catalog.lookup(recommendations)])
+    reference_words = set(NAME_WORD.findall(reference.lower()))
+    named = np.array([bool(reference_words) and len(reference_words & set(NAME_WORD.findall(text.lower()))) >= 0.6 * len(reference_words) for text in recommendations])
+    return relevant.astype(float) + (relevant & named)
+
+#Functions for the ranking metrics of one conversation at cutoff k
+def hit_rate(gains, k):
+    return float(np.any(gains[:k] > 0))
+
+def precision_at_k(gains, k):
+    return float(np.sum(gains[:k] > 0)) / k
+
+def ndcg_at_k(gains, k):
+    gains = gains[:k]
+    discounts = 1 / np.log2(np.arange(2, len(gains) + 2))
+    ideal = np.sum(np.sort(gains)[::-1] * discounts)
+    return float(np.sum(gains * discounts) / ideal) if ideal > 0 else 0.0
+
+#Collects the latency of every stage of the pipelines
+class StageTimer:
+    def __init__(self):
+        self.latencies = {}
+
+    def time(self, stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.latencies.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        return {
+            stage: {
+                "count": len(values),
+                "mean": float(np.mean(values) * 1000),
+                "p50": float(np.percentile(values, 50) * 1000),
+                "p95": float(np.percentile(values, 95) * 1000),
+                "p99": float(np.percentile(values, 99) * 1000),
+            }
+            for stage, values in self.latencies.items()
+        }
+
+#Function to extract the preferences of the user turns with the GPT-4o model of a CRS module
+def gpt_extraction(module, turns):
+    preferences = {}
+    for turn in turns:
+        if module.STRUCTURED_TURNS:
+            preferences, _, _ = module.extract_specs_and_question(turn, preferences)
+        else:
+            preferences = module.extract_specs(turn, preferences)
+    return preferences
+
+def rag_pipeline(timer, turns, k):
+    import RAG_CRS as rag
+    preferences = {}
+    for turn in turns:
+        timer.time("extraction", extract_preferences, turn, preferences)
+    results = timer.time("retrieval", rag.retrieve_context, rag.generate_query(preferences), k, preferences)
+    return timer.time("ranking", lambda: [rag.format_recommendation(record.title, record.descriptions, record.features) for record, _ in results])
+
+def fine_tuned_pipeline(timer, turns, k):
+    import Fine_tuned_GPT4o_CRS as fine_tuned
+    preferences = timer.time("extraction", gpt_extraction, fine_tuned, turns)
+    return split_ranked_list(timer.time("ranking", fine_tuned.recommend_laptops_top_n, preferences, k))
+
+def combined_pipeline(timer, turns, k):
+    import Combined_Model_CRS as combined
+    preferences = timer.time("extraction", gpt_extraction, combined, turns)
+    rag_results = timer.time("retrieval", combined.retrieve_context, combined.preferences_query(preferences), 30, preferences)
+    def rank():
+        rag_texts, _ = combined.pack_context(rag_results, combined.CONTEXT_TOKEN_BUDGET)
+        response = combined.get_client().chat.completions.create(model=combined.FINE_TUNED_MODEL, messages=combined.ranking_messages(preferences, rag_texts))
+        return response.choices[0].message.content.strip()
+    return split_ranked_list(timer.time("ranking", rank))
+
+PIPELINES = {"rag": rag_pipeline, "fine-tuned": fine_tuned_pipeline, "combined": combined_pipeline}
+
+#Function to replay every conversation through one pipeline, gives back its metrics (over the labelled conversations), stage latencies and throughput
+def evaluate_pipeline(name, conversations, k, labels, catalog):
+    timer = StageTimer()
+    metrics = {"hit_rate": [], "precision_at_k": [], "ndcg_at_k": []}
+    start = time.perf_counter()
+    for turns, answer in conversations:
+        recommendations = timer.time("total", PIPELINES[name], timer, turns, k)
+        truth = labels.get(tuple(turns))
+        if truth is None:
+            continue
+        gains = judge(recommendations[:k], truth, reference_name(answer), catalog)
+        metrics["hit_rate"].append(hit_rate(gains, k))
+        metrics["precision_at_k"].append(precision_at_k(gains, k))
+        metrics["ndcg_at_k"].append(ndcg_at_k(gains, k))
+    seconds = time.perf_counter() - start
+    return {
+        "conversations": len(conversations),
+        "labelled_conversations": len(metrics["hit_rate"]),
+        "metrics": {metric: float(np.mean(values)) for metric, values in metrics.items()},
+        "latency_ms": timer.summary(),
+        "throughput_conversations_per_s": len(conversations) / seconds,
+    }
+
+#Function to compare a report with a baseline report, gives back the quality drops and slowdowns beyond the tolerances
+#The metrics of reports whose preferences came from another extraction measure different things, so only their latencies are compared
+def regressions(report, baseline, quality_tolerance, max_slowdown):
+    found = []
+    same_extraction = report.get("extraction") == baseline.get("extraction")
+    for name, result in report["pipelines"].items():
+        base = baseline.get("pipelines", {}).get(name)
+        if not base:
+            continue
+        for metric, value in (result["metrics"] if same_extraction else {}).items():
+            if value < base["metrics"].get(metric, 0) - quality_tolerance:
+                found.append(f"{name} {metric}: {base['metrics'][metric]:.3f} -> {value:.3f}")
+        for stage, latency in result["latency_ms"].items():
+            base_p95 = base["latency_ms"].get(stage, {}).get("p95")
+            if base_p95 and latency["p95"] > base_p95 * max_slowdown and latency["p95"] - base_p95 > MIN_SLOWDOWN_MS:
+                found.append(f"{name} {stage} p95: {base_p95:.2f}ms -> {latency['p95']:.2f}ms")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the validation chats through the CRS pipelines and report quality and latency.")
+    parser.add_argument("--data", default="laptop_chat_validation.jsonl")
+    parser.add_argument("--pipelines", nargs="+", default=list(PIPELINES), choices=list(PIPELINES))
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--max-conversations", type=int, default=None)
+    parser.add_argument("--labels", default=LABELS, help="Hand-labelled preferences of the conversations, only these are scored")
+    parser.add_argument("--openai", action="store_true", help="Send the GPT-4o requests to the OpenAI API instead of the local fake client")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="Seconds the fake client takes per request")
+    parser.add_argument("--output", default="eval_report.json")
+    parser.add_argument("--baseline", default=None, help="Earlier report to check for regressions, exits with 1 when one is found")
+    parser.add_argument("--quality-tolerance", type=float, default=0.01)
+    parser.add_argument("--max-slowdown", type=float, default=1.25, help="Largest allowed ratio of p95 stage latency against the baseline")
+    args = parser.parse_args()
+
+    conversations = load_conversations(args.data)[:args.max_conversations]
+    labels = load_labels(args.labels)
+    if not any(tuple(turns) in labels for turns, _ in conversations):
+        parser.error(f"none of the conversations of {args.data} is labelled in {args.labels}")
+    catalog = Catalog()
+    if not args.openai:
+        from fake_llm import FakeOpenAIClient
+        from instrumentation import InstrumentedClient
+        from llm_scheduler import LLMScheduler, ScheduledClient
+        #The fake requests go through the scheduler like the real ones, with budgets it never runs out of so the timings only hold its own overhead
+        scheduler = LLMScheduler(requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12)
+        extractions = {turns[-1]: preferences for turns, preferences in labels.items()}
+        for name in ("fine-tuned", "combined"):
+            if name in args.pipelines:
+                laptop_crs.pipeline(name).client = ScheduledClient(InstrumentedClient(FakeOpenAIClient(latency=args.fake_latency, extractions=extractions)), scheduler)
+        print("The fake client answers the extraction requests with the labelled preferences, the GPT-4o extraction is not measured (use --openai for it)")
+    #Load the retrievers, the scorer and the clients up front, so the first conversation is not timed with them
+    laptop_crs.warmup(*args.pipelines)
+    report = {"dataset": args.data, "k": args.k, "client": "openai" if args.openai else "fake",
+              "extraction": "model" if args.openai else "labelled for the GPT-4o pipelines", "pipelines": {}}
+    for name in args.pipelines:
+        #The replayed conversations are a batch job, they must not hold up the users of a CRS sharing the process
+        with priority(BATCH):
+            result = evaluate_pipeline(name, conversations, args.k, labels, catalog)
+        report["pipelines"][name] = result
+        metrics = result["metrics"]
+        stages = ", ".join(f"{stage} p50 {latency['p50']:.2f}ms p95 {latency['p95']:.2f}ms p99 {latency['p99']:.2f}ms" for stage, latency in result["latency_ms"].items())
+        print(f"{name:>10}: Hit Rate {metrics['hit_rate']:.2f}, Precision@{args.k} {metrics['precision_at_k']:.2f}, NDCG@{args.k} {metrics['ndcg_at_k']:.2f}, "
+              f"{result['throughput_conversations_per_s']:.1f} conversations/s\n{'':>12}{stages}")
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            found = regressions(report, json.load(file), args.quality_tolerance, args.max_slowdown)
+        for regression in found:
+            print(f"Regression: {regression}")
+        if found:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
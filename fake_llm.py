@@ -0,0 +1,119 @@
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+import asyncio
+import ast
+import json
+import re
+import time
+from preference_extractor import extract_preferences
+from structured_turn import KEY_SPECS
+
+#Local stand-in for the OpenAI client, it answers the CRS prompts deterministically so the pipelines can be run and timed without an API key
+#It gives back the same ChatCompletion objects as the real client, so it can be used anywhere client is used
+#extractions maps user inputs to the preferences the extraction requests give back for them (labelled preferences for the evaluation), other inputs go through the rule-based extractor
+class FakeCompletions:
+    def __init__(self, latency=0.0, extractions=None):
+        self.latency = latency
+        self.extractions = extractions or {}
+        self.calls = 0
+
+    def create(self, model, messages, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return fake_completion(self.calls, model, messages, self.extractions)
+
+class FakeChat:
+    def __init__(self, latency=0.0, extractions=None):
+        self.completions = FakeCompletions(latency, extractions)
+
+class FakeOpenAIClient:
+    def __init__(self, latency=0.0, extractions=None):
+        self.chat = FakeChat(latency, extractions)
+
+#Asyncio version of the fake client, with stream=True it gives back the reply in word chunks with chunk_delay seconds between them like the streaming API
+class FakeAsyncCompletions:
+    def __init__(self, latency=0.0, chunk_delay=0.0):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if stream:
+            return self.stream(self.calls, model, fake_reply(messages[0]["content"], messages[-1]["content"]))
+        return fake_completion(self.calls, model, messages)
+
+    async def stream(self, call, model, content):
+        for i, word in enumerate(re.findall(r"\S+\s*", content)):
+            if i and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield ChatCompletionChunk.model_validate({
+                "id": f"fake-{call}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": None, "delta": {"role": "assistant", "content": word}}],
+            })
+
+class FakeAsyncChat:
+    def __init__(self, latency=0.0, chunk_delay=0.0):
+        self.completions = FakeAsyncCompletions(latency, chunk_delay)
+
+class FakeAsyncOpenAIClient:
+    def __init__(self, latency=0.0, chunk_delay=0.0):
+        self.chat = FakeAsyncChat(latency, chunk_delay)
+
+#Function to wrap the reply to the messages in a ChatCompletion, with rough token counts (4 characters per token)
+def fake_completion(call, model, messages, extractions=None):
+    content = fake_reply(messages[0]["content"], messages[-1]["content"], extractions)
+    prompt_tokens = sum(len(message["content"]) // 4 for message in messages)
+    return ChatCompletion.model_validate({
+        "id": f"fake-{call}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4, "total_tokens": prompt_tokens + len(content) // 4},
+    })
+
+#Function to merge the preferences of the latest input into preferences, from extractions when it has them
+def extract_latest(latest, preferences, extractions=None):
+    if extractions and latest in extractions:
+        preferences.update(extractions[latest])
+    else:
+        extract_preferences(latest, preferences)
+
+#Function to build the reply to one of the CRS prompts, the kind of prompt is read from its system message
+def fake_reply(system, prompt, extractions=None):
+    if "asking for the next missing one" in system:
+        #Structured turn: the merged preferences with null for the unknown specs, and a question about the first spec still missing with that spec
+        existing = re.search(r"so far: (\{.*?\})\.\n", prompt)
+        latest = re.search(r'The latest input is: "(.*)"', prompt)
+        asked = re.search(r"still null after merging: (\[.*\])\.", prompt)
+        preferences = json.loads(existing.group(1)) if existing else {}
+        extract_latest(latest.group(1) if latest else "", preferences, extractions)
+        spec = next((spec for spec in (ast.literal_eval(asked.group(1)) if asked else KEY_SPECS) if not preferences.get(spec)), None)
+        return json.dumps({
+            "preferences": {spec: preferences.get(spec) or None for spec in KEY_SPECS},
+            "next_question": f"Could you tell me what you would like for the {spec.replace('_', ' ')}?" if spec else None,
+            "asked_spec": spec,
+        })
+    if "extracting laptop specifications" in system:
+        #Merge what the rule-based extractor finds in the latest input into the existing specs, like the fine-tuned model is asked to
+        existing = re.search(r"so far: (\{.*?\})\.\n", prompt)
+        latest = re.search(r'The latest input is: "(.*)"', prompt)
+        preferences = ast.literal_eval(existing.group(1)) if existing else {}
+        extract_latest(latest.group(1) if latest else "", preferences, extractions)
+        return repr({key: value for key, value in preferences.items() if value})
+    if "missing specifications" in system:
+        spec = re.search(r"ask the user about their (.*)\.", prompt)
+        return f"Could you tell me what you would like for the {spec.group(1).replace('_', ' ') if spec else 'laptop'}?"
+    if "explaining ranked laptop recommendations" in system:
+        #Explanations of the laptops the fine-tuned only CRS ranked, one numbered line per laptop
+        laptops = re.findall(r"^(\d+)\. (.+?) \(", prompt, re.MULTILINE)
+        return "\n".join(f"{number}. The {title} is one of the closest matches to the user's preferences." for number, title in laptops)
+    #Recommendation prompts: list the first retrieved laptops, or generic picks when there are no retrieval results
+    lines = [line.strip() for line in prompt.splitlines()[3:] if line.strip() and not line.strip().startswith(("Provide", "For each", "-", "Include", "Allow"))]
+    return "\n".join(f"{i + 1}. {line[:120]}\nReasoning: Closest match to the user's preferences." for i, line in enumerate((lines or ["Laptop"] * 5)[:5]))
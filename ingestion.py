@@ -0,0 +1,109 @@
+import pandas as pd
+import os
+from record_store import StringStore, RecordStore, split_list, is_valid_record
+from spec_index import SpecIndex
+
+#Streaming ingestion of metadata_cleaned.csv: the CSV is read in chunks of rows, with only the needed columns and every column read as a string
+#Every chunk is parsed into combined texts and records and packed into UTF-8 blobs right away, so only one chunk of Python strings is alive at a time
+#The parsed chunks are also written to a Parquet cache next to the CSV (metadata_cleaned.parquet, needs pyarrow), later builds read it instead of parsing the CSV again
+
+CSV_COLUMNS = ['title', 'description', 'features']
+CSV_DTYPES = {column: str for column in CSV_COLUMNS}
+#Rows of the CSV parsed at a time
+CSV_CHUNK_ROWS = 2000
+
+#Function to get the path of the columnar cache of a CSV
+def cache_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+#Function to parse one chunk of CSV rows into the combined texts, titles, description lists and feature lists of its laptops
+#Placeholder rows without a title or without any description and features ("0 [] []") are left out, so they never reach the index
+def parse_chunk(frame):
+    frame = frame.dropna(subset=CSV_COLUMNS)
+    titles = frame['title'].str.strip().tolist()
+    descriptions = [split_list(value) for value in frame['description']]
+    features = [split_list(value) for value in frame['features']]
+    combined_text = (frame['title'] + ' ' + frame['description'] + ' ' + frame['features']).tolist()
+    keep = [i for i in range(len(titles)) if is_valid_record(titles[i], descriptions[i], features[i])]
+    return [combined_text[i] for i in keep], [titles[i] for i in keep], [descriptions[i] for i in keep], [features[i] for i in keep]
+
+#Function to read the CSV chunk by chunk, gives back the parsed (texts, titles, descriptions, features) of every chunk
+def read_csv_chunks(csv_path, chunk_rows=CSV_CHUNK_ROWS):
+    for frame in pd.read_csv(csv_path, sep=';', usecols=CSV_COLUMNS, dtype=CSV_DTYPES, chunksize=chunk_rows):
+        yield parse_chunk(frame)
+
+#Function to read the parsed chunks back from the columnar cache
+def read_cache_chunks(path, chunk_rows=CSV_CHUNK_ROWS):
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        columns = batch.to_pydict()
+        yield columns['text'], columns['title'], columns['descriptions'], columns['features']
+
+#Function to check if the cache was written from the current version of the CSV (same size and modification time)
+def cache_is_fresh(path, csv_path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return False
+    if not os.path.exists(path):
+        return False
+    metadata = pq.read_schema(path).metadata or {}
+    stat = os.stat(csv_path)
+    return metadata.get(b'csv_size') == str(stat.st_size).encode() and metadata.get(b'csv_mtime_ns') == str(stat.st_mtime_ns).encode()
+
+#Writes the parsed chunks to the Parquet cache as they are read, the cache only replaces the old one once it is complete
+class CacheWriter:
+    def __init__(self, path, csv_path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        stat = os.stat(csv_path)
+        self.schema = pa.schema(
+            [("text", pa.string()), ("title", pa.string()), ("descriptions", pa.list_(pa.string())), ("features", pa.list_(pa.string()))],
+            metadata={"csv_size": str(stat.st_size), "csv_mtime_ns": str(stat.st_mtime_ns)},
+        )
+        self.path = path
+        self.writer = pq.ParquetWriter(path + ".tmp", self.schema)
+
+    def write(self, chunk):
+        import pyarrow as pa
+        self.writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(chunk, self.schema)], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.path + ".tmp", self.path)
+
+#Function to give back the parsed chunks of the catalog, from the cache when it matches the CSV, otherwise from the CSV while writing the cache
+#Without pyarrow the CSV is always read and no cache is written
+def metadata_chunks(csv_path, chunk_rows=CSV_CHUNK_ROWS, use_cache=True):
+    path = cache_path(csv_path)
+    if use_cache and cache_is_fresh(path, csv_path):
+        yield from read_cache_chunks(path, chunk_rows)
+        return
+    writer = None
+    if use_cache:
+        try:
+            writer = CacheWriter(path, csv_path)
+        except ImportError:
+            writer = None
+    for chunk in read_csv_chunks(csv_path, chunk_rows):
+        if writer is not None:
+            writer.write(chunk)
+        yield chunk
+    if writer is not None:
+        writer.close()
+
+#Function to ingest the catalog chunk by chunk into the stores the retrieval artifact is built from
+#Gives back the texts (StringStore), the records (RecordStore) and, with with_specs, the spec index read out of the texts
+def ingest_metadata(csv_path='metadata_cleaned.csv', chunk_rows=CSV_CHUNK_ROWS, use_cache=True, with_specs=True):
+    texts, records, specs = [], [], None
+    for chunk_texts, titles, descriptions, features in metadata_chunks(csv_path, chunk_rows, use_cache):
+        texts.append(StringStore.from_strings(chunk_texts))
+        records.append(RecordStore.from_lists(titles, descriptions, features))
+        if with_specs:
+            if specs is None:
+                specs = SpecIndex.from_texts(chunk_texts)
+            else:
+                specs.extend(chunk_texts)
+    if with_specs and specs is None:
+        specs = SpecIndex.from_texts([])
+    return StringStore.concatenate(texts), RecordStore.concatenate(records), specs
@@ -0,0 +1,297 @@
+from contextlib import nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import atexit
+import json
+import os
+import threading
+import time
+
+#Per-stage instrumentation of the CRS pipelines: CSV load, vectorization, index search, response parsing and every chat completion request
+#Stage timings, LLM requests, token usage and LLM cache hits are kept as Prometheus-style counters and histograms,
+#written as one JSON line per event to a log file, and served as Prometheus text on /metrics
+#Everything is off by default, a disabled stage is one flag check. Turn it on with the environment variables:
+#  CRS_METRICS=1                 record the metrics in memory
+#  CRS_METRICS_LOG=metrics.jsonl also write every event as a JSON line (turns recording on)
+#  CRS_METRICS_PORT=9100         also serve the Prometheus text on http://127.0.0.1:9100/metrics (turns recording on)
+
+#Upper bounds (in seconds) of the histogram buckets of the stage and LLM request timings
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+#Stage that is running in this thread or asyncio task, LLM requests are labelled with it
+current_stage = ContextVar("current_stage", default="none")
+
+#Help texts of the exported metrics
+HELP = {
+    "crs_stage_seconds": "Time spent in each stage of the CRS pipelines",
+    "crs_stage_errors_total": "Stages that raised an exception",
+    "crs_llm_request_seconds": "Time spent waiting for chat completion requests",
+    "crs_llm_requests_total": "Chat completion requests sent to the LLM",
+    "crs_llm_errors_total": "Chat completion requests that failed",
+    "crs_llm_prompt_tokens_total": "Prompt tokens of the chat completion requests",
+    "crs_llm_completion_tokens_total": "Completion tokens of the chat completion requests",
+    "crs_llm_cache_hits_total": "Chat completion requests answered from the LLM cache",
+    "crs_llm_cache_misses_total": "Chat completion requests the LLM cache had to send on",
+    "crs_retrieval_cache_hits_total": "Retrievals answered from the preference-keyed retrieval cache",
+    "crs_retrieval_cache_misses_total": "Retrievals the retrieval cache had to search the index for",
+    "crs_llm_queue_depth": "Chat completion requests waiting in the LLM scheduler",
+    "crs_llm_in_flight": "Chat completion requests the LLM scheduler has sent and not got back yet",
+    "crs_llm_queue_wait_seconds": "Time chat completion requests waited in the LLM scheduler before they were sent",
+    "crs_llm_retries_total": "Chat completion requests the LLM scheduler sent again after a throttled or failed attempt",
+    "crs_llm_throttled_total": "Chat completion requests the API answered with 429 Too Many Requests",
+}
+
+#Function to turn keyword labels into the sorted tuple the metrics are keyed by
+def label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+#Registry of the counters, gauges and histograms, shared by the whole process
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.log = None
+
+    #Function to turn recording on, log_path also writes every event as a JSON line
+    def enable(self, log_path=None):
+        with self.lock:
+            if log_path and self.log is None:
+                self.log = open(log_path, 'a', encoding='utf-8')
+            self.enabled = True
+
+    def disable(self):
+        with self.lock:
+            self.enabled = False
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def increment(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    #Function to set a value that goes up and down, like the depth of a queue
+    def gauge(self, name, value, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.gauges[key] = value
+
+    #Function to add one timing to a histogram: a count per bucket, then the sum and the number of observations
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    #Function to write one event to the JSON log
+    def event(self, **fields):
+        if self.log is None:
+            return
+        line = json.dumps({"time": time.time(), **fields}, default=str)
+        with self.lock:
+            if self.log is not None:
+                self.log.write(line + "\n")
+                self.log.flush()
+
+    def record_stage(self, name, seconds, parent, error):
+        self.observe("crs_stage_seconds", seconds, stage=name)
+        if error:
+            self.increment("crs_stage_errors_total", stage=name)
+        self.event(event="stage", stage=name, parent=parent, seconds=seconds, error=error)
+
+    #Function to record one chat completion request with its model, stage, latency and token usage
+    def record_llm(self, kwargs, response, seconds):
+        labels = {"model": kwargs.get("model", ""), "stage": current_stage.get()}
+        self.increment("crs_llm_requests_total", **labels)
+        self.observe("crs_llm_request_seconds", seconds, **labels)
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        if usage is not None:
+            self.increment("crs_llm_prompt_tokens_total", prompt_tokens, **labels)
+            self.increment("crs_llm_completion_tokens_total", completion_tokens, **labels)
+        self.event(event="llm_request", **labels, seconds=seconds, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, stream=bool(kwargs.get("stream")))
+
+    #Function to give back every counter, gauge and histogram as a dict, e.g. for the JSON log or a benchmark report
+    def snapshot(self):
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self.counters.items()]
+            gauges = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self.gauges.items()]
+            histograms = [{"name": name, "labels": dict(labels), "count": histogram[-1], "sum": histogram[-2]} for (name, labels), histogram in self.histograms.items()]
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    #Function to write the metrics in the Prometheus text exposition format
+    def prometheus(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted(self.histograms.items())
+        lines, described = [], set()
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for (name, labels), value in values:
+                if name not in described:
+                    described.add(name)
+                    lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} {kind}"]
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in described:
+                described.add(name)
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+            for bound, count in zip(BUCKETS, histogram):
+                lines.append(f"{name}_bucket{format_labels(labels, le=bound)} {count}")
+            lines.append(f"{name}_bucket{format_labels(labels, le='+Inf')} {histogram[-1]}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram[-2]}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+#Times the code inside it as one stage, the stages it calls are recorded with it as their parent
+class Stage:
+    __slots__ = ("name", "start", "token")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.token = current_stage.set(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.start
+        current_stage.reset(self.token)
+        metrics.record_stage(self.name, seconds, current_stage.get(), exc_type is not None)
+        return False
+
+NULL_STAGE = nullcontext()
+
+#Function to time a block of code as a stage: with stage("index_search"): ...
+def stage(name):
+    return Stage(name) if metrics.enabled else NULL_STAGE
+
+#Decorator to time every call of a function as a stage, a disabled stage only checks the flag and calls the function
+def timed(name):
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            with Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+#Function to count a hit or a miss of the LLM cache (or of the retrieval cache)
+def count_cache_lookup(hit, cache="llm"):
+    if metrics.enabled:
+        metrics.increment(f"crs_{cache}_cache_hits_total" if hit else f"crs_{cache}_cache_misses_total", stage=current_stage.get())
+
+#Chat completions endpoint that records the latency and token usage of every request it sends to the wrapped client
+#It sits inside the LLM cache (CachedClient(InstrumentedClient(OpenAI(...)), cache)), so it only sees the requests that reach the API
+class InstrumentedCompletions:
+    def __init__(self, completions):
+        self.completions = completions
+
+    def create(self, **kwargs):
+        if not metrics.enabled:
+            return self.completions.create(**kwargs)
+        start = time.perf_counter()
+        try:
+            response = self.completions.create(**kwargs)
+        except Exception:
+            metrics.increment("crs_llm_errors_total", model=kwargs.get("model", ""), stage=current_stage.get())
+            raise
+        metrics.record_llm(kwargs, response, time.perf_counter() - start)
+        return response
+
+class InstrumentedChat:
+    def __init__(self, chat):
+        self.completions = InstrumentedCompletions(chat.completions)
+
+class InstrumentedClient:
+    def __init__(self, client):
+        self.client = client
+        self.chat = InstrumentedChat(client.chat)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+#Asyncio version for AsyncOpenAI (or the local fake async client), a streamed request is timed until the stream is returned
+class AsyncInstrumentedCompletions(InstrumentedCompletions):
+    async def create(self, **kwargs):
+        if not metrics.enabled:
+            return await self.completions.create(**kwargs)
+        start = time.perf_counter()
+        try:
+            response = await self.completions.create(**kwargs)
+        except Exception:
+            metrics.increment("crs_llm_errors_total", model=kwargs.get("model", ""), stage=current_stage.get())
+            raise
+        metrics.record_llm(kwargs, response, time.perf_counter() - start)
+        return response
+
+class AsyncInstrumentedChat:
+    def __init__(self, chat):
+        self.completions = AsyncInstrumentedCompletions(chat.completions)
+
+class AsyncInstrumentedClient(InstrumentedClient):
+    def __init__(self, client):
+        self.client = client
+        self.chat = AsyncInstrumentedChat(client.chat)
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = metrics.prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+#Function to serve /metrics from a background thread, for the console CRS scripts that have no server of their own
+def start_metrics_server(port=9100, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+#Function to write the totals of the run to the JSON log when the process exits
+def log_summary():
+    if metrics.enabled:
+        metrics.event(event="summary", **metrics.snapshot())
+
+if os.environ.get("CRS_METRICS") or os.environ.get("CRS_METRICS_LOG") or os.environ.get("CRS_METRICS_PORT"):
+    metrics.enable(os.environ.get("CRS_METRICS_LOG"))
+    atexit.register(log_summary)
+    if os.environ.get("CRS_METRICS_PORT"):
+        start_metrics_server(int(os.environ["CRS_METRICS_PORT"]))
@@ -0,0 +1,37 @@
+import importlib
+import time
+
+#Library entry point of the three CRS pipelines, for tests, workers and servers that need recommendations without the console conversation
+#Importing it (or one of the CRS modules) loads nothing heavy: openai, sklearn, faiss, pandas, the retrieval artifact and laptops.csv are only loaded by warmup() or the first recommendation
+#  import laptop_crs
+#  laptop_crs.warmup("combined")
+#  laptop_crs.recommend({"brand": "dell", "ram": "16gb", "purpose": "gaming"}, strategy="combined")
+#Bulk callers wrap their calls in llm_scheduler.priority(llm_scheduler.BATCH), so their GPT-4o requests wait behind the ones of interactive users
+
+#Module of every pipeline
+MODULES = {"rag": "RAG_CRS", "fine-tuned": "Fine_tuned_GPT4o_CRS", "combined": "Combined_Model_CRS"}
+
+#Function to import the module of a pipeline
+def pipeline(strategy):
+    if strategy not in MODULES:
+        raise ValueError(f"Unknown strategy '{strategy}', choose one of {list(MODULES)}")
+    return importlib.import_module(MODULES[strategy])
+
+#Function to load the retrievers, the scorer and the clients of the pipelines ahead of the first recommendation, gives back the seconds every pipeline took
+def warmup(*strategies):
+    seconds = {}
+    for strategy in strategies or MODULES:
+        start = time.perf_counter()
+        pipeline(strategy).warmup()
+        seconds[strategy] = time.perf_counter() - start
+    return seconds
+
+#Function to recommend the Top-N laptops for the preferences with one pipeline, gives back the recommendations as one text like the CRS shows them
+#The Combined Model always recommends the 5 laptops its ranking prompt asks for
+def recommend(preferences, strategy="combined", top_n=5):
+    module = pipeline(strategy)
+    if strategy == "rag":
+        return "\n".join(f"{i + 1}. {text}" for i, (text, _) in enumerate(module.recommend_from_preferences(preferences, top_n)))
+    if strategy == "fine-tuned":
+        return module.recommend_laptops_top_n(preferences, top_n)
+    return module.recommend_from_preferences(preferences, verbose=False)
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from instrumentation import count_cache_lookup
+
+#Request arguments that do not change the completion, so they are left out of the cache key
+NON_SEMANTIC_ARGS = {"timeout", "extra_headers", "extra_query", "extra_body", "user", "stream", "stream_options"}
+
+#Function to build the cache key of a chat completion request: the model ID, the messages and every sampling parameter
+def request_key(kwargs):
+    semantic = {key: value for key, value in kwargs.items() if key not in NON_SEMANTIC_ARGS}
+    return hashlib.sha256(json.dumps(semantic, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+#Two-tier cache of LLM responses: an in-process LRU in front of an on-disk SQLite table with TTL and size eviction
+class LLMCache:
+    def __init__(self, path="llm_cache.sqlite", max_memory_entries=1024, max_disk_bytes=256 * 2**20, ttl_seconds=7 * 24 * 3600):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "memory_evictions": 0, "disk_evictions": 0, "expired": 0}
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self.db.commit()
+
+    #Function to look a response up, first in memory and then on disk, gives back None on a miss
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                value, created = self.memory[key]
+                if time.time() - created <= self.ttl_seconds:
+                    self.memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return value
+                del self.memory[key]
+                self.counters["expired"] += 1
+            if self.db is not None:
+                row = self.db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and time.time() - row[1] <= self.ttl_seconds:
+                    self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self.db.commit()
+                    self.remember(key, row[0], row[1])
+                    self.counters["disk_hits"] += 1
+                    return row[0]
+                if row:
+                    self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.db.commit()
+                    self.counters["expired"] += 1
+            self.counters["misses"] += 1
+            return None
+
+    #Function to store a response in both tiers
+    def put(self, key, value):
+        now = time.time()
+        with self.lock:
+            self.remember(key, value, now)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)", (key, value, len(value.encode('utf-8')), now, now))
+                self.evict_disk(now)
+                self.db.commit()
+
+    #Function to put a response in the memory tier, dropping the least recently used ones past the limit
+    def remember(self, key, value, created):
+        self.memory[key] = (value, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+            self.counters["memory_evictions"] += 1
+
+    #Function to drop expired responses from disk, then the least recently used ones until the table fits in max_disk_bytes
+    def evict_disk(self, now):
+        self.counters["expired"] += self.db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.counters["disk_evictions"] += 1
+
+    #Hit/miss counters and the hit rate of the cache
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses")
+                self.db.commit()
+
+#Chat completions endpoint that answers byte-identical requests from the cache and sends the others to the wrapped client
+class CachedCompletions:
+    def __init__(self, completions, cache):
+        self.completions = completions
+        self.cache = cache
+
+    def create(self, **kwargs):
+        from openai.types.chat import ChatCompletion
+        #Streamed responses are not cached, they are sent straight to the client
+        if kwargs.get("stream"):
+            return self.completions.create(**kwargs)
+        key = request_key(kwargs)
+        cached = self.cache.get(key)
+        count_cache_lookup(cached is not None)
+        if cached is not None:
+            return ChatCompletion.model_validate_json(cached)
+        response = self.completions.create(**kwargs)
+        self.cache.put(key, response.model_dump_json())
+        return response
+
+class CachedChat:
+    def __init__(self, chat, cache):
+        self.completions = CachedCompletions(chat.completions, cache)
+
+#Wrapper around an OpenAI client (or the local fake one) that caches client.chat.completions.create, everything else is passed through
+class CachedClient:
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+        self.chat = CachedChat(client.chat, cache)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+#Asyncio version of the cached endpoint for AsyncOpenAI (or the local fake async client)
+#The cache lookups can read and write SQLite, so they run in a worker thread and do not block the event loop
+class AsyncCachedCompletions(CachedCompletions):
+    async def create(self, **kwargs):
+        from openai.types.chat import ChatCompletion
+        if kwargs.get("stream"):
+            return await self.completions.create(**kwargs)
+        key = request_key(kwargs)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        count_cache_lookup(cached is not None)
+        if cached is not None:
+            return ChatCompletion.model_validate_json(cached)
+        response = await self.completions.create(**kwargs)
+        await asyncio.to_thread(self.cache.put, key, response.model_dump_json())
+        return response
+
+class AsyncCachedChat:
+    def __init__(self, chat, cache):
+        self.completions = AsyncCachedCompletions(chat.completions, cache)
+
+class AsyncCachedClient(CachedClient):
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+        self.chat = AsyncCachedChat(client.chat, cache)
@@ -0,0 +1,360 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from context_packing import prompt_tokens
+from instrumentation import metrics
+
+#Process-wide scheduler every GPT-4o request (extract_specs, query_missing_specs, the ranking and the structured turns) goes through
+#The requests of all pipelines, sessions and threads share one OpenAI client (so one keep-alive connection pool) and the budgets of the account:
+#a token bucket of requests per minute and one of tokens per minute, and a cap on the requests in flight
+#Waiting requests are sent in priority order, the turns of a user before batch jobs, and in arrival order within a priority
+#A throttled (429), failed (5xx) or dropped request is sent again after a jittered exponential backoff, a 429 with Retry-After pauses every request until then
+#  client = CachedClient(ScheduledClient(InstrumentedClient(shared_client())), cache)
+#  with priority(BATCH): ... every request of the block waits behind the interactive ones
+
+#Priorities, a lower one is sent first
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+#Budgets of the OpenAI account, set them to the rate limits of its tier for the fine-tuned model
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 30000
+#Seconds of budget a burst may use up at once, the API enforces its per-minute limits over shorter windows too
+BURST_SECONDS = 6.0
+#Most requests in flight at once
+MAX_CONCURRENCY = 8
+#Attempts after the first one, and the bounds (in seconds) of the exponential backoff between them
+MAX_RETRIES = 6
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+#Completion tokens a request is charged before its response tells the real usage, when it does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 256
+#HTTP statuses worth sending a request again for
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+#Priority of the requests sent from this thread or asyncio task
+request_priority = ContextVar("request_priority", default=INTERACTIVE)
+
+#Function to send every request of a block with another priority: with priority(BATCH): ...
+@contextmanager
+def priority(value):
+    token = request_priority.set(value)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+#Token bucket that refills at a steady rate per minute up to burst_seconds of budget, it is only used under the lock of the scheduler
+class TokenBucket:
+    def __init__(self, per_minute, now, burst_seconds=BURST_SECONDS):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = now
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    #Function to get the seconds until the bucket holds amount, a request larger than the bucket waits for a full one
+    def delay(self, amount, now):
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    #Function to take amount out of the bucket, it may go below zero when a response used more tokens than were reserved
+    def take(self, amount, now):
+        self.refill(now)
+        self.level -= amount
+
+#Function to estimate the tokens a request counts against the budget: its prompt and the most it may write
+def request_tokens(kwargs):
+    completion = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+    return prompt_tokens(kwargs.get("messages") or []) + completion
+
+#Function to get the tokens a response really used, None for a stream (its usage is not known when it is handed back)
+def response_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+#Function to check if a failed request is worth sending again: throttled, a server error, a timeout or a dropped connection
+def retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__)
+
+#Function to read the seconds the API asked to wait from the Retry-After headers of a failed request, None when there are none
+def retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+#Scheduler of the chat completion requests of the process, see the top of the module
+class LLMScheduler:
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE, max_concurrency=MAX_CONCURRENCY,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, burst_seconds=BURST_SECONDS):
+        now = time.monotonic()
+        self.requests = TokenBucket(requests_per_minute, now, burst_seconds)
+        self.tokens = TokenBucket(tokens_per_minute, now, burst_seconds)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.condition = threading.Condition()
+        #Heap of the (priority, arrival) tickets of the waiting requests, the first one is the next to be sent
+        self.queue = []
+        self.arrivals = itertools.count()
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.counters = {"sent": 0, "retries": 0, "throttled": 0, "failed": 0, "wait_seconds": 0.0, "max_queue_depth": 0}
+        #Event loop and asyncio.Event of every waiting asyncio request by ticket, set whenever the queue, the slots or the budgets change
+        self.async_waiters = {}
+
+    def ticket(self, priority=None):
+        return (request_priority.get() if priority is None else priority, next(self.arrivals))
+
+    #Function to record the depth of the queue and the requests in flight, called under the lock
+    def record_load(self):
+        self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], len(self.queue))
+        if metrics.enabled:
+            metrics.gauge("crs_llm_queue_depth", len(self.queue))
+            metrics.gauge("crs_llm_in_flight", self.in_flight)
+
+    #Function to wake every waiting request to check the queue, the slots and the budgets again, called under the lock
+    def wake(self):
+        self.condition.notify_all()
+        for loop, event in self.async_waiters.values():
+            loop.call_soon_threadsafe(event.set)
+
+    #Function to let the request of the ticket through when it is first in the queue, a slot is free and both budgets have room for it, called under the lock
+    #Gives back 0 once it is let through, otherwise the seconds until the budgets have room, or None when it waits for another request
+    def admit(self, ticket, tokens, start):
+        now = time.monotonic()
+        if self.queue[0] != ticket or self.in_flight >= self.max_concurrency:
+            return None
+        delay = max(self.paused_until - now, self.requests.delay(1, now), self.tokens.delay(tokens, now))
+        if delay > 0:
+            return delay
+        heapq.heappop(self.queue)
+        self.requests.take(1, now)
+        self.tokens.take(tokens, now)
+        self.in_flight += 1
+        self.counters["sent"] += 1
+        self.counters["wait_seconds"] += now - start
+        self.record_load()
+        #The next request in the queue checks the budgets again
+        self.wake()
+        return 0.0
+
+    #Function to record the wait of a request that was let through, gives back the seconds it waited
+    def admitted(self, ticket, start):
+        waited = time.monotonic() - start
+        if metrics.enabled:
+            metrics.observe("crs_llm_queue_wait_seconds", waited, priority=PRIORITY_NAMES.get(ticket[0], ticket[0]))
+        return waited
+
+    #Function to wait until the request of the ticket is let through, gives back the seconds it waited
+    def acquire(self, ticket, tokens):
+        start = time.monotonic()
+        with self.condition:
+            heapq.heappush(self.queue, ticket)
+            self.record_load()
+            while True:
+                delay = self.admit(ticket, tokens, start)
+                if delay == 0:
+                    break
+                self.condition.wait(delay)
+        return self.admitted(ticket, start)
+
+    #Asyncio version of acquire, the request waits on an asyncio.Event of its event loop instead of holding a thread
+    #A cancelled request leaves the queue, so the requests behind it are not held up
+    async def aacquire(self, ticket, tokens):
+        start = time.monotonic()
+        event = asyncio.Event()
+        with self.condition:
+            heapq.heappush(self.queue, ticket)
+            self.async_waiters[ticket] = (asyncio.get_running_loop(), event)
+            self.record_load()
+        try:
+            while True:
+                with self.condition:
+                    event.clear()
+                    delay = self.admit(ticket, tokens, start)
+                if delay == 0:
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self.condition:
+                if ticket in self.queue:
+                    self.queue.remove(ticket)
+                    heapq.heapify(self.queue)
+                    self.record_load()
+                    self.wake()
+            raise
+        finally:
+            with self.condition:
+                del self.async_waiters[ticket]
+        return self.admitted(ticket, start)
+
+    #Function to give the slot of a request back, charging the budget with the tokens the response really used instead of the estimate
+    def release(self, tokens, used=None):
+        with self.condition:
+            self.in_flight -= 1
+            if used is not None:
+                self.tokens.take(used - tokens, time.monotonic())
+            self.record_load()
+            self.wake()
+
+    #Function to get the seconds to wait before sending a failed request again, gives back None when it should not be sent again
+    #The backoff has full jitter so requests throttled together do not come back together, a 429 also pauses every other request
+    def backoff(self, attempt, error):
+        if attempt >= self.max_retries or not retryable(error):
+            with self.condition:
+                self.counters["failed"] += 1
+            return None
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        asked = retry_after(error)
+        status = getattr(error, "status_code", None)
+        with self.condition:
+            self.counters["retries"] += 1
+            if status == 429:
+                self.counters["throttled"] += 1
+                self.paused_until = max(self.paused_until, time.monotonic() + (asked if asked is not None else delay))
+        if metrics.enabled:
+            metrics.increment("crs_llm_retries_total", reason=status or type(error).__name__)
+            if status == 429:
+                metrics.increment("crs_llm_throttled_total")
+        return max(delay, asked or 0.0)
+
+    #Function to send a request with create(**kwargs) once the scheduler lets it through, sending it again while it fails with a retryable error
+    #A retried request keeps its ticket, so it goes ahead of the requests that came after it
+    def call(self, create, kwargs, priority=None):
+        ticket = self.ticket(priority)
+        tokens = request_tokens(kwargs)
+        for attempt in itertools.count():
+            self.acquire(ticket, tokens)
+            used = None
+            try:
+                response = create(**kwargs)
+                used = response_tokens(response)
+                return response
+            except Exception as error:
+                delay = self.backoff(attempt, error)
+                if delay is None:
+                    raise
+            finally:
+                self.release(tokens, used)
+            time.sleep(delay)
+
+    #Asyncio version of call, the wait for the queue runs on the event loop
+    async def acall(self, create, kwargs, priority=None):
+        ticket = self.ticket(priority)
+        tokens = request_tokens(kwargs)
+        for attempt in itertools.count():
+            await self.aacquire(ticket, tokens)
+            used = None
+            try:
+                response = await create(**kwargs)
+                used = response_tokens(response)
+                return response
+            except Exception as error:
+                delay = self.backoff(attempt, error)
+                if delay is None:
+                    raise
+            finally:
+                self.release(tokens, used)
+            await asyncio.sleep(delay)
+
+    #Counters of the scheduler, with the requests waiting and in flight right now
+    def stats(self):
+        with self.condition:
+            stats = dict(self.counters)
+            stats["queue_depth"] = len(self.queue)
+            stats["in_flight"] = self.in_flight
+        stats["mean_wait_seconds"] = stats["wait_seconds"] / stats["sent"] if stats["sent"] else 0.0
+        return stats
+
+#Scheduler shared by every client of the process
+scheduler = LLMScheduler()
+shared = None
+shared_async = None
+loading = threading.Lock()
+
+#Function to create the OpenAI client of the process the first time it is needed, every pipeline sends its requests through this one client and its connection pool
+#The scheduler does the retries, so the client does not retry on its own
+def shared_client():
+    global shared
+    if shared is None:
+        with loading:
+            if shared is None:
+                from openai import OpenAI
+                #Initialize the OpenAI client using Your OWN OpenAI API Key please
+                shared = OpenAI(api_key='Your OpenAI API Key', max_retries=0)
+    return shared
+
+#Asyncio version of shared_client, the conversation engine sends its requests through this one AsyncOpenAI client and its connection pool
+def shared_async_client():
+    global shared_async
+    if shared_async is None:
+        with loading:
+            if shared_async is None:
+                from openai import AsyncOpenAI
+                #Initialize the OpenAI client using Your OWN OpenAI API Key please
+                shared_async = AsyncOpenAI(api_key='Your OpenAI API Key', max_retries=0)
+    return shared_async
+
+#Chat completions endpoint that sends every request through the scheduler
+class ScheduledCompletions:
+    def __init__(self, completions, scheduler, priority=None):
+        self.completions = completions
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def create(self, **kwargs):
+        return self.scheduler.call(self.completions.create, kwargs, self.priority)
+
+class ScheduledChat:
+    def __init__(self, chat, scheduler, priority=None):
+        self.completions = ScheduledCompletions(chat.completions, scheduler, priority)
+
+#Wrapper around an OpenAI client (or the local fake one) that schedules client.chat.completions.create, everything else is passed through
+#priority=None sends the requests with the priority of the calling context
+class ScheduledClient:
+    def __init__(self, client, scheduler=scheduler, priority=None):
+        self.client = client
+        self.scheduler = scheduler
+        self.chat = ScheduledChat(client.chat, scheduler, priority)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+#Asyncio version for AsyncOpenAI (or the local fake async client), a streamed request holds its slot until the stream is returned
+class AsyncScheduledCompletions(ScheduledCompletions):
+    async def create(self, **kwargs):
+        return await self.scheduler.acall(self.completions.create, kwargs, self.priority)
+
+class AsyncScheduledChat:
+    def __init__(self, chat, scheduler, priority=None):
+        self.completions = AsyncScheduledCompletions(chat.completions, scheduler, priority)
+
+class AsyncScheduledClient(ScheduledClient):
+    def __init__(self, client, scheduler=scheduler, priority=None):
+        self.client = client
+        self.scheduler = scheduler
+        self.chat = AsyncScheduledChat(client.chat, scheduler, priority)
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from benchmark_preferences import load_user_turns
+from crs_server import create_server
+
+#Function to send a JSON request to the server, gives back the decoded response
+def request(base_url, method, path, body=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=120) as response:
+        return json.loads(response.read())
+
+#Function to run one conversation against the server, gives back the latency of every request in seconds
+def run_conversation(base_url, strategy, turns):
+    latencies = []
+    start = time.perf_counter()
+    session_id = request(base_url, "POST", "/sessions", {"strategy": strategy})["session_id"]
+    latencies.append(time.perf_counter() - start)
+    for turn in turns:
+        start = time.perf_counter()
+        response = request(base_url, "POST", f"/sessions/{session_id}/messages", {"message": turn})
+        latencies.append(time.perf_counter() - start)
+        if response["done"]:
+            break
+    request(base_url, "DELETE", f"/sessions/{session_id}")
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the CRS server with many concurrent conversations against the local fake LLM.")
+    parser.add_argument("--data", default="laptop_chat_validation.jsonl")
+    parser.add_argument("--strategies", nargs="+", default=["rag", "fine-tuned", "combined"])
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--fake-llm-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    server = create_server(port=0, strategies=args.strategies, fake_llm_latency=args.fake_llm_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    #Every conversation replays the user turns of the validation chats, 3 at a time
+    user_turns = load_user_turns(args.data)
+    conversations = [user_turns[(3 * i) % len(user_turns):(3 * i) % len(user_turns) + 3] or user_turns[:3] for i in range(args.conversations)]
+
+    for strategy in args.strategies:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = list(pool.map(lambda turns: run_conversation(base_url, strategy, turns), conversations))
+        seconds = time.perf_counter() - start
+        latencies = np.array([latency for result in results for latency in result]) * 1000
+        print(f"{strategy:>10}: {len(results)} conversations ({len(latencies)} requests) in {seconds:.2f}s, {len(results) / seconds:.1f} conversations/s, "
+              f"latency p50 {np.percentile(latencies, 50):.1f}ms p95 {np.percentile(latencies, 95):.1f}ms p99 {np.percentile(latencies, 99):.1f}ms")
+    print(f"Server health: {request(base_url, 'GET', '/health')}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer, TfidfTransformer
+from concurrent.futures import ProcessPoolExecutor
+from numbers import Integral
+from scipy import sparse
+import numpy as np
+from record_store import StringStore
+
+#Parallel fit of the TF-IDF vectorizer, for catalogs too large to vectorize in one process
+#The catalog is split into one shard per worker and every worker counts the words of its shard with a vocabulary of its own
+#The shard vocabularies and document frequencies are then merged into the global ones and the IDF weights are computed once over the whole catalog
+#The merge gives back the same vocabulary, IDF weights and (up to float rounding) matrix as TfidfVectorizer.fit_transform, so the artifact, the catalog updates and the drift tracking work unchanged
+
+#Settings of TfidfVectorizer that are applied after the counts of the shards are merged
+IDF_PARAMS = ("norm", "use_idf", "smooth_idf", "sublinear_tf")
+LIMIT_PARAMS = ("max_df", "min_df", "max_features")
+
+#Function to split the texts into contiguous shards that can be sent to the workers, a StringStore is split into slices of its blob
+def split_texts(texts, n_shards):
+    bounds = np.linspace(0, len(texts), n_shards + 1).astype(np.int64)
+    if isinstance(texts, StringStore):
+        return [texts.slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+    return [list(texts[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+#Function to count the words of one shard, gives back its vocabulary (sorted, like CountVectorizer sorts it) and its count matrix
+def count_shard(texts, count_params):
+    counter = CountVectorizer(**count_params)
+    counts = counter.fit_transform(texts)
+    return counter.get_feature_names_out().tolist(), counts.tocsr()
+
+#Function to merge the vocabularies and count matrices of the shards into one count matrix over the sorted union of the vocabularies
+#The words are numbered in sorted order, the same numbering TfidfVectorizer gives its vocabulary
+def merge_counts(shard_counts):
+    terms = sorted(set().union(*(shard_terms for shard_terms, _ in shard_counts)))
+    index = {term: i for i, term in enumerate(terms)}
+    matrices = []
+    for shard_terms, counts in shard_counts:
+        mapping = np.array([index[term] for term in shard_terms], dtype=counts.indices.dtype)
+        matrices.append(sparse.csr_matrix((counts.data, mapping[counts.indices], counts.indptr), shape=(counts.shape[0], len(terms))))
+    return terms, sparse.vstack(matrices, format='csr')
+
+#Function to drop the words outside of min_df/max_df and past max_features, the same way CountVectorizer does after counting the whole catalog
+def limit_features(terms, counts, max_df=1.0, min_df=1, max_features=None):
+    n_docs = counts.shape[0]
+    high = max_df if isinstance(max_df, Integral) else max_df * n_docs
+    low = min_df if isinstance(min_df, Integral) else min_df * n_docs
+    if high < low:
+        raise ValueError("max_df corresponds to < documents than min_df")
+    document_frequencies = np.bincount(counts.indices, minlength=counts.shape[1])
+    mask = (document_frequencies <= high) & (document_frequencies >= low)
+    if max_features is not None and mask.sum() > max_features:
+        term_counts = np.asarray(counts.sum(axis=0)).ravel()
+        kept = np.where(mask)[0][(-term_counts[mask]).argsort()[:max_features]]
+        mask = np.zeros(len(mask), dtype=bool)
+        mask[kept] = True
+    if mask.all():
+        return terms, counts
+    kept = np.flatnonzero(mask)
+    if len(kept) == 0:
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+    return [terms[i] for i in kept], counts[:, kept]
+
+#Function to fit the TF-IDF vectorizer over the texts with a pool of worker processes, gives back the fitted vectorizer and the TF-IDF matrix
+def vectorize_parallel(texts, vectorizer_params=None, workers=4):
+    params = TfidfVectorizer(**(vectorizer_params or {})).get_params()
+    count_params = {key: value for key, value in params.items() if key not in IDF_PARAMS + LIMIT_PARAMS + ("vocabulary",)}
+    shards = split_texts(texts, workers)
+    if workers == 1:
+        shard_counts = [count_shard(shards[0], count_params)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            shard_counts = list(pool.map(count_shard, shards, [count_params] * len(shards)))
+    terms, counts = merge_counts(shard_counts)
+    del shard_counts
+    terms, counts = limit_features(terms, counts, **{key: params[key] for key in LIMIT_PARAMS})
+    #The IDF weights come from the document frequencies of the whole catalog, not of a single shard
+    transformer = TfidfTransformer(**{key: params[key] for key in IDF_PARAMS}).fit(counts)
+    matrix = transformer.transform(counts, copy=False)
+    vectorizer = TfidfVectorizer(vocabulary=dict(zip(terms, range(len(terms)))), **(vectorizer_params or {}))
+    if params["use_idf"]:
+        vectorizer.idf_ = transformer.idf_
+    return vectorizer, matrix
@@ -0,0 +1,165 @@
+import re
+import string
+from instrumentation import timed
+
+#Vocabularies of the specification slots, the values are given back capitalized like the original extract_preferences did
+BRANDS = ["dell", "lenovo", "hp", "asus", "acer", "apple", "microsoft", "samsung", "msi", "lg", "razer", "huawei"]
+PROCESSORS = ["i3", "i5", "i7", "i9", "ryzen", "amd", "intel", "m1", "m2"]
+GPUS = ["nvidia", "amd", "intel", "rtx", "gtx", "vega"]
+OPERATING_SYSTEMS = ["windows", "macos", "linux", "ubuntu", "chromeos"]
+KEYBOARD_FEATURES = ["backlit", "rgb"]
+MATERIALS = ["aluminum", "plastic", "carbon"]
+
+#Words that trigger a slot, matched as whole words so "os" no longer fires inside "cost" or "use" inside "because"
+#The names of the operating systems trigger the os slot on their own, like the "os" inside "macos" used to
+TRIGGER_WORDS = {
+    "brand": "brand", "ram": "ram", "processor": "processor", "processors": "processor", "cpu": "processor",
+    "gpu": "gpu", "graphics": "gpu", "storage": "storage", "ssd": "ssd", "hdd": "hdd", "budget": "price", "price": "price",
+    "display": "screen", "displays": "screen", "battery": "battery", "long": "long", "good": "long", "weight": "weight", "os": "os",
+    "audio": "audio", "sound": "audio", "keyboard": "keyboard", "material": "material", "webcam": "webcam", "camera": "webcam",
+    "hd": "hd", "connectivity": "connectivity", "wifi": "connectivity", "bluetooth": "bluetooth", "purpose": "purpose",
+    "use": "purpose", "used": "purpose", "uses": "purpose", "usage": "purpose", "gaming": "gaming", "work": "work",
+    "working": "work", "everyday": "everyday",
+    **{name: "os" for name in OPERATING_SYSTEMS},
+}
+#Multi-word phrases and the triggers they set, these are long enough to be looked up as plain substrings
+PHRASE_TRIGGERS = {
+    "screen size": ["screen"], "hard drive": ["storage"], "operating system": ["os"], "general use": ["purpose", "everyday"],
+    "full hd": ["hd"], "wifi 6": ["connectivity", "wifi_6"], "wi-fi 6": ["connectivity", "wifi_6"], "high-quality": ["high_quality"],
+}
+
+#Function to turn a list of words into the set of their UTF-8 bytes the tokenizer gives back
+def encoded(words):
+    return frozenset(word.encode() for word in words)
+
+#The input is tokenized as bytes: one translate turns every byte that is not a lowercase letter or a digit into a space (the bytes of non-ASCII characters too),
+#and split() cuts out the words, the same words as the regular expression [a-z0-9]+ in a fraction of its time
+SEPARATORS = bytes(byte if chr(byte) in string.ascii_lowercase + string.digits else 32 for byte in range(256))
+BRAND_WORDS, PROCESSOR_WORDS, GPU_WORDS, OS_WORDS, KEYBOARD_WORDS, MATERIAL_WORDS = map(encoded, (BRANDS, PROCESSORS, GPUS, OPERATING_SYSTEMS, KEYBOARD_FEATURES, MATERIALS))
+WORD_TRIGGERS = {word.encode(): trigger for word, trigger in TRIGGER_WORDS.items()}
+#First word of every phrase, a phrase is only looked up in the input when its first word is there
+PHRASE_HEADS = {}
+for phrase in PHRASE_TRIGGERS:
+    PHRASE_HEADS.setdefault(phrase.encode().translate(SEPARATORS).split()[0], []).append(phrase)
+#Every word the extractor cares about, the others are dropped by one set intersection right after tokenizing
+VOCABULARY = BRAND_WORDS | PROCESSOR_WORDS | GPU_WORDS | OS_WORDS | KEYBOARD_WORDS | MATERIAL_WORDS | encoded(TRIGGER_WORDS) | frozenset(PHRASE_HEADS)
+LIGHT_PATTERN = re.compile(r"\blight")
+#Every unit value (16gb, 1 tb, 15.6 inch, 15.6", 10 hours, $1,200, plain numbers) compiled into one regular expression
+#It starts with a digit or "$", so the scan skips straight over the words, and the kind of every value is read from its unit afterwards
+#Numbers that are part of a word, like "12th" or "i7", are not matched
+UNIT_PATTERN = re.compile(r"[$\d](?<![\w.,$][$\d])[\d,.]*(?:\s?-?\s?((?:gb|tb|inch(?:es)?|hours?|hrs?)\b|\"|”))?(?!\w)")
+UNIT_KINDS = {"gb": "capacity", "tb": "capacity", "inch": "inch", "inches": "inch", '"': "inch", "”": "inch", "hour": "hours", "hours": "hours", "hr": "hours", "hrs": "hours"}
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+#Words around a GB/TB amount that tell which slot it belongs to, e.g. "16gb of ddr5 ram", "ram: 16gb" or "1tb nvme ssd"
+RAM_AFTER = re.compile(r"\s*(?:of\s+)?(?:l?ddr\d\w*\s+)?(?:ram|memory)\b")
+RAM_BEFORE = re.compile(r"(?:ram|memory)\W*(?:of\s+)?$")
+STORAGE_AFTER = re.compile(r"\s*(?:of\s+)?(?:pcie\s+|nvme\s+|m\.2\s+)*(?:ssd|hdd|storage|hard drive|nvme)\b")
+STORAGE_BEFORE = re.compile(r"(?:storage|ssd|hdd|hard drive)\W*(?:of\s+)?$")
+
+#Triggers of the slots whose values are read from the unit values, the unit scan is skipped when none of them is in the input
+UNIT_SLOTS = {"ram", "storage", "price", "screen", "battery"}
+
+#Function to scan the words of the user input, gives back the triggers found, all words in order and the vocabulary words among them
+def scan_words(user_input):
+    words = user_input.encode().translate(SEPARATORS).split()
+    found = VOCABULARY.intersection(words)
+    triggers = {WORD_TRIGGERS[word] for word in found if word in WORD_TRIGGERS}
+    for head in found.intersection(PHRASE_HEADS):
+        for phrase in PHRASE_HEADS[head]:
+            if phrase in user_input:
+                triggers.update(PHRASE_TRIGGERS[phrase])
+    if "light" in user_input and LIGHT_PATTERN.search(user_input):
+        triggers.update(("weight", "light"))
+    return triggers, words, found
+
+#Function to scan the unit values of the user input, gives back the values of every kind in the order they appear
+def scan_units(user_input):
+    values = {"capacity": [], "inch": [], "hours": [], "money": [], "number": []}
+    for match in UNIT_PATTERN.finditer(user_input):
+        text, unit = match.group(), match.group(1)
+        if unit:
+            kind = UNIT_KINDS[unit]
+            number = NUMBER_PATTERN.match(text)
+            if number:
+                values[kind].append((match.start(), match.end(), number.group() + unit if kind == "capacity" else text))
+            continue
+        text = text.rstrip(",.")
+        if text.startswith("$"):
+            values["money"].append((match.start(), match.end(), text))
+        elif text.isdigit():
+            values["number"].append((match.start(), match.end(), text))
+    return values
+
+#Function to pick the word of the vocabulary that comes first in the input, the position is only looked up when the input has more than one
+def first_word(words, found, vocabulary):
+    matches = found & vocabulary
+    if not matches:
+        return None
+    return (min(matches, key=words.index) if len(matches) > 1 else next(iter(matches))).decode()
+
+#Function to pick the GB/TB amount that belongs to a slot: the one next to the slot keyword, else the first one not used by another slot
+def capacity_near(user_input, capacities, after, before, taken=None):
+    for start, end, capacity in capacities:
+        if after.match(user_input, end) or before.search(user_input, max(0, start - 16), start):
+            return capacity
+    return next((capacity for _, _, capacity in capacities if capacity != taken), None)
+
+#Function to extract the prefernces from the user input with one tokenizing pass and one compiled unit pattern, fills the same preferences dict as before
+@timed("extract_preferences")
+def extract_preferences(user_input, preferences):
+    lowered = user_input.lower() #Make the user input lowercase
+    triggers, words, found = scan_words(lowered)
+    values = scan_units(lowered) if triggers & UNIT_SLOTS else None
+    brand = first_word(words, found, BRAND_WORDS)
+    if "brand" in triggers or brand:
+        preferences["brand"] = (brand or "").capitalize() or preferences.get("brand")
+    if "ram" in triggers:
+        preferences["ram"] = capacity_near(lowered, [c for c in values["capacity"] if c[2].endswith("gb")], RAM_AFTER, RAM_BEFORE) or preferences.get("ram")
+    if "processor" in triggers:
+        preferences["processor"] = (first_word(words, found, PROCESSOR_WORDS) or "").capitalize() or preferences.get("processor")
+    if "gpu" in triggers:
+        preferences["gpu_brand"] = (first_word(words, found, GPU_WORDS) or "").capitalize() or preferences.get("gpu_brand")
+    if "storage" in triggers:
+        preferences["storage_capacity"] = capacity_near(lowered, values["capacity"], STORAGE_AFTER, STORAGE_BEFORE, taken=preferences.get("ram")) or preferences.get("storage_capacity")
+    if "ssd" in triggers or "hdd" in triggers:
+        preferences["storage_type"] = "SSD" if "ssd" in triggers else "HDD"
+    if "price" in triggers:
+        #A dollar amount is the budget, otherwise the first plain number
+        amounts = values["money"] or values["number"]
+        preferences["price"] = (amounts[0][2] if amounts else None) or preferences.get("price")
+    if "screen" in triggers and values["inch"]:
+        preferences["screen_size"] = NUMBER_PATTERN.match(values["inch"][-1][2]).group()
+    if "battery" in triggers:
+        if "long" in triggers:
+            preferences["battery_life"] = "long-lasting"
+        else:
+            preferences["battery_life"] = (values["hours"][0][2] if values["hours"] else None) or preferences.get("battery_life")
+    if "weight" in triggers:
+        preferences["weight"] = "lightweight" if "light" in triggers else preferences.get("weight")
+    if "os" in triggers:
+        preferences["os"] = (first_word(words, found, OS_WORDS) or "").capitalize() or preferences.get("os")
+    if "audio" in triggers:
+        preferences["audio"] = "high-quality audio" if "high_quality" in triggers else preferences.get("audio")
+    if "keyboard" in triggers:
+        preferences["keyboard_features"] = first_word(words, found, KEYBOARD_WORDS) or preferences.get("keyboard_features")
+    if "material" in triggers:
+        preferences["material"] = (first_word(words, found, MATERIAL_WORDS) or "").capitalize() or preferences.get("material")
+    if "webcam" in triggers:
+        preferences["webcam_quality"] = "HD or Full HD" if "hd" in triggers else preferences.get("webcam_quality")
+    if "connectivity" in triggers or "bluetooth" in triggers:
+        if "wifi_6" in triggers:
+            preferences["connectivity"] = "Wi-Fi 6"
+        elif "bluetooth" in triggers:
+            preferences["connectivity"] = "Bluetooth"
+        else:
+            preferences["connectivity"] = preferences.get("connectivity")
+    if "purpose" in triggers:
+        if "gaming" in triggers:
+            preferences["purpose"] = "Gaming"
+        elif "work" in triggers:
+            preferences["purpose"] = "Work"
+        elif "everyday" in triggers:
+            preferences["purpose"] = "General Use"
+        else:
+            preferences["purpose"] = preferences.get("purpose")
+    return preferences
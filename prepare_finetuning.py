@@ -0,0 +1,224 @@
+import numpy as np
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from context_packing import prompt_tokens
+
+#Streaming pipeline that turns laptop_chat_finetuning_new.jsonl into the train and validation files of the fine-tuning job, replacing the load, validate and 80/20 split cells of Fine_Tuning_GPT4.ipynb
+#The dataset is read once in batches of lines, a pool of processes validates every example, counts its tokens offline and hashes it, and only the hashes are kept in memory to drop duplicates
+#Every kept example goes to the train or validation split and to a shuffle bucket by a seeded hash of its messages, and the buckets are shuffled one at a time, so the dataset never has to fit in memory
+
+#Roles the fine-tuning API accepts
+ROLES = ("system", "user", "assistant")
+#Lines sent to a worker at a time
+BATCH_LINES = 1000
+#Most tokens one training example may have (the limit of gpt-4o-2024-08-06), longer examples are left out
+MAX_EXAMPLE_TOKENS = 65536
+#Price of fine-tuning gpt-4o-2024-08-06 per 1M training tokens (USD), and the epochs the last job ran for ("auto" picked 3)
+TRAINING_PRICE_PER_MILLION = 25.0
+DEFAULT_EPOCHS = 3
+#Examples whose user and assistant text have simhashes this many bits or less apart count as near-duplicates
+NEAR_DUPLICATE_BITS = 3
+#The 64-bit simhash is split in this many bands, two near-duplicates share at least one band as long as NEAR_DUPLICATE_BITS is below it
+SIMHASH_BANDS = 4
+#Shuffle buckets per split, one bucket has to fit in memory when it is shuffled
+SHUFFLE_BUCKETS = 64
+WORD = re.compile(r"[a-z0-9]+")
+
+#Function to check the structure of one example, gives back the reason it is invalid or None
+#The same checks as validate_messages_jsonl in the notebook, plus the ones the fine-tuning API fails the whole file on
+def example_error(example):
+    if not isinstance(example, dict) or "messages" not in example:
+        return "Missing 'messages' key."
+    if not isinstance(example["messages"], list) or not example["messages"]:
+        return "'messages' is not a list of messages."
+    for j, message in enumerate(example["messages"]):
+        if not isinstance(message, dict) or "role" not in message or "content" not in message:
+            return f"Message {j + 1}: Missing 'role' or 'content' key."
+        if message["role"] not in ROLES:
+            return f"Message {j + 1}: Invalid role '{message['role']}'."
+        if not isinstance(message["content"], str) or not message["content"].strip():
+            return f"Message {j + 1}: Empty content."
+    if not any(message["role"] == "assistant" for message in example["messages"]):
+        return "No assistant message."
+    return None
+
+#Function to compute the 64-bit simhash of the user and assistant text of an example from its 3-word shingles, near-identical conversations get hashes a few bits apart
+def simhash(messages):
+    words = WORD.findall(" ".join(message["content"] for message in messages if message["role"] != "system").lower())
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+    hashes = np.array([int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little") for shingle in shingles], dtype=np.uint64)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    return int.from_bytes(np.packbits(bits.sum(axis=0) * 2 > len(hashes), bitorder="little").tobytes(), "little")
+
+#Function to check one batch of (line number, line) pairs in a worker process
+#Gives back (line number, error, canonical line, exact hash, simhash, tokens) per line, the canonical line has sorted keys so the same example always hashes the same
+def check_batch(batch, max_tokens=MAX_EXAMPLE_TOKENS):
+    results = []
+    for line_number, line in batch:
+        try:
+            example = json.loads(line)
+        except json.JSONDecodeError as e:
+            results.append((line_number, f"Invalid JSON: {e.msg}.", None, None, None, 0))
+            continue
+        error = example_error(example)
+        if error:
+            results.append((line_number, error, None, None, None, 0))
+            continue
+        messages = [{"role": message["role"], "content": message["content"]} for message in example["messages"]]
+        tokens = prompt_tokens(messages)
+        if tokens > max_tokens:
+            results.append((line_number, f"{tokens} tokens, over the limit of {max_tokens}.", None, None, None, tokens))
+            continue
+        canonical = json.dumps({**example, "messages": messages}, ensure_ascii=False, sort_keys=True)
+        results.append((line_number, None, canonical, hashlib.sha256(canonical.encode()).digest(), simhash(messages), tokens))
+    return results
+
+#Function to read the non-empty lines of the dataset in batches, with their line numbers
+def read_batches(path, batch_lines=BATCH_LINES):
+    with open(path, encoding="utf-8") as file:
+        lines = ((i + 1, line) for i, line in enumerate(file) if line.strip())
+        while batch := list(islice(lines, batch_lines)):
+            yield batch
+
+#Function to check the batches over a pool of workers in order, with only a few batches in flight so the dataset is never read ahead into memory
+def check_batches(batches, workers, max_tokens):
+    if workers == 1:
+        for batch in batches:
+            yield check_batch(batch, max_tokens)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(check_batch, batch, max_tokens))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+#Near-duplicate index of the simhashes kept so far, a new simhash is only compared with the ones that share one of its bands
+class NearDuplicates:
+    def __init__(self, max_bits=NEAR_DUPLICATE_BITS, bands=SIMHASH_BANDS):
+        self.max_bits = max_bits
+        self.band_bits = 64 // bands
+        self.bands = [{} for _ in range(bands)]
+
+    def keys(self, value):
+        mask = (1 << self.band_bits) - 1
+        return [(value >> (i * self.band_bits)) & mask for i in range(len(self.bands))]
+
+    #Function to check if the simhash is close to one already added, and to add it when it is not
+    def add(self, value):
+        keys = self.keys(value)
+        for band, key in zip(self.bands, keys):
+            if any(bin(value ^ other).count("1") <= self.max_bits for other in band.get(key, ())):
+                return True
+        for band, key in zip(self.bands, keys):
+            band.setdefault(key, []).append(value)
+        return False
+
+#Function to place an example by a seeded hash of its exact hash: the split, the shuffle bucket and the order inside the bucket
+#The place only depends on the seed and the example, not on the order or the number of workers, so the same dataset and seed always give the same files
+def placement(seed, digest, validation_share, buckets):
+    key = hashlib.sha256(f"{seed}:".encode() + digest).digest()
+    split = "validation" if int.from_bytes(key[:8], "little") / 2 ** 64 < validation_share else "train"
+    return split, int.from_bytes(key[8:12], "little") % buckets, key[12:20].hex()
+
+#Function to write the buckets of a split into its output file, every bucket is read and sorted by its random order key alone
+def gather_buckets(paths, output_path):
+    with open(output_path + ".tmp", "w", encoding="utf-8") as output:
+        for path in paths:
+            with open(path, encoding="utf-8") as bucket:
+                for line in sorted(bucket):
+                    output.write(line.split("\t", 1)[1])
+    os.replace(output_path + ".tmp", output_path)
+
+#Function to run the pipeline, gives back the report of the run
+def prepare(input_path, train_path, validation_path, validation_share=0.2, seed=0, workers=4, max_tokens=MAX_EXAMPLE_TOKENS,
+            epochs=DEFAULT_EPOCHS, batch_lines=BATCH_LINES, buckets=SHUFFLE_BUCKETS):
+    exact = set()
+    near = NearDuplicates()
+    errors = Counter()
+    first_errors = []
+    tokens = {"train": [], "validation": []}
+    counts = Counter()
+    #The buckets are written next to the train file, so a large dataset stays on the same disk
+    bucket_dir = tempfile.mkdtemp(prefix="finetuning_buckets_", dir=os.path.dirname(os.path.abspath(train_path)))
+    try:
+        files = {(split, i): open(os.path.join(bucket_dir, f"{split}_{i}.jsonl"), "w", encoding="utf-8") for split in tokens for i in range(buckets)}
+        for results in check_batches(read_batches(input_path, batch_lines), workers, max_tokens):
+            for line_number, error, line, digest, fingerprint, count in results:
+                counts["read"] += 1
+                if error:
+                    counts["over_limit" if count else "invalid"] += 1
+                    errors[error.split(":")[0]] += 1
+                    if len(first_errors) < 10:
+                        first_errors.append(f"line {line_number}: {error}")
+                    continue
+                #Exact duplicates are checked first, so a repeated example is never counted as a near-duplicate of itself
+                if digest in exact:
+                    counts["exact_duplicates"] += 1
+                    continue
+                exact.add(digest)
+                if near.add(fingerprint):
+                    counts["near_duplicates"] += 1
+                    continue
+                split, bucket, order = placement(seed, digest, validation_share, buckets)
+                files[split, bucket].write(f"{order}\t{line}\n")
+                tokens[split].append(count)
+        for file in files.values():
+            file.close()
+        for split, path in (("train", train_path), ("validation", validation_path)):
+            gather_buckets([os.path.join(bucket_dir, f"{split}_{i}.jsonl") for i in range(buckets)], path)
+    finally:
+        shutil.rmtree(bucket_dir, ignore_errors=True)
+
+    report = {**{key: counts[key] for key in ("read", "invalid", "over_limit", "exact_duplicates", "near_duplicates")}, "errors": dict(errors), "first_errors": first_errors}
+    for split, split_tokens in tokens.items():
+        split_tokens = np.array(split_tokens or [0])
+        report[split] = {"examples": len(tokens[split]), "tokens": int(split_tokens.sum()), "max_tokens": int(split_tokens.max()),
+                         "p50_tokens": float(np.percentile(split_tokens, 50)), "p95_tokens": float(np.percentile(split_tokens, 95))}
+    #Only the training tokens are billed, once per epoch
+    report["epochs"] = epochs
+    report["billed_tokens"] = report["train"]["tokens"] * epochs
+    report["estimated_cost_usd"] = round(report["billed_tokens"] / 1e6 * TRAINING_PRICE_PER_MILLION, 2)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate, dedupe, shuffle and split the fine-tuning dataset in one streaming pass, with offline token counts and the training cost.")
+    parser.add_argument("--input", default="laptop_chat_finetuning_new.jsonl")
+    parser.add_argument("--train", default="laptop_chat_train.jsonl")
+    parser.add_argument("--validation", default="laptop_chat_validation.jsonl")
+    parser.add_argument("--validation-share", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the split and the shuffle, the same seed always gives the same files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-tokens", type=int, default=MAX_EXAMPLE_TOKENS, help="Examples with more tokens are left out")
+    parser.add_argument("--epochs", type=int, default=DEFAULT_EPOCHS, help="Epochs the cost estimate is computed for")
+    parser.add_argument("--batch-lines", type=int, default=BATCH_LINES)
+    parser.add_argument("--buckets", type=int, default=SHUFFLE_BUCKETS, help="Shuffle buckets per split, raise it when one bucket does not fit in memory")
+    parser.add_argument("--report", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = prepare(args.input, args.train, args.validation, args.validation_share, args.seed, args.workers, args.max_tokens,
+                     args.epochs, args.batch_lines, args.buckets)
+    print(f"Read {report['read']} examples: {report['invalid']} invalid, {report['over_limit']} over {args.max_tokens} tokens, "
+          f"{report['exact_duplicates']} exact duplicates, {report['near_duplicates']} near-duplicates")
+    for error in report["first_errors"]:
+        print(f"  {error}")
+    for split, path in (("train", args.train), ("validation", args.validation)):
+        stats = report[split]
+        print(f"{split}: {stats['examples']} examples in {path}, {stats['tokens']} tokens (p50 {stats['p50_tokens']:.0f}, p95 {stats['p95_tokens']:.0f}, max {stats['max_tokens']} per example)")
+    print(f"Estimated training cost: {report['billed_tokens']} tokens over {report['epochs']} epochs, ${report['estimated_cost_usd']:.2f}")
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(report, file, indent=4)
+
+if __name__ == "__main__":
+    main()
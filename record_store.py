@@ -0,0 +1,205 @@
+from collections import namedtuple
+import numpy as np
+import os
+
+#One laptop of the catalog, parsed once when the retrieval artifact is built
+class Record(namedtuple("Record", ["title", "descriptions", "features"])):
+    __slots__ = ()
+
+    #The combined_text the record was parsed from
+    def text(self):
+        return f"{self.title} {self.descriptions} {self.features}"
+
+#Function to read a list written like "['a', 'b']" (the description and features columns of the metadata) into its items
+def split_list(text):
+    text = str(text).strip()
+    if len(text) < 4 or not text.startswith("['"):
+        return []
+    return [item for item in text[2:].rstrip("]").rstrip("'").split("', '") if item]
+
+#Function to split a combined_text ("title ['description', ...] ['feature', ...]") into the title, the description list and the feature list
+def split_record(text):
+    start = min((i for i in (text.find(" ['"), text.find(" []")) if i >= 0), default=-1)
+    if start < 0:
+        return text.strip(), [], []
+    title, lists = text[:start].strip(), text[start + 1:]
+    if lists.startswith("[]"):
+        return title, [], split_list(lists[2:])
+    end = lists.find("'] [")
+    if end < 0:
+        return title, split_list(lists), []
+    return title, split_list(lists[:end + 2]), split_list(lists[end + 3:])
+
+#Function to check if a record holds anything to recommend, the catalog has placeholder rows like "0 [] []"
+def is_valid_record(title, descriptions, features):
+    return str(title).strip() not in ("", "0") and bool(descriptions or features)
+
+#Table of strings kept as one UTF-8 blob plus an offsets array, so it can be memory-mapped and only the strings that are used get decoded
+#Strings appended by catalog updates are kept in a list after the blob until the store is saved again
+class StringStore:
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+        self.tail = []
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [string.encode('utf-8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(blob, offsets)
+
+    #Function to join stores into one, e.g. the stores of the chunks of the catalog
+    @classmethod
+    def concatenate(cls, stores):
+        stores = [store.merged() for store in stores]
+        if not stores:
+            return cls.from_strings([])
+        shifts = np.cumsum([0] + [len(store.blob) for store in stores[:-1]])
+        offsets = np.concatenate([stores[0].offsets[:1]] + [store.offsets[1:] + shift for store, shift in zip(stores, shifts)])
+        return cls(np.concatenate([store.blob for store in stores]), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1 + len(self.tail)
+
+    def __getitem__(self, i):
+        if i >= len(self.offsets) - 1:
+            return self.tail[i - len(self.offsets) + 1]
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    #Function to give back the strings start to stop as a store of their own, e.g. to send a shard of the catalog to another process
+    def slice(self, start, stop):
+        store = self.merged()
+        return StringStore(np.asarray(store.blob[store.offsets[start]:store.offsets[stop]]), np.asarray(store.offsets[start:stop + 1]) - store.offsets[start])
+
+    def append(self, string):
+        self.tail.append(string)
+
+    #Function to give back the store with the appended strings merged into the blob
+    def merged(self):
+        if not self.tail:
+            return self
+        tail = StringStore.from_strings(self.tail)
+        return StringStore(np.concatenate([self.blob, tail.blob]), np.concatenate([self.offsets, tail.offsets[1:] + self.offsets[-1]]))
+
+    def save(self, directory, name):
+        store = self.merged()
+        np.save(os.path.join(directory, f"{name}_blob.npy"), store.blob)
+        np.save(os.path.join(directory, f"{name}_offsets.npy"), store.offsets)
+
+    @classmethod
+    def load(cls, directory, name):
+        return cls(
+            np.load(os.path.join(directory, f"{name}_blob.npy"), mmap_mode='r'),
+            np.load(os.path.join(directory, f"{name}_offsets.npy"), mmap_mode='r'),
+        )
+
+#Table of string lists: every item in one StringStore, and the index of the first item of every list
+#Lists appended by catalog updates only record where they end, the start of a list is the end of the one before it
+class ListStore:
+    def __init__(self, items, starts):
+        self.items = items
+        self.starts = starts
+        self.tail_ends = []
+
+    @classmethod
+    def from_lists(cls, lists):
+        starts = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(items) for items in lists], out=starts[1:])
+        return cls(StringStore.from_strings([item for items in lists for item in items]), starts)
+
+    @classmethod
+    def concatenate(cls, stores):
+        if not stores:
+            return cls.from_lists([])
+        shifts = np.cumsum([0] + [len(store.items) for store in stores[:-1]])
+        starts = np.concatenate([stores[0].all_starts()[:1]] + [store.all_starts()[1:] + shift for store, shift in zip(stores, shifts)])
+        return cls(StringStore.concatenate([store.items for store in stores]), starts)
+
+    def __len__(self):
+        return len(self.starts) - 1 + len(self.tail_ends)
+
+    def __getitem__(self, i):
+        base = len(self.starts) - 1
+        if i < base:
+            start, end = self.starts[i], self.starts[i + 1]
+        else:
+            start, end = self.tail_ends[i - base - 1] if i > base else self.starts[-1], self.tail_ends[i - base]
+        return [self.items[j] for j in range(start, end)]
+
+    def append(self, items):
+        for item in items:
+            self.items.append(item)
+        self.tail_ends.append(len(self.items))
+
+    #Function to get the index of the first item of every list, with the appended lists
+    def all_starts(self):
+        return np.concatenate([self.starts, np.asarray(self.tail_ends, dtype=np.int64)]) if self.tail_ends else self.starts
+
+    #Number of items of every list
+    def lengths(self):
+        return np.diff(self.all_starts())
+
+    def save(self, directory, name):
+        self.items.save(directory, f"{name}_items")
+        np.save(os.path.join(directory, f"{name}_starts.npy"), self.all_starts())
+
+    @classmethod
+    def load(cls, directory, name):
+        return cls(StringStore.load(directory, f"{name}_items"), np.load(os.path.join(directory, f"{name}_starts.npy"), mmap_mode='r'))
+
+#Columnar store of the parsed catalog records (titles, description lists and feature lists), in the same order as the rows of the index
+class RecordStore:
+    def __init__(self, titles, descriptions, features):
+        self.titles = titles
+        self.descriptions = descriptions
+        self.features = features
+        self.complete = None
+
+    @classmethod
+    def from_lists(cls, titles, descriptions, features):
+        return cls(StringStore.from_strings(titles), ListStore.from_lists(descriptions), ListStore.from_lists(features))
+
+    @classmethod
+    def concatenate(cls, stores):
+        return cls(
+            StringStore.concatenate([store.titles for store in stores]),
+            ListStore.concatenate([store.descriptions for store in stores]),
+            ListStore.concatenate([store.features for store in stores]),
+        )
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __getitem__(self, i):
+        return Record(self.titles[i], self.descriptions[i], self.features[i])
+
+    #Function to add a record after the last one, used by the incremental catalog updates
+    def append(self, record):
+        self.titles.append(record.title)
+        self.descriptions.append(record.descriptions)
+        self.features.append(record.features)
+        self.complete = None
+
+    #Function to get the ids of the records that have both a description and a feature list, computed once until a record is appended
+    def complete_ids(self):
+        if self.complete is None:
+            self.complete = np.flatnonzero((self.descriptions.lengths() > 0) & (self.features.lengths() > 0))
+        return self.complete
+
+    def save(self, directory):
+        self.titles.save(directory, "record_titles")
+        self.descriptions.save(directory, "record_descriptions")
+        self.features.save(directory, "record_features")
+
+    @classmethod
+    def load(cls, directory):
+        return cls(
+            StringStore.load(directory, "record_titles"),
+            ListStore.load(directory, "record_descriptions"),
+            ListStore.load(directory, "record_features"),
+        )
@@ -0,0 +1,596 @@
+from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy import sparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from tqdm import tqdm
+import hashlib
+import json
+import os
+import shutil
+import time
+from spec_index import SpecIndex, prices_digest
+from record_store import StringStore, RecordStore
+from ingestion import ingest_metadata
+from parallel_vectorizer import vectorize_parallel
+from instrumentation import stage, timed
+from catalog_updates import REFIT_DRIFT_THRESHOLD, COMPACT_AFTER_UPDATES, JOURNAL_NAME, Catalog, DriftTracker, replay_journal, sync_catalog, needs_refit
+
+#Bump this when the layout of the artifact files changes so old artifacts get rebuilt
+ARTIFACT_FORMAT_VERSION = 4
+
+#Load metadata of the Amazon laptops, combine title, description and features into one text per laptop and parse them into records
+#The CSV is ingested in typed chunks (or read back from its Parquet cache), gives back the texts as a StringStore and the records as a RecordStore
+@timed("csv_load")
+def load_metadata_records(csv_path='metadata_cleaned.csv'):
+    texts, records, _ = ingest_metadata(csv_path, with_specs=False)
+    return texts, records
+
+#Load the combined texts of the Amazon laptops that are in the index
+def load_metadata_texts(csv_path='metadata_cleaned.csv'):
+    return list(load_metadata_records(csv_path)[0])
+
+#Function to pick the k smallest distances of every row, sorted from the closest to the furthest match (same order FAISS gives back)
+def top_k_smallest(distances, k):
+    k = min(k, distances.shape[1])
+    if k < distances.shape[1]:
+        candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(distances.shape[1]), (distances.shape[0], 1))
+    candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+    order = np.argsort(candidate_distances, axis=1, kind='stable')
+    return np.take_along_axis(candidate_distances, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+#Shared part of the retrievers, every backend implements search(query_vectors, k, allowed_ids) which gives back (distances, indices) like faiss index.search
+#allowed_ids restricts the search to those laptops (e.g. the ones meeting the users hard constraints), None searches the whole catalog
+class Retriever:
+    specs = None
+    records = None
+    #Product ids and live rows of the catalog, see catalog_updates.py
+    catalog = None
+
+    #Function to Retrieve context, aka the best laptops for recommendation depending on the query
+    def retrieve(self, query, k=5, allowed_ids=None):
+        return self.retrieve_batch([query], k, allowed_ids)[0]
+
+    #Function to Retrieve context for many queries at once, vectorizing them in one matrix operation and running one batched search
+    def retrieve_batch(self, queries, k=5, allowed_ids=None):
+        return [[(self.texts[i], score) for i, score in row] for row in self.search_ids(queries, k, allowed_ids)]
+
+    #Function to Retrieve the parsed records of the best laptops, ready to be formatted
+    def retrieve_records(self, query, k=5, allowed_ids=None):
+        return self.retrieve_records_batch([query], k, allowed_ids)[0]
+
+    def retrieve_records_batch(self, queries, k=5, allowed_ids=None):
+        return [[(self.records[i], score) for i, score in row] for row in self.search_ids(queries, k, allowed_ids)]
+
+    #Function to search the queries and give back one list of (laptop id, score) tuples per query
+    def search_ids(self, queries, k=5, allowed_ids=None):
+        if not queries:
+            return []
+        #Rows of removed or replaced laptops are never searched
+        if self.catalog is not None:
+            allowed_ids = self.catalog.restrict(allowed_ids)
+        with stage("vectorize_query"):
+            query_vectors = self.vectorizer.transform(queries)
+        with stage("index_search"):
+            distances, indices = self.search(query_vectors, k, allowed_ids)
+        #Missing results are marked with -1 when fewer than k laptops were found
+        return [
+            [(i, row_distances[j]) for j, i in enumerate(row_indices) if i >= 0]
+            for row_distances, row_indices in zip(distances, indices)
+        ]
+
+#Sparse retriever, keeps the TF-IDF matrix in CSR format instead of densifying the whole catalog
+#The matrix is stored term-major (one row of postings per vocabulary term), so a query only touches the postings of the terms it contains
+class SparseRetriever(Retriever):
+    def __init__(self, vectorizer, matrix, texts):
+        self.vectorizer = vectorizer
+        self.texts = texts
+        matrix = matrix.tocsr().astype(np.float32)
+        #Squared norm of every document, needed to give back the same squared L2 distances as FAISS IndexFlatL2
+        self.doc_norms = np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float32).ravel()
+        self.postings = matrix.T.tocsr()
+        #Laptops added by catalog updates, document-major, merged into the postings when the artifact is saved
+        self.delta = None
+
+    #Function to search the k closest laptops for every query vector, returns (distances, indices) like faiss index.search
+    #Queries are scored in chunks so a large batch never holds a dense queries x catalog score matrix at once
+    def search(self, query_vectors, k, allowed_ids=None, chunk_size=256):
+        query_vectors = query_vectors.tocsr().astype(np.float32)
+        blocked = None
+        if allowed_ids is not None:
+            blocked = np.ones(len(self.doc_norms), dtype=bool)
+            blocked[allowed_ids] = False
+        query_norms = np.asarray(query_vectors.multiply(query_vectors).sum(axis=1), dtype=np.float32)
+        all_distances, all_indices = [], []
+        for start in range(0, query_vectors.shape[0], chunk_size):
+            dots = (query_vectors[start:start + chunk_size] @ self.postings).toarray()
+            if self.delta is not None:
+                dots = np.hstack([dots, (query_vectors[start:start + chunk_size] @ self.delta.T).toarray()])
+            distances = query_norms[start:start + chunk_size] + self.doc_norms[np.newaxis, :] - 2 * dots
+            if blocked is not None:
+                distances[:, blocked] = np.inf
+            distances, indices = top_k_smallest(distances, k)
+            indices[np.isinf(distances)] = -1
+            all_distances.append(distances)
+            all_indices.append(indices)
+        return np.vstack(all_distances), np.vstack(all_indices)
+
+    #Function to add the TF-IDF vectors of new laptops after the last row, without touching the postings
+    def add_vectors(self, vectors):
+        vectors = vectors.tocsr().astype(np.float32)
+        self.delta = vectors if self.delta is None else sparse.vstack([self.delta, vectors], format='csr')
+        self.doc_norms = np.concatenate([self.doc_norms, np.asarray(vectors.multiply(vectors).sum(axis=1), dtype=np.float32).ravel()])
+
+    #Function to give back the postings with the added laptops merged in
+    def merged_postings(self):
+        if self.delta is None:
+            return self.postings
+        return sparse.hstack([self.postings, self.delta.T], format='csr')
+
+    #Memory held by the search structures in bytes
+    def memory_bytes(self):
+        delta = self.delta.data.nbytes + self.delta.indices.nbytes + self.delta.indptr.nbytes if self.delta is not None else 0
+        return self.postings.data.nbytes + self.postings.indices.nbytes + self.postings.indptr.nbytes + self.doc_norms.nbytes + delta
+
+    def save(self, directory):
+        postings = self.merged_postings()
+        np.save(os.path.join(directory, "postings_data.npy"), postings.data)
+        np.save(os.path.join(directory, "postings_indices.npy"), postings.indices)
+        np.save(os.path.join(directory, "postings_indptr.npy"), postings.indptr)
+        np.save(os.path.join(directory, "doc_norms.npy"), self.doc_norms)
+
+    @classmethod
+    def load(cls, directory, vectorizer, texts):
+        retriever = cls.__new__(cls)
+        retriever.vectorizer = vectorizer
+        retriever.texts = texts
+        retriever.doc_norms = np.load(os.path.join(directory, "doc_norms.npy"), mmap_mode='r')
+        data = np.load(os.path.join(directory, "postings_data.npy"), mmap_mode='r')
+        indices = np.load(os.path.join(directory, "postings_indices.npy"), mmap_mode='r')
+        indptr = np.load(os.path.join(directory, "postings_indptr.npy"), mmap_mode='r')
+        retriever.postings = sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(retriever.doc_norms)), copy=False)
+        retriever.delta = None
+        return retriever
+
+#Function to build the FAISS search parameters that restrict a search to the allowed ids, None when the whole index is searched
+def id_selector_parameters(allowed_ids, parameters_class=None, **search_params):
+    import faiss
+    if allowed_ids is None:
+        return parameters_class(**search_params) if parameters_class else None
+    selector = faiss.IDSelectorBatch(np.asarray(allowed_ids, dtype=np.int64))
+    return (parameters_class or faiss.SearchParameters)(sel=selector, **search_params)
+
+#Function to copy a memory-mapped FAISS index into memory, a memory-mapped index cannot grow
+def writable_index(index):
+    import faiss
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+#Dense retriever, the original path of the RAG scripts: densify the TF-IDF vectors and search them with a FAISS IndexFlatL2
+class DenseFaissRetriever(Retriever):
+    def __init__(self, vectorizer, matrix, texts):
+        import faiss
+        self.vectorizer = vectorizer
+        self.texts = texts
+        vectors = matrix.toarray()
+        self.index = faiss.IndexFlatL2(vectors.shape[1]) #Create a new FAISS Index
+        self.index.add(np.array(vectors).astype(np.float32)) #Add the vectors to the index
+        self.mapped = False
+
+    #Function to search the k closest laptops for every query vector, densifying the queries in chunks as they are as wide as the vocabulary
+    def search(self, query_vectors, k, allowed_ids=None, chunk_size=256):
+        params = id_selector_parameters(allowed_ids)
+        results = [self.index.search(query_vectors[start:start + chunk_size].toarray().astype(np.float32), k, params=params) for start in range(0, query_vectors.shape[0], chunk_size)]
+        return np.vstack([distances for distances, _ in results]), np.vstack([indices for _, indices in results])
+
+    #Function to add the TF-IDF vectors of new laptops after the last row, FAISS numbers them in the order they are added
+    def add_vectors(self, vectors):
+        if self.mapped:
+            self.index = writable_index(self.index)
+            self.mapped = False
+        self.index.add(vectors.toarray().astype(np.float32))
+
+    #Memory held by the search structures in bytes
+    def memory_bytes(self):
+        return self.index.ntotal * self.index.d * 4
+
+    def save(self, directory):
+        import faiss
+        faiss.write_index(self.index, os.path.join(directory, "index.faiss"))
+
+    @classmethod
+    def load(cls, directory, vectorizer, texts):
+        import faiss
+        retriever = cls.__new__(cls)
+        retriever.vectorizer = vectorizer
+        retriever.texts = texts
+        #Memory-map the stored vectors when this FAISS version supports it
+        retriever.index = faiss.read_index(os.path.join(directory, "index.faiss"), getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP))
+        retriever.mapped = True
+        return retriever
+
+#Function to fit the LSA projection of a TF-IDF matrix
+def fit_lsa_components(matrix, n_components=256):
+    from sklearn.decomposition import TruncatedSVD
+    svd = TruncatedSVD(n_components=min(n_components, matrix.shape[1] - 1), random_state=0)
+    svd.fit(matrix)
+    return svd.components_.astype(np.float32)
+
+#Approximate retriever, projects the TF-IDF vectors to a few hundred dimensions with LSA (TruncatedSVD) and searches them with a FAISS index
+#Vectors are L2 normalized after the projection so the L2 distance still ranks laptops like the cosine similarity of the TF-IDF vectors
+class LsaRetriever(Retriever):
+    #components are the LSA components of an other retriever, e.g. shared by the shards of a catalog so their distances can be compared
+    def __init__(self, vectorizer, matrix, texts, n_components=256, components=None, **index_params):
+        self.vectorizer = vectorizer
+        self.texts = texts
+        self.index_params = index_params
+        self.components = fit_lsa_components(matrix, n_components) if components is None else components
+        vectors = self.project(matrix)
+        self.index = self.build_index(vectors)
+        self.mapped = False
+        self.configure_search()
+
+    #Function to project TF-IDF vectors into the LSA space
+    def project(self, tfidf_vectors):
+        import faiss
+        vectors = np.ascontiguousarray(np.asarray(tfidf_vectors @ self.components.T, dtype=np.float32))
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    #Exact search over the projected vectors, the subclasses swap this for approximate FAISS indexes
+    def build_index(self, vectors):
+        import faiss
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        return index
+
+    #Function to apply the search-time parameters of the index
+    def configure_search(self):
+        pass
+
+    #Function to build the FAISS search parameters, restricted to the allowed ids
+    def search_parameters(self, allowed_ids):
+        return id_selector_parameters(allowed_ids)
+
+    #Function to search the k closest laptops for every query vector
+    def search(self, query_vectors, k, allowed_ids=None):
+        return self.index.search(self.project(query_vectors), k, params=self.search_parameters(allowed_ids))
+
+    #Function to project the TF-IDF vectors of new laptops with the fitted LSA components and add them after the last row
+    def add_vectors(self, vectors):
+        if self.mapped:
+            self.index = writable_index(self.index)
+            self.mapped = False
+            self.configure_search()
+        self.index.add(self.project(vectors))
+
+    #Memory held by the search structures in bytes
+    def memory_bytes(self):
+        import faiss
+        return self.components.nbytes + faiss.serialize_index(self.index).nbytes
+
+    def save(self, directory):
+        import faiss
+        np.save(os.path.join(directory, "lsa_components.npy"), self.components)
+        faiss.write_index(self.index, os.path.join(directory, "index.faiss"))
+
+    @classmethod
+    def load(cls, directory, vectorizer, texts, n_components=256, **index_params):
+        import faiss
+        retriever = cls.__new__(cls)
+        retriever.vectorizer = vectorizer
+        retriever.texts = texts
+        retriever.index_params = index_params
+        retriever.components = np.load(os.path.join(directory, "lsa_components.npy"), mmap_mode='r')
+        retriever.index = faiss.read_index(os.path.join(directory, "index.faiss"), getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP))
+        retriever.mapped = True
+        retriever.configure_search()
+        return retriever
+
+#LSA projection searched with a FAISS HNSW graph, M is the number of links per vector, ef_construction/ef_search trade speed for recall
+class HnswRetriever(LsaRetriever):
+    def build_index(self, vectors):
+        import faiss
+        index = faiss.IndexHNSWFlat(vectors.shape[1], self.index_params.get("hnsw_m", 32))
+        index.hnsw.efConstruction = self.index_params.get("ef_construction", 200)
+        index.add(vectors)
+        return index
+
+    def configure_search(self):
+        self.index.hnsw.efSearch = self.index_params.get("ef_search", 64)
+
+    #Search parameters passed with a selector replace the ones set on the index, so efSearch has to be given again
+    def search_parameters(self, allowed_ids):
+        import faiss
+        if allowed_ids is None:
+            return None
+        return id_selector_parameters(allowed_ids, faiss.SearchParametersHNSW, efSearch=self.index.hnsw.efSearch)
+
+#LSA projection searched with a FAISS IVF-PQ index, nlist inverted lists of which nprobe are visited, and pq_m sub-quantizers of pq_nbits bits per vector
+class IvfPqRetriever(LsaRetriever):
+    def build_index(self, vectors):
+        import faiss
+        #FAISS wants at least 39 training vectors per inverted list, so small catalogs get fewer lists
+        nlist = max(1, min(self.index_params.get("nlist", 256), len(vectors) // 39))
+        quantizer = faiss.IndexFlatL2(vectors.shape[1])
+        index = faiss.IndexIVFPQ(quantizer, vectors.shape[1], nlist, self.index_params.get("pq_m", 32), self.index_params.get("pq_nbits", 8))
+        index.train(vectors)
+        index.add(vectors)
+        return index
+
+    def configure_search(self):
+        self.index.nprobe = self.index_params.get("nprobe", 16)
+
+    #Search parameters passed with a selector replace the ones set on the index, so nprobe has to be given again
+    def search_parameters(self, allowed_ids):
+        import faiss
+        if allowed_ids is None:
+            return None
+        return id_selector_parameters(allowed_ids, faiss.SearchParametersIVF, nprobe=self.index.nprobe)
+
+#Sharded retriever, splits the catalog into contiguous ranges of rows with one index of the chosen backend each
+#A search is fanned out to the shards in a thread pool (the sparse products of scipy and the FAISS searches release the GIL) and the top-k of the shards are merged
+#Every shard of the LSA backends uses the same projection, so the distances of different shards can be compared. Laptops added by catalog updates go to the last shard
+class ShardedRetriever(Retriever):
+    def __init__(self, shard_class, vectorizer, matrix, texts, shards=2, workers=None, **index_params):
+        self.vectorizer = vectorizer
+        self.texts = texts
+        matrix = matrix.tocsr()
+        shards = max(1, min(shards, matrix.shape[0]))
+        bounds = np.linspace(0, matrix.shape[0], shards + 1).astype(np.int64)
+        self.starts = bounds[:-1]
+        if issubclass(shard_class, LsaRetriever):
+            index_params["components"] = fit_lsa_components(matrix, index_params.pop("n_components", 256))
+        #The indexes of the shards are built at the same time, one thread per shard up to workers
+        with ThreadPoolExecutor(max_workers=workers or shards) as pool:
+            self.shards = list(pool.map(lambda start, stop: shard_class(vectorizer, matrix[start:stop], None, **index_params), bounds[:-1], bounds[1:]))
+        self.pool = None
+
+    #Function to search every shard and merge their k closest laptops into the k closest of the catalog
+    def search(self, query_vectors, k, allowed_ids=None):
+        #The last shard also holds the laptops added after the build
+        stops = list(self.starts[1:]) + [np.iinfo(np.int64).max]
+        if allowed_ids is not None:
+            allowed_ids = np.asarray(allowed_ids)
+        tasks = []
+        for shard, start, stop in zip(self.shards, self.starts, stops):
+            shard_ids = None
+            if allowed_ids is not None:
+                shard_ids = allowed_ids[(allowed_ids >= start) & (allowed_ids < stop)] - start
+                #Shards without an allowed laptop are not searched
+                if len(shard_ids) == 0:
+                    continue
+            tasks.append((shard, start, shard_ids))
+        if not tasks:
+            return np.full((query_vectors.shape[0], 0), np.inf, dtype=np.float32), np.full((query_vectors.shape[0], 0), -1, dtype=np.int64)
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=len(self.shards))
+        results = list(self.pool.map(lambda task: task[0].search(query_vectors, k, task[2]), tasks))
+        distances = np.hstack([shard_distances for shard_distances, _ in results]).astype(np.float32)
+        indices = np.hstack([np.where(shard_indices >= 0, shard_indices + start, -1) for (_, shard_indices), (_, start, _) in zip(results, tasks)])
+        distances[indices < 0] = np.inf
+        distances, columns = top_k_smallest(distances, k)
+        indices = np.take_along_axis(indices, columns, axis=1)
+        indices[np.isinf(distances)] = -1
+        return distances, indices
+
+    #Function to add the TF-IDF vectors of new laptops after the last row, they become part of the last shard
+    def add_vectors(self, vectors):
+        self.shards[-1].add_vectors(vectors)
+
+    #Memory held by the search structures of all shards in bytes
+    def memory_bytes(self):
+        return sum(shard.memory_bytes() for shard in self.shards)
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "shard_starts.npy"), self.starts)
+        for i, shard in enumerate(self.shards):
+            shard_directory = os.path.join(directory, f"shard_{i}")
+            os.makedirs(shard_directory)
+            shard.save(shard_directory)
+
+    @classmethod
+    def load(cls, directory, shard_class, vectorizer, texts, **index_params):
+        retriever = cls.__new__(cls)
+        retriever.vectorizer = vectorizer
+        retriever.texts = texts
+        retriever.starts = np.load(os.path.join(directory, "shard_starts.npy"))
+        retriever.shards = [shard_class.load(os.path.join(directory, f"shard_{i}"), vectorizer, None, **index_params) for i in range(len(retriever.starts))]
+        retriever.pool = None
+        return retriever
+
+#Parameters that only change how an index is searched, so changing them does not need a rebuild
+SEARCH_PARAMS = {"ef_search", "nprobe"}
+
+RETRIEVERS = {
+    "sparse": SparseRetriever,
+    "faiss": DenseFaissRetriever,
+    "lsa": LsaRetriever,
+    "hnsw": HnswRetriever,
+    "ivfpq": IvfPqRetriever,
+}
+
+#Function to vectorize the texts and build the retriever of the chosen backend ("sparse", "faiss", "lsa", "hnsw" or "ivfpq")
+#index_params are passed to the approximate backends, e.g. {"n_components": 256, "hnsw_m": 32, "ef_search": 64} or {"nlist": 256, "pq_m": 32, "nprobe": 16}
+#{"shards": 8} in index_params splits the catalog into 8 indexes that are searched together, workers vectorizes the catalog with that many processes
+def build_retriever(texts, backend="sparse", vectorizer_params=None, index_params=None, workers=None):
+    if backend not in RETRIEVERS:
+        raise ValueError(f"Unknown retrieval backend '{backend}', choose one of {list(RETRIEVERS)}.")
+    index_params = dict(index_params or {})
+    shards = index_params.pop("shards", 1)
+    print("Vectorizing data...")
+    with stage("vectorize"):
+        if workers:
+            vectorizer, matrix = vectorize_parallel(texts, vectorizer_params, workers)
+        else:
+            vectorizer = TfidfVectorizer(**(vectorizer_params or {}))
+            matrix = vectorizer.fit_transform(tqdm(texts))
+    with stage("build_index"):
+        if shards > 1:
+            retriever = ShardedRetriever(RETRIEVERS[backend], vectorizer, matrix, texts, shards, workers, **index_params)
+        else:
+            retriever = RETRIEVERS[backend](vectorizer, matrix, texts, **index_params)
+    #Document frequencies of the fitted catalog, the starting point of the IDF drift tracking
+    retriever.drift = DriftTracker.from_matrix(matrix, vectorizer)
+    return retriever
+
+#Function to compute the content hash of the catalog CSV
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+#Function to compute the fingerprint an artifact is keyed by: the CSV content plus every setting that changes the vectors or the index
+def artifact_fingerprint(csv_hash, backend, vectorizer_params, index_params):
+    settings = {
+        "format": ARTIFACT_FORMAT_VERSION,
+        "csv_sha256": csv_hash,
+        #The spec index holds the laptops.csv prices, an index built with other prices is rebuilt
+        "prices": prices_digest(),
+        "backend": backend,
+        "index": {key: value for key, value in index_params.items() if key not in SEARCH_PARAMS},
+        "vectorizer": {key: repr(value) for key, value in TfidfVectorizer(**vectorizer_params).get_params().items()},
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+#Function to save the fitted vocabulary/idf, the index, the document table and the spec index of a retriever into one artifact directory
+def save_artifact(retriever, directory, manifest):
+    #Write into a temporary directory first and swap it in at the end, so a crash never leaves half an artifact behind
+    tmp_directory = directory + ".tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    vocabulary = retriever.vectorizer.vocabulary_
+    terms = sorted(vocabulary, key=vocabulary.get)
+    StringStore.from_strings(terms).save(tmp_directory, "vocabulary")
+    np.save(os.path.join(tmp_directory, "idf.npy"), retriever.vectorizer.idf_)
+    texts = retriever.texts if isinstance(retriever.texts, StringStore) else StringStore.from_strings(retriever.texts)
+    texts.save(tmp_directory, "texts")
+    retriever.save(tmp_directory)
+    retriever.specs.save(tmp_directory)
+    retriever.records.save(tmp_directory)
+    retriever.catalog.save(tmp_directory)
+    with open(os.path.join(tmp_directory, "manifest.json"), 'w') as file:
+        json.dump(manifest, file, indent=4)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    #The updates are part of the saved artifact now, the next ones start a new journal
+    retriever.catalog.journal_path = os.path.join(directory, JOURNAL_NAME)
+    retriever.catalog.journal_length = 0
+
+#Function to load a retriever back from an artifact directory, without refitting the vectorizer, and apply the catalog updates made since it was saved
+@timed("load_index")
+def load_artifact(directory, manifest, index_params):
+    vocabulary_store = StringStore.load(directory, "vocabulary")
+    #Slice every term out of one bytes copy of the blob, which is much faster than decoding the terms one by one from the memory map
+    terms = vocabulary_store.blob.tobytes()
+    offsets = vocabulary_store.offsets.tolist()
+    vocabulary = {terms[offsets[i]:offsets[i + 1]].decode('utf-8'): i for i in range(len(offsets) - 1)}
+    vectorizer = TfidfVectorizer(vocabulary=vocabulary, **manifest["vectorizer_params"])
+    vectorizer.idf_ = np.load(os.path.join(directory, "idf.npy"))
+    texts = StringStore.load(directory, "texts")
+    index_params = dict(index_params)
+    if index_params.pop("shards", 1) > 1:
+        retriever = ShardedRetriever.load(directory, RETRIEVERS[manifest["backend"]], vectorizer, texts, **index_params)
+    else:
+        retriever = RETRIEVERS[manifest["backend"]].load(directory, vectorizer, texts, **index_params)
+    retriever.specs = SpecIndex.load(directory)
+    retriever.records = RecordStore.load(directory)
+    retriever.catalog = Catalog.load(directory, vectorizer.idf_)
+    replay_journal(retriever, directory)
+    return retriever
+
+#Function to read the manifest of an artifact, gives back None if there is no artifact yet
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, "manifest.json")) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+#Retrievers already loaded in this process, so the CRS modules imported by one server share a single copy of the index
+loaded_retrievers = {}
+
+#Function to write the manifest of an artifact after its catalog was updated in place
+def write_manifest(directory, manifest):
+    with open(os.path.join(directory, "manifest.json"), 'w') as file:
+        json.dump(manifest, file, indent=4)
+
+#Function to load the retriever from the artifact when it still matches the CSV and the settings, otherwise rebuild and save it
+#When only the CSV changed, the added, changed and removed laptops are applied to the stored index, it is only refitted once the IDF drift is past refit_threshold
+#workers only changes how fast the artifact is built, not what is in it
+def load_or_build_retriever(csv_path='metadata_cleaned.csv', backend="sparse", artifact_dir="retrieval_artifact", vectorizer_params=None, index_params=None, refit_threshold=REFIT_DRIFT_THRESHOLD, workers=None):
+    vectorizer_params = vectorizer_params or {}
+    #One shard is the plain index, so it keeps the fingerprint of the artifacts built without shards
+    index_params = {key: value for key, value in (index_params or {}).items() if not (key == "shards" and value == 1)}
+    start = time.perf_counter()
+    manifest = read_manifest(artifact_dir)
+    stat = os.stat(csv_path)
+    #Skip hashing the CSV when its size and modification time are the same as when the artifact was built
+    if manifest and manifest.get("csv_size") == stat.st_size and manifest.get("csv_mtime_ns") == stat.st_mtime_ns:
+        csv_hash = manifest["csv_sha256"]
+    else:
+        csv_hash = hash_file(csv_path)
+    fingerprint = artifact_fingerprint(csv_hash, backend, vectorizer_params, index_params)
+    #Fingerprint of the settings alone, an artifact built with the same settings can be updated to a new version of the CSV
+    settings_fingerprint = artifact_fingerprint("", backend, vectorizer_params, index_params)
+    key = (os.path.abspath(artifact_dir), fingerprint, json.dumps(index_params, sort_keys=True))
+    if key in loaded_retrievers:
+        return loaded_retrievers[key]
+    if manifest and manifest.get("fingerprint") == fingerprint:
+        retriever = load_artifact(artifact_dir, manifest, index_params)
+        #The CSV was only touched, remember its new size and modification time so the next start skips hashing again
+        if manifest.get("csv_mtime_ns") != stat.st_mtime_ns or manifest.get("csv_size") != stat.st_size:
+            manifest.update(csv_size=stat.st_size, csv_mtime_ns=stat.st_mtime_ns)
+            write_manifest(artifact_dir, manifest)
+        print(f"Loaded retrieval artifact in {time.perf_counter() - start:.2f}s")
+        loaded_retrievers[key] = retriever
+        return retriever
+    texts = specs = None
+    if manifest and manifest.get("settings_fingerprint") == settings_fingerprint:
+        #Only the catalog changed: apply the added, changed and removed laptops to the stored index instead of rebuilding it
+        retriever = load_artifact(artifact_dir, manifest, index_params)
+        texts, records = load_metadata_records(csv_path)
+        changes = sync_catalog(retriever, texts, records)
+        if not needs_refit(retriever.catalog, refit_threshold):
+            manifest.update(fingerprint=fingerprint, csv_sha256=csv_hash, csv_size=stat.st_size, csv_mtime_ns=stat.st_mtime_ns, n_docs=len(retriever.catalog.rows))
+            #Merge the updates into the artifact once the journal is long, so loading does not replay too many of them
+            if retriever.catalog.journal_length >= COMPACT_AFTER_UPDATES:
+                save_artifact(retriever, artifact_dir, manifest)
+            else:
+                write_manifest(artifact_dir, manifest)
+            print(f"Updated retrieval artifact in {time.perf_counter() - start:.2f}s: {changes['added']} laptops added, {changes['changed']} changed, "
+                  f"{changes['removed']} removed (IDF drift {changes['idf_drift']:.3f}, new words {changes['oov_share']:.3f})")
+            loaded_retrievers[key] = retriever
+            return retriever
+        print(f"IDF drift {changes['idf_drift']:.3f} / new words {changes['oov_share']:.3f} past the refit threshold {refit_threshold}, rebuilding the retrieval artifact...")
+    elif manifest:
+        print("Catalog or retrieval settings changed, rebuilding the retrieval artifact...")
+    if texts is None:
+        #The spec index is built chunk by chunk while the CSV is ingested
+        with stage("csv_load"):
+            texts, records, specs = ingest_metadata(csv_path)
+    #The texts are already one blob instead of a list of Python strings, the parsed records are what retrieval gives back to the CRS
+    retriever = build_retriever(texts, backend=backend, vectorizer_params=vectorizer_params, index_params=index_params, workers=workers)
+    retriever.records = records
+    retriever.catalog = Catalog.build(records.titles, texts, retriever.drift)
+    #Columnar index of the specifications read out of every laptop text, used to pre-filter the search with the users hard constraints
+    if specs is None:
+        with stage("spec_index"):
+            specs = SpecIndex.from_texts(retriever.texts)
+    retriever.specs = specs
+    save_artifact(retriever, artifact_dir, {
+        "fingerprint": fingerprint,
+        "settings_fingerprint": settings_fingerprint,
+        "format": ARTIFACT_FORMAT_VERSION,
+        "backend": backend,
+        "vectorizer_params": vectorizer_params,
+        "index_params": index_params,
+        "csv_sha256": csv_hash,
+        "csv_size": stat.st_size,
+        "csv_mtime_ns": stat.st_mtime_ns,
+        "n_docs": len(retriever.texts),
+    })
+    loaded_retrievers[key] = retriever
+    return retriever
@@ -0,0 +1,127 @@
+from collections import OrderedDict
+import math
+import re
+import threading
+from spec_index import PREFERENCE_ALIASES, parse_number, parse_capacity
+from instrumentation import count_cache_lookup
+
+#Cache of retrieval results keyed by the preferences of the user instead of the query text
+#Most conversations end on a few hundred preference combinations (gaming + 16GB + Nvidia + a budget band), so the same search is run again and again
+#The preferences are brought into one canonical form first and the search always runs with that form, so every preferences dict with the same key gets the same laptops
+#The cache keeps the (laptop id, score) lists of the Top-k, and is emptied when the catalog of the index changes
+
+#Budgets are rounded down to a multiple of this many dollars, so budgets of $1000 and $1050 share one entry
+#The search runs with the canonical budget, and rounding down only ever makes the hard-constraint filter stricter, so no cached laptop costs more than the budget of the user
+PRICE_BUCKET = 100
+#Most preference combinations kept, the least recently used ones are dropped past it
+MAX_CACHE_ENTRIES = 2048
+SPACES = re.compile(r"\s+")
+
+#Function to bring one preference value into its canonical form, gives back None for values that say nothing
+def canonical_value(key, value):
+    if value is None or not str(value).strip():
+        return None
+    if key == "price" and parse_number(value):
+        #A budget under one bucket is kept as it is, rounding it down to $0 would filter out every laptop
+        budget = math.floor(parse_number(value) / PRICE_BUCKET) * PRICE_BUCKET or parse_number(value)
+        return f"${budget:g}"
+    if key == "ram" and parse_number(value):
+        return f"{parse_number(value):g}gb"
+    if key == "storage_capacity" and parse_capacity(value):
+        return f"{parse_capacity(value):g}gb"
+    if key == "screen_size" and parse_number(value):
+        return f"{parse_number(value):g} inch"
+    return SPACES.sub(" ", str(value).strip().lower())
+
+#Function to bring the preferences into their canonical form: the aliases of a spec mapped to one name, units written one way, budgets bucketed and the keys sorted
+def canonical_preferences(preferences):
+    canonical = {}
+    for key, value in (preferences or {}).items():
+        key = str(key).lower().replace(" ", "_")
+        key = PREFERENCE_ALIASES.get(key, key)
+        value = canonical_value(key, value)
+        if value is not None:
+            canonical.setdefault(key, value)
+    return dict(sorted(canonical.items()))
+
+#LRU of the Top-k (laptop id, score) lists of the canonical preferences of the retriever, emptied when the version of its catalog changes
+class RetrievalCache:
+    def __init__(self, retriever, max_entries=MAX_CACHE_ENTRIES):
+        self.retriever = retriever
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.version = self.index_version()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    #Version of the index, every added, changed or removed laptop raises it
+    def index_version(self):
+        return self.retriever.catalog.version if self.retriever.catalog is not None else 0
+
+    #Function to look the Top-k of a key up, gives back None on a miss, all entries are dropped first when the index changed since they were stored
+    def get(self, key):
+        with self.lock:
+            version = self.index_version()
+            if version != self.version:
+                self.counters["invalidations"] += bool(self.entries)
+                self.entries.clear()
+                self.version = version
+            ids = self.entries.get(key)
+            if ids is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return ids
+
+    def put(self, key, ids):
+        with self.lock:
+            if self.index_version() != self.version:
+                return
+            self.entries[key] = ids
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    #Function to retrieve the (record, score) tuples of the Top-k laptops for the preferences, only a miss builds the query and searches the index
+    #make_query turns the canonical preferences into the query text, and candidate_ids into the laptops the search is restricted to
+    def retrieve(self, preferences, k, make_query, candidate_ids):
+        preferences = canonical_preferences(preferences)
+        key = (tuple(preferences.items()), k)
+        ids = self.get(key)
+        count_cache_lookup(ids is not None, "retrieval")
+        if ids is None:
+            ids = self.retriever.search_ids([make_query(preferences)], k, candidate_ids(preferences))[0]
+            self.put(key, ids)
+        return [(self.retriever.records[i], score) for i, score in ids]
+
+    #Function to retrieve the Top-k of many preferences at once, for bulk jobs
+    #Repeated preferences are only searched once, and the ones with the same hard constraints (so the same candidate laptops) are searched in one batched search
+    def retrieve_batch(self, preferences_list, k, make_query, candidate_ids):
+        canonical = [canonical_preferences(preferences) for preferences in preferences_list]
+        keys = [(tuple(preferences.items()), k) for preferences in canonical]
+        found = {key: self.get(key) for key in dict.fromkeys(keys)}
+        groups = {}
+        for key, preferences in zip(keys, canonical):
+            if found[key] is None:
+                groups.setdefault(repr(self.retriever.specs.constraints(preferences)), {})[key] = preferences
+        for group in groups.values():
+            queries = [make_query(preferences) for preferences in group.values()]
+            for key, ids in zip(group, self.retriever.search_ids(queries, k, candidate_ids(next(iter(group.values()))))):
+                self.put(key, ids)
+                found[key] = ids
+        return [[(self.retriever.records[i], score) for i, score in found[key]] for key in keys]
+
+    #Hit/miss counters and the hit rate of the cache
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self.entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
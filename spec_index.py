@@ -0,0 +1,299 @@
+import numpy as np
+import csv
+import hashlib
+import json
+import os
+import re
+
+#Prices in laptops.csv are in Indian Rupees while the users give their budget in dollars
+INR_PER_USD = 83.0
+#Structured catalog the prices of the Amazon laptops are looked up in by their model title, when their text holds no price
+PRICE_CATALOG = 'laptops.csv'
+#How far the display size of a laptop may be from the requested screen size (in inches)
+SCREEN_SIZE_TOLERANCE = 0.5
+
+NUMERIC_COLUMNS = ["price", "ram_memory", "primary_storage_capacity", "display_size"]
+CATEGORICAL_COLUMNS = ["brand", "processor_brand", "processor_tier", "primary_storage_type", "gpu_brand", "os"]
+
+#Different names the preference extractors use for the same specification
+PREFERENCE_ALIASES = {
+    "budget": "price",
+    "storage": "storage_capacity",
+    "gpu": "gpu_brand",
+    "graphics": "gpu_brand",
+    "graphics_card": "gpu_brand",
+    "operating_system": "os",
+    "display_size": "screen_size",
+}
+GPU_BRANDS = {"nvidia": "nvidia", "rtx": "nvidia", "gtx": "nvidia", "geforce": "nvidia", "amd": "amd", "radeon": "amd", "vega": "amd", "intel": "intel", "apple": "apple"}
+OS_NAMES = {"windows": "windows", "macos": "mac", "mac": "mac", "chromeos": "chrome", "chrome": "chrome", "linux": "ubuntu", "ubuntu": "ubuntu"}
+BRANDS = ["dell", "lenovo", "hp", "asus", "acer", "apple", "microsoft", "samsung", "msi", "lg", "razer", "huawei", "gigabyte", "fujitsu", "infinix", "honor", "realme"]
+
+#Regular expressions to read the specifications of the Amazon laptops out of their combined text
+TEXT_PATTERNS = {
+    "ram_memory": re.compile(r"(\d{1,3})\s*gb\s*(?:of\s*)?(?:ddr\d\w*\s*|lpddr\d\w*\s*)?(?:ram|memory)\b"),
+    "primary_storage_capacity": re.compile(r"(\d{1,4}(?:\.\d+)?)\s*(gb|tb)\s*(?:pcie\s*|nvme\s*|m\.2\s*)*(ssd|hdd|emmc|hard drive|storage)\b"),
+    "display_size": re.compile(r"\b(1[0-8](?:\.\d)?)\s*(?:\"|”|''|-?\s*inch|in\b)"),
+    "processor_tier": re.compile(r"\b(?:core\s*)?(i[3579])[-\s]|\bryzen\s*([3579])\b|\b(m[123])\b"),
+    #A price written in the text, in dollars ($1,299.99) or in rupees (₹23,990 or rs. 23990)
+    "price": re.compile(r"(\$|₹|\brs\.?|\binr)\s?((?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?)"),
+}
+#Prices of the laptops of the structured catalog by model title, read on first use
+model_prices = None
+
+#Function to read a number out of a preference value such as "16gb", "$1,200" or "15.6 inch", gives back None if there is no number
+def parse_number(value):
+    match = re.search(r"\d+(?:[.,]\d+)*", str(value))
+    if not match:
+        return None
+    number = match.group().replace(",", "")
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+#Function to read a storage capacity in GB out of a preference value such as "512gb" or "1tb"
+def parse_capacity(value):
+    number = parse_number(value)
+    if number is None:
+        return None
+    return number * 1024 if "tb" in str(value).lower() else number
+
+#Function to get the key a laptop is looked up by in the price table: its title up to the closing bracket of the spec summary, like
+#"dell inspiron 3520 laptop (11th gen core i3/ 8gb/ 512gb ssd/ win11" for both the laptops.csv model and the Amazon title with its " v1" suffix
+def title_key(text):
+    return " ".join(text.lower().split(")", 1)[0].split())
+
+#Function to read the dollar price of every model of the structured catalog, gives back {} when there is no catalog
+def load_model_prices(csv_path=PRICE_CATALOG):
+    global model_prices
+    if model_prices is None:
+        prices = {}
+        if os.path.exists(csv_path):
+            with open(csv_path, newline='', encoding='utf-8') as file:
+                for row in csv.DictReader(file):
+                    if row.get("Model") and parse_number(row.get("Price")):
+                        prices[title_key(row["Model"])] = parse_number(row["Price"]) / INR_PER_USD
+        model_prices = prices
+    return model_prices
+
+#Function to get a digest of the price table, so an index built with other prices is not reused
+def prices_digest():
+    return hashlib.sha256(json.dumps(sorted(load_model_prices().items())).encode('utf-8')).hexdigest()
+
+#Function to read the dollar price of a laptop out of its text, else from the price table by its title, gives back NaN when neither has one
+def text_price(text, prices):
+    match = TEXT_PATTERNS["price"].search(text)
+    if match:
+        amount = float(match.group(2).replace(",", ""))
+        return amount if match.group(1) == "$" else amount / INR_PER_USD
+    return prices.get(title_key(text), np.nan)
+
+#Function to map a processor preference like "I5", "Ryzen" or "M1" to the column and value it filters on
+def processor_filter(value):
+    value = str(value).lower()
+    tier = re.search(r"\b(i[3579])\b", value)
+    if tier:
+        return "processor_tier", "core " + tier.group(1)
+    tier = re.search(r"ryzen\s*([3579])", value)
+    if tier:
+        return "processor_tier", "ryzen " + tier.group(1)
+    tier = re.search(r"\b(m[123])\b", value)
+    if tier:
+        return "processor_tier", tier.group(1)
+    for brand in ["intel", "amd", "apple"]:
+        if brand in value or (brand == "amd" and "ryzen" in value):
+            return "processor_brand", brand
+    return None, None
+
+#Columnar index of the structured laptop specifications: numpy arrays for the numeric ranges and one bitmap per value of every categorical field
+#Unknown values (NaN, or "" for categories) always pass the filters, so laptops are only excluded when they are known to break a constraint
+class SpecIndex:
+    def __init__(self, numeric, codes, categories):
+        self.numeric = numeric
+        self.codes = codes
+        self.categories = categories
+        self.size = len(next(iter(numeric.values())))
+        self.bitmaps = {}
+
+    #Function to build the index from columns of values, categorical values are dictionary encoded
+    @classmethod
+    def from_columns(cls, numeric_columns, categorical_columns):
+        numeric = {name: np.asarray(values, dtype=np.float32) for name, values in numeric_columns.items()}
+        codes, categories = {}, {}
+        for name, values in categorical_columns.items():
+            uniques, inverse = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+            categories[name] = uniques.tolist()
+            codes[name] = inverse.astype(np.uint16)
+        return cls(numeric, codes, categories)
+
+    #Function to build the index from the clean columns of laptops.csv
+    @classmethod
+    def from_laptops_csv(cls, csv_path='laptops.csv'):
+        #pandas is only needed for laptops.csv, the artifact loads its spec index without it
+        import pandas as pd
+        laptops = pd.read_csv(csv_path)
+        numeric = {
+            "price": laptops["Price"] / INR_PER_USD,
+            "ram_memory": laptops["ram_memory"],
+            "primary_storage_capacity": laptops["primary_storage_capacity"],
+            "display_size": laptops["display_size"],
+        }
+        categorical = {
+            "brand": laptops["brand"].str.lower(),
+            "processor_brand": laptops["processor_brand"].str.lower(),
+            "processor_tier": laptops["processor_tier"].str.lower(),
+            "primary_storage_type": laptops["primary_storage_type"].str.lower(),
+            "gpu_brand": laptops["gpu_brand"].str.lower(),
+            "os": laptops["OS"].str.lower(),
+        }
+        return cls.from_columns(numeric, categorical)
+
+    #Function to build the index by reading the specifications out of the combined text of every laptop (used for the Amazon metadata, which has no spec columns)
+    #The Amazon texts rarely state a price, so it is looked up in prices (the laptops.csv prices by default) by the model title
+    @classmethod
+    def from_texts(cls, texts, prices=None):
+        prices = load_model_prices() if prices is None else prices
+        numeric = {name: np.full(len(texts), np.nan, dtype=np.float32) for name in NUMERIC_COLUMNS}
+        categorical = {name: [""] * len(texts) for name in CATEGORICAL_COLUMNS}
+        for i, text in enumerate(texts):
+            text = text.lower()
+            numeric["price"][i] = text_price(text, prices)
+            title_words = text.split(" ", 3)[:3]
+            categorical["brand"][i] = next((brand for brand in BRANDS if brand in title_words), "")
+            match = TEXT_PATTERNS["ram_memory"].search(text)
+            if match:
+                numeric["ram_memory"][i] = float(match.group(1))
+            match = TEXT_PATTERNS["primary_storage_capacity"].search(text)
+            if match:
+                numeric["primary_storage_capacity"][i] = float(match.group(1)) * (1024 if match.group(2) == "tb" else 1)
+                categorical["primary_storage_type"][i] = "hdd" if match.group(3) in ("hdd", "hard drive") else "ssd" if match.group(3) == "ssd" else ""
+            match = TEXT_PATTERNS["display_size"].search(text)
+            if match:
+                numeric["display_size"][i] = float(match.group(1))
+            match = TEXT_PATTERNS["processor_tier"].search(text)
+            if match:
+                i_tier, ryzen_tier, m_tier = match.groups()
+                categorical["processor_tier"][i] = f"core {i_tier}" if i_tier else f"ryzen {ryzen_tier}" if ryzen_tier else m_tier
+            categorical["processor_brand"][i] = "intel" if "intel" in text else "amd" if "ryzen" in text or "amd" in text else "apple" if "apple m" in text else ""
+            categorical["gpu_brand"][i] = "nvidia" if re.search(r"nvidia|geforce|\brtx\b|\bgtx\b", text) else "amd" if "radeon" in text else ""
+            categorical["os"][i] = "windows" if re.search(r"windows|\bwin ?1[01]\b", text) else "chrome" if "chromebook" in text or "chrome os" in text else "mac" if "macos" in text or "macbook" in text else ""
+        return cls.from_columns(numeric, categorical)
+
+    #Function to add the laptops of the texts after the last row, new categorical values get new codes so the existing codes stay valid
+    def extend(self, texts, prices=None):
+        other = SpecIndex.from_texts(texts, prices)
+        self.numeric = {name: np.concatenate([values, other.numeric[name]]) for name, values in self.numeric.items()}
+        for name, codes in self.codes.items():
+            categories = self.categories[name]
+            for category in other.categories[name]:
+                if category not in categories:
+                    categories.append(category)
+            remap = np.array([categories.index(category) for category in other.categories[name]], dtype=np.uint16)
+            self.codes[name] = np.concatenate([codes, remap[other.codes[name]]])
+        self.size += other.size
+        self.bitmaps = {}
+
+    #Bitmap of the rows where a categorical column has the given value (or is unknown)
+    def bitmap(self, column, value):
+        key = (column, value)
+        if key not in self.bitmaps:
+            codes, categories = self.codes[column], self.categories[column]
+            bitmap = np.zeros(self.size, dtype=bool)
+            for category in ("", value):
+                if category in categories:
+                    bitmap |= codes == categories.index(category)
+            self.bitmaps[key] = bitmap
+        return self.bitmaps[key]
+
+    #Function to check a numeric column against a range in one vectorized pass, unknown values pass
+    def range_mask(self, column, low=None, high=None):
+        values = self.numeric[column]
+        mask = np.isnan(values)
+        passes = np.ones(self.size, dtype=bool)
+        if low is not None:
+            passes &= values >= low
+        if high is not None:
+            passes &= values <= high
+        return mask | passes
+
+    #Function to turn the preferences dict into the hard constraints it implies, as (column, kind, argument) tuples
+    def constraints(self, preferences):
+        constraints = []
+        for key, value in (preferences or {}).items():
+            key = PREFERENCE_ALIASES.get(str(key).lower().replace(" ", "_"), str(key).lower().replace(" ", "_"))
+            if not value:
+                continue
+            text = str(value).lower()
+            if key == "price" and parse_number(value) is not None:
+                constraints.append(("price", "range", (None, parse_number(value))))
+            elif key == "ram" and parse_number(value) is not None:
+                constraints.append(("ram_memory", "range", (parse_number(value), None)))
+            elif key == "storage_capacity" and parse_capacity(value) is not None:
+                constraints.append(("primary_storage_capacity", "range", (parse_capacity(value), None)))
+            elif key == "screen_size" and parse_number(value) is not None:
+                size = parse_number(value)
+                constraints.append(("display_size", "range", (size - SCREEN_SIZE_TOLERANCE, size + SCREEN_SIZE_TOLERANCE)))
+            elif key == "storage_type" and text in ("ssd", "hdd"):
+                constraints.append(("primary_storage_type", "equals", text))
+            elif key == "brand" and text in BRANDS:
+                constraints.append(("brand", "equals", text))
+            elif key == "gpu_brand" and text in GPU_BRANDS:
+                constraints.append(("gpu_brand", "equals", GPU_BRANDS[text]))
+            elif key == "os" and text in OS_NAMES:
+                constraints.append(("os", "equals", OS_NAMES[text]))
+            elif key == "processor":
+                column, processor = processor_filter(value)
+                if column:
+                    constraints.append((column, "equals", processor))
+        return constraints
+
+    #Function to turn the preferences dict into a boolean mask over the laptops, gives back None when the preferences hold no hard constraint
+    def mask(self, preferences):
+        constraints = self.constraints(preferences)
+        if not constraints:
+            return None
+        mask = np.ones(self.size, dtype=bool)
+        for column, kind, argument in constraints:
+            if kind == "range":
+                mask &= self.range_mask(column, *argument)
+            else:
+                mask &= self.bitmap(column, argument)
+        return mask
+
+    #Function to count, for every laptop, the hard constraints of the preferences it is known to meet and the ones it is known to break (unknown values count as neither)
+    def constraint_matches(self, preferences):
+        met = np.zeros(self.size, dtype=np.int32)
+        broken = np.zeros(self.size, dtype=np.int32)
+        for column, kind, argument in self.constraints(preferences):
+            if kind == "range":
+                known = ~np.isnan(self.numeric[column])
+                passes = self.range_mask(column, *argument)
+            else:
+                categories = self.categories[column]
+                known = np.asarray(self.codes[column]) != categories.index("") if "" in categories else np.ones(self.size, dtype=bool)
+                passes = self.bitmap(column, argument)
+            met += known & passes
+            broken += known & ~passes
+        return met, broken
+
+    #Function to get the ids of the laptops that meet every hard constraint of the preferences, None when there is nothing to filter on
+    def candidate_ids(self, preferences):
+        mask = self.mask(preferences)
+        return None if mask is None else np.flatnonzero(mask)
+
+    def save(self, directory):
+        for name, values in self.numeric.items():
+            np.save(os.path.join(directory, f"spec_{name}.npy"), values)
+        for name, codes in self.codes.items():
+            np.save(os.path.join(directory, f"spec_{name}.npy"), codes)
+        with open(os.path.join(directory, "spec_categories.json"), 'w') as file:
+            json.dump(self.categories, file)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "spec_categories.json")) as file:
+            categories = json.load(file)
+        numeric = {name: np.load(os.path.join(directory, f"spec_{name}.npy"), mmap_mode='r') for name in NUMERIC_COLUMNS}
+        codes = {name: np.load(os.path.join(directory, f"spec_{name}.npy"), mmap_mode='r') for name in categories}
+        return cls(numeric, codes, categories)
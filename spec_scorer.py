@@ -0,0 +1,83 @@
+import pandas as pd
+import numpy as np
+from spec_index import SpecIndex
+
+#Local ranking of the laptops of laptops.csv for the Fine-Tuned GPT-4o CRS: every laptop gets a weighted match score against the preferences in one vectorized pass
+#The hard constraints are read from the preferences with SpecIndex.constraints, so the scorer understands the same budgets, RAM sizes, brands, ... as the pre-filter
+#Unlike the pre-filter nothing is excluded: a laptop over the budget or with less RAM than asked only scores lower, so there is always a Top-N to recommend
+
+#Weight of every specification in the match score
+SCORE_WEIGHTS = {
+    "price": 3.0,
+    "ram_memory": 2.0,
+    "primary_storage_capacity": 1.5,
+    "display_size": 1.0,
+    "brand": 2.0,
+    "processor_tier": 1.5,
+    "processor_brand": 1.0,
+    "gpu_brand": 1.5,
+    "primary_storage_type": 1.0,
+    "os": 1.0,
+}
+#Score lost per share of the budget a laptop is over it, and under it (a much cheaper laptop is likely a weaker one)
+OVER_BUDGET_PENALTY = 2.0
+UNDER_BUDGET_PENALTY = 0.5
+#Difference in inches at which the display size no longer scores
+SCREEN_SIZE_RANGE = 2.0
+
+#Match scores of the laptops of laptops.csv against the preferences of the user, ranked with the ratings of the laptops as the tie-breaker
+class SpecScorer:
+    def __init__(self, specs, titles, ratings):
+        self.specs = specs
+        self.titles = titles
+        self.ratings = np.asarray(ratings, dtype=np.float32)
+
+    @classmethod
+    def from_laptops_csv(cls, csv_path='laptops.csv'):
+        laptops = pd.read_csv(csv_path)
+        return cls(SpecIndex.from_laptops_csv(csv_path), laptops["Model"].tolist(), laptops["Rating"].fillna(0))
+
+    #Function to score how well every laptop matches one hard constraint, between 0 and 1, unknown values score 0
+    def match(self, column, kind, argument):
+        if kind == "equals":
+            categories = self.specs.categories[column]
+            if argument not in categories:
+                return np.zeros(self.specs.size, dtype=np.float32)
+            return (np.asarray(self.specs.codes[column]) == categories.index(argument)).astype(np.float32)
+        values = np.asarray(self.specs.numeric[column], dtype=np.float32)
+        low, high = argument
+        if column == "price":
+            #Price distance to the budget, relative to the budget
+            distance = (values - high) / high
+            score = 1 - np.where(distance > 0, distance * OVER_BUDGET_PENALTY, -distance * UNDER_BUDGET_PENALTY)
+        elif column == "display_size":
+            score = 1 - np.abs(values - (low + high) / 2) / SCREEN_SIZE_RANGE
+        else:
+            #RAM and storage score fully from the requested size up, and by the share of it below
+            score = values / low if low else np.ones_like(values)
+        return np.nan_to_num(np.clip(score, 0, 1), nan=0.0)
+
+    #Function to compute the match score of every laptop, the weighted mean of its constraint matches (all 0 when the preferences hold no constraint)
+    def scores(self, preferences):
+        total = np.zeros(self.specs.size, dtype=np.float32)
+        weights = 0.0
+        for column, kind, argument in self.specs.constraints(preferences):
+            if column not in SCORE_WEIGHTS or (column == "price" and not argument[1]):
+                continue
+            total += SCORE_WEIGHTS[column] * self.match(column, kind, argument)
+            weights += SCORE_WEIGHTS[column]
+        return total / weights if weights else total
+
+    #Function to rank the laptops for the preferences, gives back the (row, score) of the Top-N with the best rated first among equal scores
+    def top_n(self, preferences, n=5):
+        scores = self.scores(preferences)
+        order = np.lexsort((-self.ratings, -scores))[:n]
+        return [(int(row), float(scores[row])) for row in order]
+
+    #Function to describe the specifications of a laptop, in words SpecIndex.from_texts can read back
+    def describe(self, row):
+        numeric = {name: values[row] for name, values in self.specs.numeric.items()}
+        category = {name: self.specs.categories[name][self.specs.codes[name][row]] for name in self.specs.codes}
+        parts = [f"${numeric['price']:.0f}", f"{numeric['ram_memory']:.0f}GB RAM", f"{numeric['primary_storage_capacity']:.0f}GB {category['primary_storage_type'].upper()}",
+                 f"{category['processor_tier']} processor", f"{category['gpu_brand']} GPU", f"{numeric['display_size']:.1f} inch display", f"{category['os']} OS"]
+        return ", ".join(parts)
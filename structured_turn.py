@@ -0,0 +1,74 @@
+import json
+from instrumentation import timed
+
+#One request per conversation turn: the Fine-Tuned GPT-4o model gives back the merged preferences, the next question and the spec it asks about as JSON checked against TURN_SCHEMA
+#The CRS works out the missing specs itself from KEY_SPECS, so the question is only used when the conversation goes on, and the spec it asks about is marked as asked
+
+#Key specs to keep track of, in the order they are asked for
+KEY_SPECS = [
+    "brand", "ram", "processor", "gpu_brand", "storage_capacity", "storage_type",
+    "price", "screen_size", "battery_life", "weight", "os", "audio",
+    "keyboard_features", "material", "webcam_quality", "connectivity", "purpose"
+]
+
+#JSON schema of the turn response, strict structured outputs need every property to be required, so unknown specs are null
+TURN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "preferences": {
+            "type": "object",
+            "properties": {spec: {"type": ["string", "null"]} for spec in KEY_SPECS},
+            "required": KEY_SPECS,
+            "additionalProperties": False,
+        },
+        "next_question": {"type": ["string", "null"]},
+        "asked_spec": {"type": ["string", "null"], "enum": KEY_SPECS + [None]},
+    },
+    "required": ["preferences", "next_question", "asked_spec"],
+    "additionalProperties": False,
+}
+RESPONSE_FORMAT = {"type": "json_schema", "json_schema": {"name": "laptop_turn", "strict": True, "schema": TURN_SCHEMA}}
+
+#Function to find the key specs that are still missing, in the order they are asked for
+def missing_specs(preferences, already_asked=()):
+    return [spec for spec in KEY_SPECS if not preferences.get(spec) and spec not in already_asked]
+
+#Function to build the messages of the turn request
+def turn_messages(user_input, existing_preferences, already_asked=()):
+    prompt = f"""
+    User has provided the following laptop specifications so far: {json.dumps(existing_preferences)}.
+    The latest input is: "{user_input}".
+    Extract specifications such as brand, budget, RAM, processor, storage, graphics card, and purpose from the latest input and merge them with the existing specs into "preferences".
+    Recognize inputs like "gaming laptop" or "for gaming" as the purpose being "gaming." Use null for specs the user has not given.
+    In "next_question", write a natural-sounding question about the first of these specs that is still null after merging: {[spec for spec in KEY_SPECS if spec not in already_asked]}.
+    In "asked_spec", give the spec the question is about, or null when there is no question.
+    """
+    return [
+        {"role": "system", "content": "You are a knowledgeable assistant extracting laptop specifications from user input and asking for the next missing one."},
+        {"role": "user", "content": prompt},
+    ]
+
+#Function to validate the turn response against TURN_SCHEMA, gives back the merged preferences, the question and the spec it asks about
+#A response that does not validate keeps the existing preferences and gives back no question, so the CRS falls back to query_missing_specs
+#A question without the spec it asks about is dropped the same way, since the CRS could not tell which spec has been asked
+#So is a question about a spec that the merged preferences already hold or that has already been asked
+@timed("parse_turn")
+def parse_turn(content, existing_preferences, already_asked=()):
+    try:
+        turn = json.loads(content)
+        extracted, question, asked_spec = turn["preferences"], turn["next_question"], turn["asked_spec"]
+        if not isinstance(extracted, dict) or not (question is None or isinstance(question, str)):
+            raise ValueError("preferences must be an object and next_question a string or null")
+        if set(extracted) - set(KEY_SPECS) or not all(value is None or isinstance(value, str) for value in extracted.values()):
+            raise ValueError("preferences must only hold the key specs as strings or null")
+        if asked_spec is not None and asked_spec not in KEY_SPECS:
+            raise ValueError("asked_spec must be a key spec or null")
+    except (ValueError, KeyError, TypeError) as e:
+        print("Error parsing response:", e)
+        return existing_preferences, None, None
+    preferences = dict(existing_preferences)
+    preferences.update({spec: value for spec, value in extracted.items() if value})
+    question = (question or "").strip() or None
+    if question is None or asked_spec is None or preferences.get(asked_spec) or asked_spec in already_asked:
+        return preferences, None, None
+    return preferences, question, asked_spec
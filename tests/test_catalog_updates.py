@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+import retrieval
+from catalog_updates import JOURNAL_NAME, DriftTracker, needs_refit, product_id, remove_laptop, sync_catalog, upsert_laptop
+from retrieval import load_artifact, load_metadata_records, load_or_build_retriever, read_manifest
+
+LAPTOPS = [
+    ("Dell Inspiron 3520 Laptop (12th Gen Core i5/ 16GB/ 512GB SSD/ Win11)", ["Full HD display for everyday work"], ["intel core i5", "15.6 inch display"]),
+    ("Asus ROG Strix G16 Gaming Laptop (13th Gen Core i9/ 32GB/ 1TB SSD/ Win11)", ["Gaming laptop with RGB keyboard"], ["nvidia rtx 4070", "16 inch display"]),
+    ("HP 15s Laptop (12th Gen Core i3/ 8GB/ 512GB SSD/ Win11)", ["Thin and light laptop for students"], ["intel core i3", "15.6 inch display"]),
+    ("Lenovo IdeaPad Slim 3 Laptop (Ryzen 5/ 8GB/ 512GB SSD/ Win11)", ["Slim laptop with long battery life"], ["amd ryzen 5", "14 inch display"]),
+    ("Acer Aspire 5 Laptop (12th Gen Core i5/ 16GB/ 512GB SSD/ Win11)", ["Backlit keyboard and fingerprint reader"], ["intel core i5", "15.6 inch display"]),
+    ("MSI Thin GF63 Gaming Laptop (12th Gen Core i7/ 16GB/ 512GB SSD/ Win11)", ["Gaming laptop with a fast display"], ["nvidia rtx 3050", "15.6 inch display"]),
+]
+#The next version of the catalog: the HP laptop is removed, the Lenovo description changed and an Apple laptop added
+UPDATED = [laptop for laptop in LAPTOPS if not laptop[0].startswith("HP")]
+UPDATED[2] = (UPDATED[2][0], ["Slim laptop with a bright display and long battery life"], UPDATED[2][2])
+UPDATED.append(("Apple MacBook Air M2 Laptop (Apple M2/ 8GB/ 256GB SSD/ macOS)", ["Fanless laptop with a retina display"], ["apple m2 chip", "13.6 inch display"]))
+
+def write_catalog(path, laptops):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("title;description;features\n")
+        for title, descriptions, features in laptops:
+            file.write(f"{title};{descriptions!r};{features!r}\n")
+
+@pytest.fixture
+def catalog_dir(tmp_path, monkeypatch):
+    #No laptops.csv price table and no retriever shared with other tests
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(retrieval, "loaded_retrievers", {})
+    write_catalog(tmp_path / "metadata.csv", LAPTOPS)
+    load_or_build_retriever(str(tmp_path / "metadata.csv"), artifact_dir=str(tmp_path / "artifact"))
+    retrieval.loaded_retrievers.clear()
+    return tmp_path
+
+def load(directory):
+    return load_artifact(str(directory / "artifact"), read_manifest(str(directory / "artifact")), {})
+
+def live_titles(retriever):
+    return {retriever.records[row].title for row in retriever.catalog.rows.values()}
+
+def search_titles(retriever, query, k=10):
+    return [retriever.records[i].title for i, _ in retriever.search_ids([query], k)[0]]
+
+def test_sync_adds_changes_and_removes(catalog_dir):
+    retriever = load(catalog_dir)
+    write_catalog(catalog_dir / "metadata.csv", UPDATED)
+    texts, records = load_metadata_records(str(catalog_dir / "metadata.csv"))
+    changes = sync_catalog(retriever, texts, records)
+    assert (changes["added"], changes["changed"], changes["removed"]) == (1, 1, 1)
+    assert live_titles(retriever) == {title for title, _, _ in UPDATED}
+    assert len(retriever.catalog.live) == len(LAPTOPS) + 2
+    #The removed laptop and the old row of the changed one are left out of every search
+    results = search_titles(retriever, "laptop display")
+    assert not any(title.startswith("HP") for title in results)
+    assert results.count(UPDATED[2][0]) == 1
+    #The added laptop is only scored on the words the vectorizer was fitted on
+    assert UPDATED[-1][0] in results
+    #A second sync of the same catalog changes nothing
+    changes = sync_catalog(retriever, texts, records)
+    assert (changes["added"], changes["changed"], changes["removed"]) == (0, 0, 0)
+
+def test_journal_is_replayed_after_reload(catalog_dir):
+    retriever = load(catalog_dir)
+    laptop_id = upsert_laptop(retriever, *UPDATED[-1])
+    assert remove_laptop(retriever, product_id(LAPTOPS[0][0]))
+    assert not remove_laptop(retriever, product_id("Not In The Catalog"))
+    with open(catalog_dir / "artifact" / JOURNAL_NAME, encoding="utf-8") as file:
+        assert len(file.readlines()) == 2
+
+    reloaded = load(catalog_dir)
+    assert live_titles(reloaded) == live_titles(retriever)
+    assert reloaded.catalog.rows[laptop_id] == retriever.catalog.rows[laptop_id]
+    assert reloaded.catalog.journal_length == 2
+    assert LAPTOPS[0][0] not in search_titles(reloaded, "full hd everyday work")
+    #Replaying does not write the updates to the journal a second time
+    with open(catalog_dir / "artifact" / JOURNAL_NAME, encoding="utf-8") as file:
+        assert len(file.readlines()) == 2
+
+def test_updated_catalog_is_applied_in_place_below_the_drift_threshold(catalog_dir):
+    write_catalog(catalog_dir / "metadata.csv", UPDATED)
+    retriever = load_or_build_retriever(str(catalog_dir / "metadata.csv"), artifact_dir=str(catalog_dir / "artifact"), refit_threshold=1.0)
+    assert len(retriever.catalog.live) == len(LAPTOPS) + 2
+    assert (catalog_dir / "artifact" / JOURNAL_NAME).exists()
+    assert live_titles(retriever) == {title for title, _, _ in UPDATED}
+
+def test_updated_catalog_is_refitted_past_the_drift_threshold(catalog_dir):
+    write_catalog(catalog_dir / "metadata.csv", UPDATED)
+    retriever = load_or_build_retriever(str(catalog_dir / "metadata.csv"), artifact_dir=str(catalog_dir / "artifact"), refit_threshold=0.0)
+    #A refit builds the index from the new catalog alone, without removed rows or a journal
+    assert len(retriever.catalog.live) == len(UPDATED)
+    assert retriever.catalog.live.all()
+    assert not (catalog_dir / "artifact" / JOURNAL_NAME).exists()
+    assert "macbook" in retriever.vectorizer.vocabulary_
+
+def test_drift_grows_with_new_words():
+    drift = DriftTracker(np.ones(3), [2, 2, 2], 2, oov_words=0, words=6)
+    assert drift.drift() == {"idf_drift": pytest.approx(0.0, abs=1e-9), "oov_share": 0.0}
+    drift.oov_words, drift.words = 1, 10
+    catalog = type("Catalog", (), {"drift": drift})()
+    assert needs_refit(catalog, 0.05)
+    assert not needs_refit(catalog, 0.2)
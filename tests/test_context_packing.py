@@ -0,0 +1,34 @@
+from context_packing import estimate_tokens, pack_context, pack_record
+from record_store import Record
+
+RESULTS = [
+    (Record("Dell Inspiron 3520 Laptop (12th Gen Core i5/ 16GB/ 512GB SSD/ Win11) IN3520KTMFJS01ORS1", ["Full HD display for everyday work"], ["intel core i5", "16GB RAM"]), 0.9),
+    #Another listing of the same laptop, with a model code and a version suffix
+    (Record("Dell Inspiron 3520 Laptop (12th Gen Core i5/ 16GB/ 512GB SSD/ Win11) v2", ["Full HD display"], ["intel core i5"]), 0.8),
+    (Record("HP 15s Laptop (12th Gen Core i3/ 8GB/ 512GB SSD/ Win11)", ["Thin and light laptop for students"], ["intel core i3", "8GB RAM"]), 0.7),
+    (Record("Asus TUF Gaming F15 Laptop (12th Gen Core i7/ 16GB/ 1TB SSD/ Win11)", ["Gaming laptop"], ["nvidia rtx 3050"]), 0.6),
+]
+
+def test_duplicate_listings_are_dropped():
+    context, report = pack_context(RESULTS)
+    assert context.splitlines() == [pack_record(*record) for record, _ in (RESULTS[0], RESULTS[2], RESULTS[3])]
+    assert (report["laptops_retrieved"], report["laptops_kept"], report["duplicates_dropped"]) == (4, 3, 1)
+    assert report["context_tokens_after"] < report["context_tokens_before"]
+
+def test_long_descriptions_are_cut_at_a_word():
+    description = "A light laptop with a long battery life and a bright display " * 10
+    packed = pack_record("HP 15s Laptop", [description], ["intel core i3"], max_description_chars=40)
+    assert packed == "HP 15s Laptop | A light laptop with a long battery life... | Specifications: intel core i3"
+    assert pack_record("HP 15s Laptop", [], []) == "HP 15s Laptop"
+
+def test_packing_stops_at_the_token_budget():
+    first = estimate_tokens(pack_record(*RESULTS[0][0])) + 1
+    third = estimate_tokens(pack_record(*RESULTS[2][0])) + 1
+    context, report = pack_context(RESULTS, token_budget=first + third)
+    assert report["laptops_kept"] == 2 and report["context_tokens_after"] == first + third
+    context, report = pack_context(RESULTS, token_budget=first + third - 1)
+    assert report["laptops_kept"] == 1
+    #The closest match is kept even when it does not fit the budget alone
+    context, report = pack_context(RESULTS, token_budget=1)
+    assert context == pack_record(*RESULTS[0][0])
+    assert pack_context([]) == ("", {"laptops_retrieved": 0, "laptops_kept": 0, "duplicates_dropped": 0, "context_tokens_before": 0, "context_tokens_after": 0})
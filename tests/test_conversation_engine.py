@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import time
+from conversation_engine import Speculation, stream_completion
+from fake_llm import FakeAsyncOpenAIClient, fake_reply
+
+MESSAGES = [{"role": "system", "content": "You are a laptop recommendation assistant."},
+            {"role": "user", "content": "Recommend laptops for these preferences:\n\n\nDell Inspiron 15 (16GB RAM, 512GB SSD)\nHP Pavilion 14 (8GB RAM, 256GB SSD)\nLenovo IdeaPad 5 (16GB RAM, 1TB SSD)"}]
+
+#Client whose streams end without any content, like an empty completion
+class EmptyStreamCompletions:
+    async def create(self, model, messages, stream=False, **kwargs):
+        return self.stream()
+
+    async def stream(self):
+        await asyncio.sleep(0.02)
+        return
+        yield
+
+class EmptyStreamClient:
+    def __init__(self):
+        self.chat = type("Chat", (), {"completions": EmptyStreamCompletions()})()
+
+def test_stream_writes_chunks_in_order():
+    written = []
+    text, _ = asyncio.run(stream_completion(FakeAsyncOpenAIClient(), MESSAGES, written.append))
+    expected = fake_reply(MESSAGES[0]["content"], MESSAGES[-1]["content"])
+    assert len(written) > 2
+    assert "".join(written) == expected + "\n"
+    assert written[-1] == "\n"
+    assert text == expected.strip()
+
+def test_time_to_first_token():
+    client = FakeAsyncOpenAIClient(latency=0.05, chunk_delay=0.01)
+    start = time.perf_counter()
+    _, first_token = asyncio.run(stream_completion(client, MESSAGES, lambda text: None))
+    total = time.perf_counter() - start
+    #The first token comes after the latency of the request, well before the rest of the stream
+    assert 0.05 <= first_token < total - 0.05
+
+def test_empty_stream_counts_its_duration():
+    written = []
+    text, first_token = asyncio.run(stream_completion(EmptyStreamClient(), MESSAGES, written.append))
+    assert text == ""
+    assert written == ["\n"]
+    assert first_token >= 0.02
+
+def test_speculation_counters():
+    release = threading.Event()
+    speculation = Speculation()
+    #The first job holds the only worker, so the jobs after it are still pending when newer preferences arrive
+    speculation.start("first", release.wait)
+    speculation.start("second", str.upper, "second")
+    speculation.start("second", str.upper, "second")
+    speculation.start("third", str.upper, "third")
+    assert speculation.counters == {"started": 3, "cancelled": 1, "reused": 0, "missed": 0}
+    release.set()
+
+    async def finish():
+        return await speculation.result("third", str.upper, "third"), await speculation.result("fourth", str.upper, "fourth")
+
+    assert asyncio.run(finish()) == ("THIRD", "FOURTH")
+    speculation.close()
+    assert speculation.counters == {"started": 3, "cancelled": 1, "reused": 1, "missed": 1}
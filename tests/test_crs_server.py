@@ -0,0 +1,52 @@
+import json
+import threading
+import urllib.request
+import pytest
+import RAG_CRS
+import crs_server
+from crs_server import CRSServer, CRSRequestHandler, Session, SessionStore, handle_message
+
+def test_health_before_warmup(monkeypatch):
+    #The pipeline module is imported but its retrieval cache is only created by warmup
+    monkeypatch.setattr(RAG_CRS, "retrieval_cache", None)
+    server = CRSServer(("127.0.0.1", 0), type("Handler", (CRSRequestHandler,), {"store": SessionStore()}))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/health") as response:
+            health = json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert health["sessions"] == 0
+    assert "rag" not in health["retrieval_cache"]
+
+def failing_turn(session, user_input):
+    raise RuntimeError("the pipeline is down")
+
+def test_failed_turn_is_not_counted(monkeypatch):
+    monkeypatch.setitem(crs_server.STRATEGIES, "rag", failing_turn)
+    session = Session("rag")
+    with pytest.raises(RuntimeError):
+        handle_message(session, "A Dell laptop")
+    assert session.turns == 0
+    #The session lock is released, so the turn can be sent again
+    monkeypatch.setitem(crs_server.STRATEGIES, "rag", lambda session, user_input: "Got it!")
+    assert handle_message(session, "A Dell laptop") == "Got it!"
+    assert session.turns == 1
+
+def test_rag_session_recommends_after_the_last_turn(monkeypatch):
+    monkeypatch.setattr(RAG_CRS, "recommend_from_preferences", lambda preferences: [])
+    session = Session("rag")
+    for turn in range(crs_server.MAX_TURNS - 1):
+        handle_message(session, "I like Dell")
+        assert not session.done
+    handle_message(session, "I like Dell")
+    assert session.done and session.turns == crs_server.MAX_TURNS
+
+def test_session_count():
+    store = SessionStore()
+    session = store.create("rag")
+    store.create("combined")
+    assert len(store) == 2
+    store.delete(session.id)
+    assert len(store) == 1
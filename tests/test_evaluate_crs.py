@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from evaluate_crs import Catalog, judge, meets_label, regressions
+from fake_llm import FakeOpenAIClient
+from structured_turn import RESPONSE_FORMAT, parse_turn, turn_messages
+
+COLUMNS = "index,brand,Model,Price,Rating,processor_brand,processor_tier,num_cores,num_threads,ram_memory,primary_storage_type,primary_storage_capacity,secondary_storage_type,secondary_storage_capacity,gpu_brand,gpu_type,is_touch_screen,display_size,resolution_width,resolution_height,OS,year_of_warranty"
+ROWS = [
+    "1,dell,Dell Inspiron 3520 Laptop (12th Gen Core i5/ 16GB/ 512GB SSD/ Win11),58000,65,intel,core i5,10,12,16,SSD,512,No secondary storage,0,intel,integrated,False,15.6,1920,1080,windows,1",
+    "2,asus,Asus TUF Gaming F15 Laptop (12th Gen Core i7/ 16GB/ 1TB SSD/ Win11/ 6GB Graph),99000,70,intel,core i7,14,20,16,SSD,1024,No secondary storage,0,nvidia,dedicated,False,15.6,1920,1080,windows,1",
+    "3,hp,HP 15s Laptop (12th Gen Core i3/ 8GB/ 512GB SSD/ Win11),40000,60,intel,core i3,6,8,8,SSD,512,No secondary storage,0,intel,integrated,False,15.6,1920,1080,windows,1",
+]
+
+def write_catalog(tmp_path):
+    path = tmp_path / "laptops.csv"
+    path.write_text("\n".join([COLUMNS] + ROWS) + "\n", encoding="utf-8")
+    return Catalog(str(path))
+
+def test_judge_reads_the_specs_from_the_catalog(tmp_path):
+    catalog = write_catalog(tmp_path)
+    recommendations = [
+        #The text claims an nvidia card, the catalog row says intel
+        "**Dell Inspiron 3520 Laptop (12th Gen Core i5/ 16GB/ 512GB SSD/ Win11)** with an NVIDIA RTX GPU",
+        "Asus TUF Gaming F15 Laptop (12th Gen Core i7/ 16GB/ 1TB SSD/ Win11/ 6GB Graph) | Specifications: 16GB RAM",
+        "HP 15s Laptop (12th Gen Core i3/ 8GB/ 512GB SSD/ Win11)",
+        "Made-up Laptop (Core i9/ 64GB/ 4TB SSD)",
+    ]
+    gains = judge(recommendations, {"price": "$1500", "ram": "16GB", "gpu_brand": "nvidia"}, "Asus TUF Gaming F15", catalog)
+    assert gains.tolist() == [0.0, 2.0, 0.0, 0.0]
+    #Without any hard constraint only the laptops that are not in the catalog are not relevant
+    assert np.array_equal(judge(recommendations, {}, "", catalog), [1.0, 1.0, 1.0, 0.0])
+
+@pytest.mark.parametrize("spec, value, expected", [
+    #The Asus row costs 99000 rupees, about $1193
+    ("price", "$1200", True),
+    ("price", "$1150", False),
+    ("ram", "16GB", True),
+    ("ram", "32GB", False),
+    ("screen_size", "15.6 inch", True),
+    ("screen_size", "16 inch", True),
+    ("screen_size", "14 inch", False),
+    ("processor", "Core i7", True),
+    ("processor", "Core i5", False),
+    ("gpu_brand", "nvidia", True),
+    ("gpu_brand", "amd", False),
+])
+def test_meets_label(tmp_path, spec, value, expected):
+    row = write_catalog(tmp_path).lookup(["Asus TUF Gaming F15 Laptop (12th Gen Core i7/ 16GB/ 1TB SSD/ Win11/ 6GB Graph)"])[0]
+    assert meets_label(row, spec, value) is expected
+
+def test_meets_label_rejects_unlabelled_specs(tmp_path):
+    row = write_catalog(tmp_path).lookup(["HP 15s Laptop (12th Gen Core i3/ 8GB/ 512GB SSD/ Win11)"])[0]
+    with pytest.raises(ValueError):
+        meets_label(row, "brand", "hp")
+
+def test_fake_client_answers_the_extraction_with_the_labels():
+    turn = "I need a laptop under $750 with a 13th Gen Intel Core i5 processor, 16GB of RAM, and a 14-inch display."
+    labelled = {"price": "$750", "processor": "Core i5", "ram": "16GB", "screen_size": "14 inch"}
+    client = FakeOpenAIClient(extractions={turn: labelled})
+    response = client.chat.completions.create(model="gpt-4o", messages=turn_messages(turn, {}), response_format=RESPONSE_FORMAT)
+    assert parse_turn(response.choices[0].message.content, {})[0] == labelled
+
+def test_metrics_of_another_extraction_are_not_compared():
+    result = {"metrics": {"precision_at_k": 0.2}, "latency_ms": {"total": {"p95": 1.0}}}
+    baseline = {"extraction": "model", "pipelines": {"rag": {"metrics": {"precision_at_k": 0.9}, "latency_ms": {"total": {"p95": 1.0}}}}}
+    assert regressions({"extraction": "model", "pipelines": {"rag": result}}, baseline, 0.01, 1.25) == ["rag precision_at_k: 0.900 -> 0.200"]
+    assert regressions({"extraction": "labelled for the GPT-4o pipelines", "pipelines": {"rag": result}}, baseline, 0.01, 1.25) == []
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import llm_cache
+from fake_llm import FakeAsyncOpenAIClient, FakeOpenAIClient
+from llm_cache import LLMCache, AsyncCachedClient, CachedClient, request_key
+
+MODEL = "ft:gpt-4o-2024-08-06:personal::test"
+MESSAGES = [{"role": "system", "content": "You are a laptop recommendation assistant."}, {"role": "user", "content": "A Dell gaming laptop with 16gb of ram"}]
+
+#Clock the cache reads instead of time.time, so the tests can move time forward
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+def cached_client(cache):
+    fake = FakeOpenAIClient()
+    return CachedClient(fake, cache), fake.chat.completions
+
+def test_memory_hit():
+    client, fake = cached_client(LLMCache(None))
+    first = client.chat.completions.create(model=MODEL, messages=MESSAGES)
+    second = client.chat.completions.create(model=MODEL, messages=MESSAGES)
+    assert fake.calls == 1
+    assert second.choices[0].message.content == first.choices[0].message.content
+    assert client.cache.stats()["memory_hits"] == 1
+
+def test_sqlite_hit_after_restart(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite")
+    client, fake = cached_client(LLMCache(path))
+    first = client.chat.completions.create(model=MODEL, messages=MESSAGES)
+    assert fake.calls == 1
+    #A new cache on the same file starts with an empty memory tier, like a restarted process
+    client, fake = cached_client(LLMCache(path))
+    second = client.chat.completions.create(model=MODEL, messages=MESSAGES)
+    assert fake.calls == 0
+    assert second.choices[0].message.content == first.choices[0].message.content
+    assert client.cache.stats()["disk_hits"] == 1
+
+#Cache that records the threads its lookups and stores ran on
+class ThreadRecordingCache(LLMCache):
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.get_ident())
+        return super().get(key)
+
+    def put(self, key, value):
+        self.threads.append(threading.get_ident())
+        super().put(key, value)
+
+def test_async_lookups_run_off_the_event_loop(tmp_path):
+    cache = ThreadRecordingCache(str(tmp_path / "llm_cache.sqlite"))
+    fake = FakeAsyncOpenAIClient()
+    client = AsyncCachedClient(fake, cache)
+
+    async def run():
+        first = await client.chat.completions.create(model=MODEL, messages=MESSAGES)
+        second = await client.chat.completions.create(model=MODEL, messages=MESSAGES)
+        return first, second, threading.get_ident()
+
+    first, second, loop_thread = asyncio.run(run())
+    assert second.choices[0].message.content == first.choices[0].message.content
+    assert fake.chat.completions.calls == 1
+    assert len(cache.threads) == 3 and loop_thread not in cache.threads
+
+def test_ttl_expiry(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache, "time", clock)
+    cache = LLMCache(str(tmp_path / "llm_cache.sqlite"), ttl_seconds=60)
+    cache.put("key", "value")
+    clock.now += 30
+    assert cache.get("key") == "value"
+    clock.now += 60
+    assert cache.get("key") is None
+    #The expired response is gone from both tiers
+    cache.memory.clear()
+    assert cache.get("key") is None
+    assert cache.stats()["expired"] >= 1
+
+def test_size_eviction(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm_cache.sqlite"), max_memory_entries=2, max_disk_bytes=250)
+    for i in range(5):
+        cache.put(f"key-{i}", "x" * 100)
+    assert list(cache.memory) == ["key-3", "key-4"]
+    stored = [key for (key,) in cache.db.execute("SELECT key FROM responses ORDER BY key")]
+    assert stored == ["key-3", "key-4"]
+    #key-0 to key-2 are dropped from both tiers
+    assert cache.stats()["memory_evictions"] == 3
+    assert cache.stats()["disk_evictions"] == 3
+    cache.memory.clear()
+    assert cache.get("key-0") is None
+    assert cache.get("key-4") == "x" * 100
+
+def test_key_changes_with_sampling_parameters():
+    base = {"model": MODEL, "messages": MESSAGES}
+    assert request_key(base) == request_key(dict(reversed(list(base.items()))))
+    assert request_key({**base, "temperature": 0.2}) != request_key(base)
+    assert request_key({**base, "temperature": 0.2}) != request_key({**base, "temperature": 0.7})
+    assert request_key({**base, "top_p": 0.9}) != request_key(base)
+    assert request_key({**base, "max_tokens": 100}) != request_key(base)
+    assert request_key({**base, "model": "gpt-4o"}) != request_key(base)
+    #Arguments that do not change the completion share the entry
+    assert request_key({**base, "timeout": 30, "user": "someone"}) == request_key(base)
+
+    client, fake = cached_client(LLMCache(None))
+    client.chat.completions.create(**base, temperature=0.2)
+    client.chat.completions.create(**base, temperature=0.7)
+    client.chat.completions.create(**base, temperature=0.2)
+    assert fake.calls == 2
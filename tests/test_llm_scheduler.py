@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from llm_scheduler import BATCH, INTERACTIVE, LLMScheduler
+
+MESSAGES = [{"role": "user", "content": "A Dell gaming laptop with 16gb of ram"}]
+
+def open_scheduler(max_concurrency=1):
+    return LLMScheduler(requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9, max_concurrency=max_concurrency)
+
+def test_interactive_request_goes_before_waiting_batch_requests():
+    scheduler = open_scheduler()
+    order = []
+
+    async def create(name, **kwargs):
+        order.append(name)
+        await asyncio.sleep(0.01)
+        return None
+
+    async def run():
+        batch = [asyncio.create_task(scheduler.acall(create, {"name": f"batch-{i}", "messages": MESSAGES}, BATCH)) for i in range(4)]
+        await asyncio.sleep(0.001)
+        interactive = asyncio.create_task(scheduler.acall(create, {"name": "interactive", "messages": MESSAGES}, INTERACTIVE))
+        await asyncio.gather(*batch, interactive)
+
+    asyncio.run(run())
+    assert order == ["batch-0", "interactive", "batch-1", "batch-2", "batch-3"]
+
+def test_waiting_requests_hold_no_threads():
+    scheduler = open_scheduler()
+    threads = []
+
+    async def create(**kwargs):
+        threads.append(threading.active_count())
+        await asyncio.sleep(0)
+
+    async def run():
+        await asyncio.gather(*(scheduler.acall(create, {"messages": MESSAGES}) for _ in range(200)))
+
+    before = threading.active_count()
+    asyncio.run(run())
+    assert len(threads) == 200
+    assert max(threads) == before
+    assert scheduler.stats()["sent"] == 200
+
+def test_cancelled_request_leaves_the_queue():
+    scheduler = open_scheduler()
+
+    async def create(hold=None, **kwargs):
+        if hold is not None:
+            await hold.wait()
+        return None
+
+    async def run():
+        hold = asyncio.Event()
+        first = asyncio.create_task(scheduler.acall(create, {"hold": hold, "messages": MESSAGES}))
+        await asyncio.sleep(0.001)
+        waiting = asyncio.create_task(scheduler.acall(create, {"messages": MESSAGES}))
+        await asyncio.sleep(0.001)
+        assert scheduler.stats()["queue_depth"] == 1
+        waiting.cancel()
+        await asyncio.sleep(0.001)
+        assert scheduler.stats()["queue_depth"] == 0
+        hold.set()
+        await first
+        await asyncio.wait_for(scheduler.acall(create, {"messages": MESSAGES}), 1)
+
+    asyncio.run(run())
+    stats = scheduler.stats()
+    assert (stats["sent"], stats["in_flight"], stats["queue_depth"]) == (2, 0, 0)
+    assert scheduler.async_waiters == {}
+
+def test_thread_release_wakes_an_asyncio_request():
+    scheduler = open_scheduler()
+    started = threading.Event()
+
+    def create_in_thread(**kwargs):
+        started.set()
+        time.sleep(0.05)
+
+    async def create(**kwargs):
+        return time.perf_counter()
+
+    async def run():
+        thread = threading.Thread(target=scheduler.call, args=(create_in_thread, {"messages": MESSAGES}))
+        thread.start()
+        started.wait()
+        sent = await asyncio.wait_for(scheduler.acall(create, {"messages": MESSAGES}), 1)
+        thread.join()
+        return sent
+
+    start = time.perf_counter()
+    sent = asyncio.run(run())
+    assert 0.05 <= sent - start < 0.5
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from parallel_vectorizer import vectorize_parallel
+from record_store import StringStore
+
+TEXTS = [
+    "Dell Inspiron 3520 Laptop 12th Gen Core i5 16GB RAM full hd display",
+    "Asus TUF Gaming F15 Laptop Core i7 16GB RAM nvidia rtx 3050",
+    "HP 15s Laptop Core i3 8GB RAM thin and light for students",
+    "Lenovo IdeaPad Slim 3 Ryzen 5 8GB RAM long battery life",
+    "Acer Aspire 5 Core i5 16GB RAM backlit keyboard",
+    "MSI Thin GF63 Gaming Laptop Core i7 nvidia rtx 4050 fast display",
+    "Apple MacBook Air M2 8GB RAM retina display",
+]
+
+@pytest.mark.parametrize("vectorizer_params", [{}, {"stop_words": "english", "ngram_range": (1, 2)}, {"min_df": 2, "max_features": 10, "sublinear_tf": True}])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parallel_fit_matches_tfidf_vectorizer(vectorizer_params, workers):
+    expected = TfidfVectorizer(**vectorizer_params)
+    expected_matrix = expected.fit_transform(TEXTS)
+    vectorizer, matrix = vectorize_parallel(StringStore.from_strings(TEXTS), vectorizer_params, workers)
+    assert vectorizer.vocabulary_ == expected.vocabulary_
+    assert np.allclose(vectorizer.idf_, expected.idf_)
+    assert np.allclose(matrix.toarray(), expected_matrix.toarray())
+    #Texts the catalog updates add are transformed the same way too
+    assert np.allclose(vectorizer.transform(["gaming laptop with 16GB RAM"]).toarray(), expected.transform(["gaming laptop with 16GB RAM"]).toarray())
@@ -0,0 +1,39 @@
+import pytest
+from benchmark_preferences import legacy_extract_preferences
+from preference_extractor import extract_preferences
+
+#The behaviour changes of the compiled extractor: the input, what the original extractor gave and what it gives now
+CHANGES = [
+    #OS names fill the os slot, as in the original
+    ("I prefer macos", {"os": "Macos"}, {"os": "Macos"}),
+    ("I prefer windows", {}, {"os": "Windows"}),
+    #"displays" opens the screen slot, the hyphen of "14.5-inch" is dropped
+    ("I want dual OLED displays, and a compact 14.5-inch design", {"screen_size": "14.5-"}, {"screen_size": "14.5"}),
+    ("A 15.6-inch display", {"screen_size": "15.6-"}, {"screen_size": "15.6"}),
+    ("A display of 10 inches", {"screen_size": "es"}, {"screen_size": "10"}),
+    #Trailing punctuation is not part of the budget
+    ("My budget is $450, thanks", {"price": "$450,"}, {"price": "$450"}),
+    ("Budget around $2,300.", {"price": "$2,300."}, {"price": "$2,300"}),
+    #"os", "use" and the other keywords only match whole words
+    ("I edit videos", {"os": None}, {}),
+    ("It should not cost too much", {"os": None}, {}),
+    ("I am focused on coding", {"purpose": None}, {}),
+    ("It is useful", {"purpose": None}, {}),
+    ("For everyday usage", {}, {"purpose": "General Use"}),
+    #The possessive of a brand names the brand
+    ("I like Apple's laptops", {"brand": None}, {"brand": "Apple"}),
+    ("Something with Apple’s chips", {"brand": None}, {"brand": "Apple"}),
+    #A GB amount goes to RAM or storage by the word next to it
+    ("8GB of RAM and plenty of storage", {"ram": "8gb", "storage_capacity": "8gb"}, {"ram": "8gb", "storage_capacity": None}),
+    ("I need 8gb of ram and 256gb storage", {"ram": "8gb", "storage_capacity": "8gb"}, {"ram": "8gb", "storage_capacity": "256gb"}),
+    ("I want 16 gb ram", {"ram": "gb"}, {"ram": "16gb"}),
+    ("It should last 10 hours of battery", {"battery_life": "hours"}, {"battery_life": "10 hours"}),
+]
+
+@pytest.mark.parametrize("user_input, before, after", CHANGES)
+def test_behaviour_changes(user_input, before, after):
+    assert legacy_extract_preferences(user_input, {}) == before
+    assert extract_preferences(user_input, {}) == after
+
+def test_existing_preferences_are_kept():
+    assert extract_preferences("I use it for gaming", {"ram": "16gb"}) == {"ram": "16gb", "purpose": "Gaming"}
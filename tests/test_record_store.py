@@ -0,0 +1,32 @@
+import pytest
+from record_store import is_valid_record, split_list, split_record
+
+@pytest.mark.parametrize("text, expected", [
+    ("['Full HD display', 'Backlit keyboard']", ["Full HD display", "Backlit keyboard"]),
+    ("['Full HD display']", ["Full HD display"]),
+    ("[]", []),
+    ("['']", []),
+    ("0", []),
+    ("nan", []),
+    ("", []),
+])
+def test_split_list(text, expected):
+    assert split_list(text) == expected
+
+@pytest.mark.parametrize("text, expected", [
+    ("HP 15s Laptop ['Thin and light', 'Long battery'] ['intel core i3']", ("HP 15s Laptop", ["Thin and light", "Long battery"], ["intel core i3"])),
+    ("HP 15s Laptop [] ['intel core i3', '8GB RAM']", ("HP 15s Laptop", [], ["intel core i3", "8GB RAM"])),
+    ("HP 15s Laptop ['Thin and light'] []", ("HP 15s Laptop", ["Thin and light"], [])),
+    ("HP 15s Laptop [] []", ("HP 15s Laptop", [], [])),
+    ("HP 15s Laptop", ("HP 15s Laptop", [], [])),
+    #The placeholder rows of the catalog
+    ("0 [] []", ("0", [], [])),
+])
+def test_split_record(text, expected):
+    assert split_record(text) == expected
+
+def test_placeholder_records_are_not_valid():
+    assert not is_valid_record(*split_record("0 [] []"))
+    assert not is_valid_record(*split_record("HP 15s Laptop [] []"))
+    assert not is_valid_record("", ["Thin and light"], [])
+    assert is_valid_record(*split_record("HP 15s Laptop [] ['intel core i3']"))
@@ -0,0 +1,77 @@
+import pytest
+from retrieval_cache import RetrievalCache, canonical_preferences
+from spec_index import SpecIndex, parse_number
+
+#Retriever over a few laptops with known prices, it records the preferences every search was filtered with
+class PricedRetriever:
+    def __init__(self, prices):
+        self.records = [f"laptop-{i}" for i in range(len(prices))]
+        self.specs = SpecIndex.from_columns({"price": prices, "ram_memory": [16.0] * len(prices), "primary_storage_capacity": [512.0] * len(prices),
+                                             "display_size": [15.6] * len(prices)}, {})
+        self.catalog = None
+        self.filters = []
+
+    def search_ids(self, queries, k, candidate_ids=None):
+        ids = list(range(len(self.records))) if candidate_ids is None else list(candidate_ids)
+        return [[(int(i), 0.0) for i in ids[:k]] for _ in queries]
+
+    def candidate_ids(self, preferences):
+        self.filters.append(preferences)
+        return self.specs.candidate_ids(preferences)
+
+@pytest.mark.parametrize("budget", ["$950", "$1000", "1,049.99", "$99", "$50", "750 dollars", "$2,501"])
+def test_canonical_budget_never_relaxes_the_filter(budget):
+    assert parse_number(canonical_preferences({"budget": budget})["price"]) <= parse_number(budget)
+
+def test_cached_laptops_stay_within_the_budget():
+    retriever = PricedRetriever([900.0, 950.0, 1000.0, 1100.0])
+    cache = RetrievalCache(retriever)
+    for budget in ["$950", "$1000", "$980"]:
+        for record, _ in cache.retrieve({"price": budget}, 4, lambda preferences: "laptop", retriever.candidate_ids):
+            assert retriever.specs.numeric["price"][retriever.records.index(record)] <= parse_number(budget)
+        for results in cache.retrieve_batch([{"price": budget}], 4, lambda preferences: "laptop", retriever.candidate_ids):
+            for record, _ in results:
+                assert retriever.specs.numeric["price"][retriever.records.index(record)] <= parse_number(budget)
+    assert all(parse_number(preferences["price"]) <= 1000 for preferences in retriever.filters)
+
+def test_canonical_preferences_map_aliases_units_and_key_order():
+    canonical = canonical_preferences({"GPU": " NVIDIA ", "Budget": "$1,049", "ram": "16 GB", "Screen Size": "15.60 inches", "brand": None, "os": ""})
+    assert canonical == {"gpu_brand": "nvidia", "price": "$1000", "ram": "16gb", "screen_size": "15.6 inch"}
+    assert list(canonical) == sorted(canonical)
+    assert canonical_preferences({"ram": "16gb", "graphics": "nvidia", "price": "$1000"}) == canonical_preferences({"gpu_brand": "Nvidia", "budget": "1000 dollars", "ram": "16 GB"})
+    #The first value wins when a spec is given under two of its names
+    assert canonical_preferences({"gpu": "amd", "gpu_brand": "nvidia"}) == {"gpu_brand": "amd"}
+
+def test_equivalent_preferences_share_one_entry():
+    retriever = PricedRetriever([900.0, 950.0, 1000.0, 1100.0])
+    cache = RetrievalCache(retriever)
+    make_query = lambda preferences: "laptop"
+    first = cache.retrieve({"budget": "$1050", "RAM": "16 GB"}, 2, make_query, retriever.candidate_ids)
+    second = cache.retrieve({"ram": "16gb", "price": "1000"}, 2, make_query, retriever.candidate_ids)
+    assert first == second
+    assert len(retriever.filters) == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["entries"] == 1
+
+def test_least_recently_used_entry_is_evicted():
+    cache = RetrievalCache(PricedRetriever([900.0]), max_entries=2)
+    cache.put("a", [(0, 1.0)])
+    cache.put("b", [(0, 1.0)])
+    assert cache.get("a") == [(0, 1.0)]
+    cache.put("c", [(0, 1.0)])
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+def test_cache_is_cleared_when_the_catalog_version_changes():
+    retriever = PricedRetriever([900.0, 950.0])
+    retriever.catalog = type("Catalog", (), {"version": 1})()
+    cache = RetrievalCache(retriever)
+    cache.put("a", [(0, 1.0)])
+    assert cache.get("a") == [(0, 1.0)]
+    retriever.catalog.version = 2
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0 and cache.stats()["invalidations"] == 1
+    #A search that ran while the catalog changed is not stored
+    retriever.catalog.version = 3
+    cache.put("a", [(0, 1.0)])
+    assert "a" not in cache.entries
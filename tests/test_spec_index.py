@@ -0,0 +1,28 @@
+import numpy as np
+from spec_index import INR_PER_USD, SpecIndex
+
+PRICES = {"dell inspiron 3520 laptop (11th gen core i3/ 8gb/ 512gb ssd/ win11": 400.0}
+TEXTS = [
+    "Dell Inspiron 3520 Laptop (11th Gen Core i3/ 8GB/ 512GB SSD/ Win11) v1 ['Full HD display'] ['intel core i3']",
+    "Asus ROG Strix G16 Gaming Laptop (13th Gen Core i9/ 32GB/ 1TB SSD/ Win11) ['Price: $2,499.99'] []",
+    "HP 15s Laptop (12th Gen Core i5/ 16GB/ 512GB SSD/ Win11) ['Now at ₹58,100'] []",
+    "Lenovo IdeaPad Slim 3 Laptop (AMD Ryzen 5/ 8GB/ 512GB SSD/ Win11) [] []",
+]
+
+def test_prices_are_read_from_the_text_or_the_price_table():
+    prices = np.asarray(SpecIndex.from_texts(TEXTS, PRICES).numeric["price"])
+    assert prices[0] == 400.0
+    assert np.isclose(prices[1], 2499.99)
+    assert np.isclose(prices[2], 58100 / INR_PER_USD, rtol=1e-5)
+    assert np.isnan(prices[3])
+
+def test_budget_shrinks_the_candidate_set():
+    specs = SpecIndex.from_texts(TEXTS, PRICES)
+    assert specs.candidate_ids({"price": "$1000"}).tolist() == [0, 2, 3]
+    assert specs.candidate_ids({"budget": "$500"}).tolist() == [0, 3]
+    assert specs.candidate_ids({"price": "$5000"}).tolist() == [0, 1, 2, 3]
+
+def test_extended_rows_get_their_price():
+    specs = SpecIndex.from_texts(TEXTS[:1], PRICES)
+    specs.extend(TEXTS[1:2], PRICES)
+    assert specs.candidate_ids({"price": "$1000"}).tolist() == [0]
@@ -0,0 +1,44 @@
+import json
+import crs_server
+from fake_llm import FakeOpenAIClient
+from structured_turn import KEY_SPECS, RESPONSE_FORMAT, parse_turn, turn_messages
+
+def turn(question, asked_spec, **preferences):
+    return json.dumps({"preferences": {spec: preferences.get(spec) for spec in KEY_SPECS}, "next_question": question, "asked_spec": asked_spec})
+
+def test_parse_turn_gives_back_the_asked_spec():
+    preferences, question, asked_spec = parse_turn(turn("What is your budget?", "price", brand="Dell"), {"ram": "16GB"})
+    assert preferences == {"ram": "16GB", "brand": "Dell"}
+    assert (question, asked_spec) == ("What is your budget?", "price")
+
+def test_parse_turn_drops_a_question_without_its_spec():
+    assert parse_turn(turn("What is your budget?", None, brand="Dell"), {})[1:] == (None, None)
+    assert parse_turn(turn("What is your budget?", "budget", brand="Dell"), {}) == ({}, None, None)
+
+def test_parse_turn_drops_a_question_about_a_known_or_asked_spec():
+    #The budget is given in this very turn, or was said in an earlier one
+    assert parse_turn(turn("What is your budget?", "price", price="$900"), {})[1:] == (None, None)
+    assert parse_turn(turn("What is your budget?", "price"), {"price": "$900"}) == ({"price": "$900"}, None, None)
+    assert parse_turn(turn("What is your budget?", "price"), {}, {"price"}) == ({}, None, None)
+    assert parse_turn(turn("How much RAM?", "ram"), {}, {"price"})[1:] == ("How much RAM?", "ram")
+
+def test_fake_structured_reply_names_the_asked_spec():
+    client = FakeOpenAIClient()
+    response = client.chat.completions.create(model="gpt-4o", messages=turn_messages("A Dell laptop with 16gb of ram", {}, {"processor"}), response_format=RESPONSE_FORMAT)
+    preferences, question, asked_spec = parse_turn(response.choices[0].message.content, {})
+    assert asked_spec == "gpu_brand"
+    assert "gpu brand" in question
+    assert "processor" not in question
+
+#Module whose structured turn asks about another spec than the first missing one
+class PriceQuestionModule:
+    STRUCTURED_TURNS = True
+
+    @staticmethod
+    def extract_specs_and_question(user_input, preferences, already_asked):
+        return {"ram": "16GB"}, "What is your budget?", "price"
+
+def test_server_turn_marks_the_spec_of_the_structured_question():
+    session = crs_server.Session("combined")
+    spec, question = crs_server.gpt_turn(PriceQuestionModule, session, "16gb of ram", set())
+    assert (spec, question) == ("price", "What is your budget?")